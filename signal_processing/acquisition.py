@@ -0,0 +1,438 @@
+""" Continuously acquires and processes pings so that sonar I/O and signal processing overlap.
+
+In the default (request driven) mode, each 2D image requests sonar data from the
+microcontroller, waits for the whole serial transfer, and only then processes the data, so
+the microcontroller is idle while the data is processed and vice versa. In continuous mode,
+an acquisition thread instead requests pings from the microcontroller back to back, and
+places each ping into a bounded ring buffer. A processing thread takes pings from the
+buffer, beamforms them, and keeps the most recent image, which can then be rendered at any
+time.
+
+If the processing thread falls behind, the buffer fills up and the oldest ping is dropped
+to make room for the newest, so the images never lag more than PING_QUEUE_DEPTH pings
+behind the scene. The depth of the buffer, the number of pings dropped, and the rate at
+which pings are acquired and images are produced (frames per second) are reported by
+acquisition_stats.
+
+Pings can also be acquired from another source of sonar data in place of the
+microcontroller, e.g. replayed from a capture archive (see capture_archive.ReplaySource).
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	sonar_processing, teensy_interface
+
+This file can also be imported as a module and contains the following functions:
+
+	* start_acquisition - starts continuous acquisition and processing of pings
+	* stop_acquisition - stops continuous acquisition and processing of pings
+	* latest_frame - returns the most recent image and its processing context
+	* acquisition_stats - returns the queue depth, dropped pings, and frames per second
+
+ """
+
+
+# ===================================== IMPORTS ======================================== #
+
+import time
+import threading
+import collections
+import sonar_processing as sp
+from teensy_interface import TeensyError
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# maximum number of pings waiting to be processed - once full, the oldest ping is dropped
+global PING_QUEUE_DEPTH; PING_QUEUE_DEPTH = 4
+
+# number of most recent pings (or images) used to calculate frames per second
+global FPS_WINDOW; FPS_WINDOW = 20
+
+# seconds between simulated pings. A simulated ping is generated by the processing thread
+# (see sp.simulate_2D_range_profiles), so this stands in for the serial transfer time.
+global SIMULATED_PING_INTERVAL; SIMULATED_PING_INTERVAL = 0.1
+
+# seconds to wait before requesting another ping after an error from the microcontroller
+global RETRY_INTERVAL; RETRY_INTERVAL = 1.0
+
+# seconds that the processing thread waits for a ping before checking if it should stop
+global POLL_INTERVAL; POLL_INTERVAL = 0.1
+
+# the continuous acquisition that is currently running (or None) - see start_acquisition
+global acquisition; acquisition = None
+global acquisition_lock; acquisition_lock = threading.Lock()
+
+
+# ================================= CLASS DEFINITIONS ================================== #
+
+
+class PingBuffer:
+	"""Bounded ring buffer of pings, shared by the acquisition and processing threads.
+
+	When the buffer is full, adding a ping drops the oldest ping in the buffer.
+
+	Attributes
+	----------
+	capacity : int
+		maximum number of pings in the buffer
+	dropped : int
+		number of pings dropped since the buffer was created
+	"""
+	def __init__(self, capacity):
+		"""
+		Parameters
+		----------
+		capacity : int
+			maximum number of pings in the buffer
+		"""
+
+		if(capacity < 1):
+			raise ValueError("Ping buffer capacity must be at least 1")
+
+		self.capacity = capacity
+		self.dropped = 0
+		self.pings = collections.deque(maxlen=capacity)
+		self.condition = threading.Condition()
+
+
+	def __len__(self):
+		""" returns the number of pings in the buffer """
+
+		with self.condition:
+			return len(self.pings)
+
+
+	def put(self, ping):
+		""" Adds a ping to the buffer, dropping the oldest ping if the buffer is full """
+
+		with self.condition:
+			if(len(self.pings) == self.capacity):
+				self.dropped += 1
+
+			self.pings.append(ping)
+			self.condition.notify()
+
+
+	def get(self, timeout=None):
+		""" Removes and returns the oldest ping in the buffer, waiting at most timeout
+		seconds for a ping to arrive. Returns None if no ping arrives in time. """
+
+		with self.condition:
+			if(not self.condition.wait_for(lambda: len(self.pings) > 0, timeout)):
+				return None
+
+			return self.pings.popleft()
+
+
+
+class ContinuousAcquisition:
+	"""Acquisition and processing threads of continuous mode, and their statistics.
+
+	Each ping is placed into the buffer as (time acquired, sonar data). For simulated
+	pings the sonar data is None.
+
+	Attributes
+	----------
+	ctx : sp.ProcessingContext
+		parameters used for processing
+	sim_mode : bool
+		if true, simulated pings are used, else pings are requested from the
+		microcontroller
+	integrator : integration.PingIntegrator or None
+		if not None, consecutive pings are integrated
+	source : object or None
+		if not None, pings are requested from this source of sonar data in place of the
+		microcontroller (see sp.request_sonar_data)
+	buffer : PingBuffer
+		pings waiting to be processed
+	"""
+	def __init__(self, ctx, sim_mode, queue_depth, integrator=None, source=None):
+		"""
+		Parameters
+		----------
+		ctx : sp.ProcessingContext
+			parameters used for processing
+		sim_mode : bool
+			if true, simulated pings are used
+		queue_depth : int
+			maximum number of pings waiting to be processed
+		integrator : integration.PingIntegrator, optional
+			if given, consecutive pings are integrated
+		source : optional
+			if given, pings are requested from this source of sonar data (e.g.
+			capture_archive.ReplaySource)
+		"""
+
+		self.ctx = ctx
+		self.sim_mode = sim_mode
+		self.integrator = integrator
+		self.source = source
+		self.buffer = PingBuffer(queue_depth)
+		self.stop_event = threading.Event()
+
+		# times at which the most recent pings were acquired and images were produced
+		self.acquired = collections.deque(maxlen=FPS_WINDOW)
+		self.processed = collections.deque(maxlen=FPS_WINDOW)
+		self.num_acquired = 0
+		self.num_processed = 0
+
+		# (image, processing context, time acquired) of the most recent image
+		self.frame = None
+		self.error = None
+		self.lock = threading.Lock()
+
+		self.threads = [threading.Thread(target=self.acquire, name="sonar-acquisition", daemon=True),
+						threading.Thread(target=self.process, name="sonar-processing", daemon=True)]
+
+
+	def start(self):
+		""" starts the acquisition and processing threads """
+
+		for thread in self.threads:
+			thread.start()
+
+
+	def stop(self):
+		""" stops the acquisition and processing threads, and waits for them to finish """
+
+		self.stop_event.set()
+
+		for thread in self.threads:
+			thread.join()
+
+
+	def acquire(self):
+		""" requests pings back to back and places them into the buffer until stopped """
+
+		while(not self.stop_event.is_set()):
+			try:
+				if(self.sim_mode):
+					self.stop_event.wait(SIMULATED_PING_INTERVAL)
+					sonar_data = None
+				else:
+					sonar_data = sp.request_sonar_data(self.source, short_timeout=False)
+
+			except TeensyError as e:
+				# an error will be raised if there is a problem with the micro - try again
+				# after a while, rather than flooding the serial port
+				with self.lock:
+					self.error = str(e)
+
+				self.stop_event.wait(RETRY_INTERVAL)
+				continue
+
+			except Exception as e:
+				# any other error (e.g. the serial port disappearing) must not stop the
+				# thread while stats still reports it as running - record it and retry
+				with self.lock:
+					self.error = "{}: {}".format(type(e).__name__, e)
+
+				self.stop_event.wait(RETRY_INTERVAL)
+				continue
+
+			acquired_time = time.perf_counter()
+			self.buffer.put((acquired_time, sonar_data))
+
+			with self.lock:
+				self.acquired.append(acquired_time)
+				self.num_acquired += 1
+
+
+	def process(self):
+		""" takes pings from the buffer and beamforms them until stopped """
+
+		while(not self.stop_event.is_set()):
+			ping = self.buffer.get(timeout=POLL_INTERVAL)
+
+			if(ping is None):
+				continue
+
+			acquired_time, sonar_data = ping
+
+			try:
+				if(sonar_data is None):
+					range_profiles, ctx = sp.simulate_2D_range_profiles(self.ctx), self.ctx
+				else:
+					range_profiles, ctx = sp.sonar_data_range_profiles(sonar_data, self.ctx)
+
+				z = sp.integrated_coherent_summing(range_profiles, self.integrator, ctx)
+
+			except (TeensyError, ValueError, KeyError) as e:
+				# the ping could not be processed (e.g. the sonar data is incomplete) -
+				# skip it and keep the previous image
+				with self.lock:
+					self.error = str(e)
+				continue
+
+			except Exception as e:
+				# any other error (e.g. a bug in a processing step) must not stop the
+				# thread while stats still reports it as running - record it, including
+				# its type as it is unexpected, and move on to the next ping
+				with self.lock:
+					self.error = "{}: {}".format(type(e).__name__, e)
+				continue
+
+			with self.lock:
+				self.frame = (z, ctx, acquired_time)
+				self.processed.append(time.perf_counter())
+				self.num_processed += 1
+				self.error = None
+
+
+	def stats(self):
+		""" returns the statistics of the acquisition as a dictionary - see
+		acquisition_stats """
+
+		def fps(times):
+			if(len(times) < 2 or times[-1] == times[0]):
+				return 0.0
+			return (len(times) - 1) / (times[-1] - times[0])
+
+		with self.lock:
+			return {"running"         : not self.stop_event.is_set(),
+					"sim_mode"        : self.sim_mode,
+					"queue_depth"     : len(self.buffer),
+					"queue_capacity"  : self.buffer.capacity,
+					"pings_acquired"  : self.num_acquired,
+					"pings_dropped"   : self.buffer.dropped,
+					"frames_processed": self.num_processed,
+					"acquisition_fps" : round(fps(self.acquired), 2),
+					"processing_fps"  : round(fps(self.processed), 2),
+					"error"           : self.error}
+
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+def start_acquisition(ctx=None, sim_mode=False, queue_depth=None, integrator=None, source=None):
+	"""Starts continuous acquisition and processing of pings.
+
+	If continuous acquisition is already running, it is stopped first, so that the new
+	context and mode are used.
+
+	Parameters
+	----------
+	ctx : sp.ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	sim_mode : bool, optional
+		if true, simulated pings are used, else pings are requested from the
+		microcontroller
+	queue_depth : int, optional
+		maximum number of pings waiting to be processed. Defaults to PING_QUEUE_DEPTH.
+	integrator : integration.PingIntegrator, optional
+		if given, each image integrates the pings processed before it (see
+		integration.get_integrator)
+	source : optional
+		if given (and sim_mode is false), pings are requested from this source of sonar
+		data in place of the microcontroller, e.g. to replay pings from a capture archive
+		(see capture_archive.ReplaySource)
+
+	Returns
+	-------
+	dict
+		the statistics of the new acquisition - see acquisition_stats
+
+	Raises
+	------
+	ValueError
+		If queue_depth is less than 1
+	"""
+
+	global acquisition
+
+	if(ctx is None):
+		ctx = sp.global_context()
+
+	if(queue_depth is None):
+		queue_depth = PING_QUEUE_DEPTH
+
+	new_acquisition = ContinuousAcquisition(ctx, sim_mode, queue_depth, integrator, source)
+
+	with acquisition_lock:
+		if(acquisition is not None):
+			acquisition.stop()
+
+		acquisition = new_acquisition
+		acquisition.start()
+
+	return new_acquisition.stats()
+
+
+def stop_acquisition():
+	"""Stops continuous acquisition and processing of pings, if running.
+
+	Returns
+	-------
+	dict
+		the final statistics of the acquisition - see acquisition_stats
+	"""
+
+	global acquisition
+
+	with acquisition_lock:
+		if(acquisition is None):
+			return acquisition_stats()
+
+		acquisition.stop()
+		stats = acquisition.stats()
+		acquisition = None
+
+	return stats
+
+
+def latest_frame():
+	"""Returns the most recent image produced by continuous acquisition.
+
+	Returns
+	-------
+	tuple
+		(z, ctx, age) where z is the 2D sonar image array (see sp.coherent_summing), ctx is
+		the processing context it was produced with (which is needed to plot it), and age
+		is the number of seconds since its ping was acquired. None if continuous
+		acquisition is not running, or no image has been produced yet.
+	"""
+
+	current = acquisition
+
+	if(current is None):
+		return None
+
+	with current.lock:
+		if(current.frame is None):
+			return None
+
+		z, ctx, acquired_time = current.frame
+
+	return z, ctx, time.perf_counter() - acquired_time
+
+
+def acquisition_stats():
+	"""Returns the statistics of continuous acquisition as a dictionary.
+
+	The dictionary will look as follows:
+
+		{"running"          : True,
+		 "sim_mode"         : False,
+		 "queue_depth"      : 1,		# pings waiting to be processed
+		 "queue_capacity"   : 4,
+		 "pings_acquired"   : 120,
+		 "pings_dropped"    : 3,		# oldest pings dropped as the queue was full
+		 "frames_processed" : 116,
+		 "acquisition_fps"  : 2.41,		# over the last FPS_WINDOW pings
+		 "processing_fps"   : 2.39,		# over the last FPS_WINDOW images
+		 "error"            : None}		# most recent error, if not yet recovered
+
+	If continuous acquisition is not running, only {"running": False} is returned.
+	"""
+
+	current = acquisition
+
+	if(current is None):
+		return {"running": False}
+
+	return current.stats()
+
+
+
+# ====================================== END =========================================== #
@@ -0,0 +1,1202 @@
+""" Benchmarks the signal processing steps used for sonar imaging.
+
+This script times the most expensive signal processing steps in sonar_processing and
+prints the results to the console. Where a faster implementation of a step has replaced a
+slower one, the output of the two implementations is also compared to confirm that they
+produce the same result. Where the two implementations must match to within rounding 
+error, the comparison is asserted, so that the script fails if they stop matching. The
+same comparisons are made without any timing by test_equivalence.py, which is collected
+by pytest.
+
+This script was designed be called from inside the signal_processing/ directory by
+running 'python3 benchmark.py'. Simulated data is used throughout, so no microcontroller
+needs to be connected.
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	numpy, serial, sonar_processing, numba_kernels, acquisition, integration, 
+	rx_recorder, capture_archive, teensy_interface, teensy_emulator
+
+This file can also be imported to provide the following functions
+
+	* coherent_summing_loop
+	* calc_dist_polar
+	* simulate_delays
+	* simulate_range_profiles
+	* recorded_samples
+	* parse_sonar_text_loop
+	* time_function
+	* benchmark_coherent_summing
+	* benchmark_geometry_cache
+	* benchmark_fused_processing
+	* benchmark_concurrent_processing
+	* benchmark_decimation
+	* benchmark_upsampling
+	* benchmark_far_field
+	* benchmark_tiled_beamforming
+	* benchmark_numba_backend
+	* benchmark_region_of_interest
+	* benchmark_progressive_imaging
+	* benchmark_continuous_acquisition
+	* benchmark_integration
+	* benchmark_debug_capture
+	* benchmark_rx_recording
+	* benchmark_capture_archive
+	* benchmark_teensy_emulator
+	* benchmark_binary_transfer
+	* benchmark_serial_reads
+	* benchmark_serial_connection
+	* benchmark_ascii_parser
+
+"""
+
+# ===================================== IMPORTS ======================================== #
+
+import os
+import math
+import time
+import tempfile
+import concurrent.futures
+import serial
+import numpy as np
+import sonar_processing as sp
+import numba_kernels
+import acquisition
+import integration
+import rx_recorder
+import capture_archive
+import teensy_interface
+import teensy_emulator
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# number of times each function is timed - the fastest run is reported
+global REPEATS; REPEATS = 3
+
+# largest difference, relative to the peak of the reference output, allowed between two 
+# implementations that should only differ by rounding error
+global EQUIVALENCE_TOLERANCE; EQUIVALENCE_TOLERANCE = 1e-9
+
+# number of range bins and azimuth angles in each of the image grids that are benchmarked
+global GRID_SIZES; GRID_SIZES = [150, 300, 600]
+
+# the loop implementation of coherent summing is very slow, so only benchmark it for grids
+# up to this size
+global LOOP_MAX_GRID_SIZE; LOOP_MAX_GRID_SIZE = 300
+
+# number of pings, and number of threads used to process them, when benchmarking 
+# concurrent processing
+global NUM_PINGS; NUM_PINGS = 16
+global NUM_THREADS; NUM_THREADS = 4
+
+# decimation factors benchmarked after basebanding
+global DECIMATION_FACTORS; DECIMATION_FACTORS = [1, 5, 10, 20, 40]
+
+# upsampling factors benchmarked, the decimation factors they are combined with, and the
+# upsampling factor of the reference image the others are compared with
+global UPSAMPLE_FACTORS; UPSAMPLE_FACTORS = [1, 2, 4, 8, 16]
+global UPSAMPLE_DECIMATION_FACTORS; UPSAMPLE_DECIMATION_FACTORS = [1, 10]
+global UPSAMPLE_REFERENCE_FACTOR; UPSAMPLE_REFERENCE_FACTOR = 64
+
+# number of range bins and azimuth angles in each of the image grids that far-field 
+# beamforming is benchmarked for
+global FAR_FIELD_GRID_SIZES; FAR_FIELD_GRID_SIZES = [150, 600, 1000]
+
+# number of range bins and azimuth angles in each of the image grids that tiled 
+# beamforming is benchmarked for, and the numbers of worker processes used
+global TILED_GRID_SIZES; TILED_GRID_SIZES = [600, 1000]
+global TILED_WORKERS; TILED_WORKERS = [1, 2, 4]
+
+# regions of interest (min_range, max_range, min_angle, max_angle) in meters and degrees,
+# and the grid densities they are benchmarked at
+global REGIONS_OF_INTEREST; REGIONS_OF_INTEREST = [(2, 4, -10, 10), (4, 9, -20, 20)]
+global REGION_DENSITIES; REGION_DENSITIES = [1, 2, 4]
+
+# grid densities of the full field of view that progressive imaging is benchmarked at
+global PROGRESSIVE_DENSITIES; PROGRESSIVE_DENSITIES = [1, 4]
+
+# seconds that continuous acquisition is run for when it is benchmarked
+global CONTINUOUS_DURATION; CONTINUOUS_DURATION = 3
+
+# sliding window lengths that ping integration is benchmarked for, and the number of 
+# pings integrated for each
+global INTEGRATION_WINDOWS; INTEGRATION_WINDOWS = [1, 16, 256]
+global INTEGRATION_PINGS; INTEGRATION_PINGS = 32
+
+# number of pings recorded when recording of the receive signal is benchmarked
+global RECORDING_PINGS; RECORDING_PINGS = 16
+
+# number of pings written to the capture archive that is benchmarked, the number of pings
+# loaded at once when loading a range of pings, and the maximum ADC code of the pings
+global ARCHIVE_PINGS; ARCHIVE_PINGS = 256
+global ARCHIVE_RANGE; ARCHIVE_RANGE = 32
+global ARCHIVE_MAX_ADC_CODE; ARCHIVE_MAX_ADC_CODE = 4096
+
+# number of clients making requests at the same time when the serial connection is
+# benchmarked
+global CONNECTION_CLIENTS; CONNECTION_CLIENTS = 8
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+def coherent_summing_loop(range_profiles):
+	"""Constructs a 2D image by looping over every grid position and receiver in Python.
+
+	This is the original implementation of sonar_processing.coherent_summing, and is kept
+	as a reference to compare both the speed and output of the vectorised implementation
+	against.
+
+	Parameters
+	----------
+	range_profiles: numpy.ndarray
+		2D array containing processed range profile from each reciever.
+
+	Returns
+	-------
+	numpy.ndarray
+		2D sonar image array z, accessed as z[angle][magnitude]
+	"""
+
+	z = np.zeros((len(sp.azm),len(sp.rad)), dtype=complex)
+
+	appature_window = [0.5, 0.8,0.95,1,1,0.95,0.8, 0.5]
+
+	for i in range(0, len(sp.rad)): # for every range bin
+		for j in range(0, len(sp.azm)): # for every azimuth angle
+
+			focus_point = (sp.rad[i],sp.azm[j])
+
+			for n in range(0, len(sp.reciever_coords)): # for every receiver
+
+				two_way_dist = calc_dist_polar(sp.transmit_coord, focus_point) + calc_dist_polar(focus_point, sp.reciever_coords[n])
+				two_way_td = two_way_dist / sp.c
+				index = int(round(two_way_td / sp.Δt))
+				value = range_profiles[n][index] * np.exp(2*1j*np.pi*sp.fc*(two_way_td)) * appature_window[n]
+
+				z[j][i] = z[j][i] + value
+
+	z = z**0.5
+
+	return z
+
+
+def calc_dist_polar(c1, c2):
+	"""Calculates distance between two scalar points given in polar coordinates (r,theta).
+	
+	This is the scalar version of sonar_processing.calc_dist_polar used by the original
+	loop implementation of coherent summing.
+	"""
+	
+	return math.sqrt(c1[0]**2 + c2[0]**2 - 2*c1[0]*c2[0]*np.cos(c1[1] -  c2[1]))
+
+
+def simulate_delays():
+	"""Returns the two-way delay to each target in the simulated scene for each receiver.
+
+	Returns
+	-------
+	list
+		2D array containing the time delay to each target (columns) for each receiver
+		(rows)
+	"""
+
+	two_way_delays = []
+
+	for reciever in sp.reciever_coords:
+		two_way_delay_to_targets = []
+		for target in sp.target_coords:
+			two_way_dist = sp.calc_dist_polar(sp.transmit_coord, target) + sp.calc_dist_polar(target, reciever)
+			two_way_delay_to_targets.append(two_way_dist/sp.c)
+
+		two_way_delays.append(two_way_delay_to_targets)
+
+	return two_way_delays
+
+
+def simulate_range_profiles():
+	"""Produces a range profile for each receiver using simulated data.
+
+	Returns
+	-------
+	numpy.ndarray
+		2D array containing processed range profile from each reciever
+	"""
+
+	return sp.produce_range_profiles_batch_sim(simulate_delays())
+
+
+def recorded_samples():
+	"""Returns samples for each receiver based on the recorded receive signal.
+
+	The recorded receive signal (RX_LOAD_FILEPATH) is used as the signal captured by each
+	receiver, with a small amount of noise added so that each receiver differs. The
+	sample rate in sonar_processing is changed to match the number of recorded samples.
+
+	Returns
+	-------
+	numpy.ndarray
+		2D array containing the samples for each receiver
+	"""
+
+	recorded = np.loadtxt(sp.RX_LOAD_FILEPATH)
+	sp.change_sample_rate(sp.fs, len(recorded))
+
+	rng = np.random.RandomState(0)
+	return np.asarray([recorded + rng.normal(scale=0.01, size=len(recorded)) for reciever in sp.reciever_coords])
+
+
+def parse_sonar_text_loop(payload):
+	"""Parses sonar data in the ASCII format by looping over every line in Python.
+
+	This is the original implementation of teensy_interface.parse_sonar_text, and is kept 
+	as a reference to compare both the speed and output of the vectorised implementation
+	against.
+
+	Parameters
+	----------
+	payload : bytes
+		the bytes received from the Teensy
+
+	Returns
+	-------
+	dict
+		the sample rate, maximum adc code, and the recieve signal of each receiver (as a 
+		list of voltages)
+	"""
+
+	dict = {}
+
+	samples = payload.decode('ascii').split("\n") # new line means new value
+
+	dict["sample_rate"] = float(samples[1].replace("\r",""))
+
+	max_adc_code = float(samples[3].replace("\r",""))
+	dict["max_adc_code"] = max_adc_code
+
+	current_buffer = ""
+	counter = 5 # start iterations after 'start_buffer_transfer' at index 5
+
+	while(True):
+
+		# indicates end of sonar data
+		if("end_buffer_transfer" in samples[counter]):
+			break
+
+		# indicates start of new buffer/channel 
+		elif("buffer" in samples[counter]):
+			current_buffer = samples[counter].replace("\r","") # remove \r
+			dict[current_buffer] = []
+
+		else:
+			adc_code = int(samples[counter].replace("\r","")) # remove \r
+
+			# convert adc code into voltage - assumes teensy has 3.3V reference
+			voltage = adc_code * teensy_interface.ADC_REFERENCE_VOLTAGE / (max_adc_code - 1)
+			dict[current_buffer].append(voltage) 
+
+		counter=counter+1
+
+	return dict
+
+
+def time_function(func, *args):
+	"""Times a function call and returns the fastest runtime and the result.
+
+	The function is called REPEATS times, and the fastest of these runtimes is returned.
+
+	Parameters
+	----------
+	func : function
+		the function to time
+	*args
+		the arguments to call the function with
+
+	Returns
+	-------
+	float
+		fastest runtime in seconds
+	object
+		the value returned by the function
+	"""
+
+	best = float("inf")
+
+	for i in range(0, REPEATS):
+		start_time = time.perf_counter()
+		result = func(*args)
+		best = min(best, time.perf_counter() - start_time)
+
+	return best, result
+
+
+def benchmark_coherent_summing():
+	"""Compares the loop and vectorised implementations of coherent summing.
+
+	Each implementation is timed for each of the grid sizes in GRID_SIZES, and the
+	maximum difference between the images they produce is printed. The radial and azimuth
+	axes in sonar_processing are restored afterwards.
+
+	Raises
+	------
+	AssertionError
+		If the images differ by more than EQUIVALENCE_TOLERANCE
+	"""
+
+	print("Coherent summing ({} receivers)".format(len(sp.reciever_coords)))
+
+	range_profiles = simulate_range_profiles()
+
+	rad, azm = sp.rad, sp.azm
+
+	try:
+		for size in GRID_SIZES:
+			sp.rad = np.linspace(0, sp.r_max, size)
+			sp.azm = np.linspace(-sp.FIELD_OF_VIEW*np.pi/180, sp.FIELD_OF_VIEW*np.pi/180, size)
+
+			runtime, z = time_function(sp.coherent_summing, range_profiles)
+
+			if(size <= LOOP_MAX_GRID_SIZE):
+				loop_runtime, z_loop = time_function(coherent_summing_loop, range_profiles)
+				print("\t{0}x{0}: loop={1:.3f}s, vectorised={2:.4f}s, speedup={3:.0f}x, max diff={4:.2e}".format(size, loop_runtime, runtime, loop_runtime/runtime, np.max(abs(z - z_loop))))
+
+				np.testing.assert_allclose(z, z_loop, rtol=0, atol=EQUIVALENCE_TOLERANCE * np.max(abs(z_loop)), err_msg="vectorised and loop images differ")
+			else:
+				print("\t{0}x{0}: vectorised={1:.4f}s".format(size, runtime))
+	finally:
+		sp.rad, sp.azm = rad, azm
+
+
+def benchmark_geometry_cache():
+	"""Compares coherent summing with and without cached beamforming geometry.
+
+	The first frame after clearing the cache must calculate the geometry tables, whereas
+	every later frame with the same geometry and sample rate only extracts and sums values.
+	"""
+
+	print("Beamforming geometry cache")
+
+	range_profiles = simulate_range_profiles()
+
+	for size in GRID_SIZES:
+		rad, azm = sp.rad, sp.azm
+		try:
+			sp.rad = np.linspace(0, sp.r_max, size)
+			sp.azm = np.linspace(-sp.FIELD_OF_VIEW*np.pi/180, sp.FIELD_OF_VIEW*np.pi/180, size)
+
+			sp.clear_geometry_cache()
+			start_time = time.perf_counter()
+			sp.coherent_summing(range_profiles)
+			cold_runtime = time.perf_counter() - start_time
+
+			warm_runtime, z = time_function(sp.coherent_summing, range_profiles)
+
+			print("\t{0}x{0}: first frame={1:.4f}s, cached={2:.4f}s".format(size, cold_runtime, warm_runtime))
+		finally:
+			sp.rad, sp.azm = rad, azm
+
+
+def benchmark_fused_processing():
+	"""Compares the stage-by-stage and fused range profile processing.
+
+	Both simulated data and the recorded receive signal are processed for all receivers.
+	The maximum difference between the range profiles of the two methods is printed 
+	relative to the peak of the range profiles, and should be close to machine precision.
+
+	Raises
+	------
+	AssertionError
+		If the range profiles differ by more than EQUIVALENCE_TOLERANCE
+	"""
+
+	print("Fused range profile processing ({} receivers)".format(len(sp.reciever_coords)))
+
+	record_rx = sp.RECORD_RX
+	sp.RECORD_RX = False
+
+	two_way_delays = simulate_delays()
+	samples = None
+
+	try:
+		for simulated in [True, False]:
+
+			# the samples are only loaded after simulating, as loading them changes the 
+			# sample rate
+			if(not simulated):
+				samples = recorded_samples()
+
+			range_profiles = []
+			runtimes = []
+
+			for fused in [False, True]:
+				sp.FUSED_PROCESSING = fused
+
+				# the same noise is used for both methods
+				np.random.seed(0)
+
+				if(simulated):
+					runtime, yt = time_function(sp.produce_range_profiles_batch_sim, two_way_delays)
+				else:
+					runtime, yt = time_function(sp.produce_range_profiles_batch, samples)
+
+				range_profiles.append(yt)
+				runtimes.append(runtime)
+
+			rel_diff = np.max(abs(range_profiles[1] - range_profiles[0])) / np.max(abs(range_profiles[0]))
+
+			print("\t{}: stages={:.4f}s, fused={:.4f}s, max relative diff={:.2e}".format("simulated" if simulated else "recorded", runtimes[0], runtimes[1], rel_diff))
+
+			np.testing.assert_allclose(range_profiles[1], range_profiles[0], rtol=0, atol=EQUIVALENCE_TOLERANCE * np.max(abs(range_profiles[0])), err_msg="fused and stage-by-stage range profiles differ")
+	finally:
+		sp.FUSED_PROCESSING = False
+		sp.RECORD_RX = record_rx
+
+
+
+def benchmark_concurrent_processing():
+	"""Compares processing pings one at a time and in parallel threads.
+
+	Each ping uses its own ProcessingContext with a different sample rate, and alternates
+	between stage-by-stage and fused processing. The pings are processed one at a time, 
+	and then by NUM_THREADS threads at once. Since the contexts are immutable, the range 
+	profiles should be identical, and the maximum difference between them is printed.
+	"""
+
+	print("Concurrent processing ({} pings, {} threads)".format(NUM_PINGS, NUM_THREADS))
+
+	recorded = np.loadtxt(sp.RX_LOAD_FILEPATH)
+	rng = np.random.RandomState(0)
+
+	ctx = sp.global_context().with_options(record_rx=False)
+
+	pings = []
+	for i in range(0, NUM_PINGS):
+		ping_ctx = ctx.with_sample_rate(sp.fs*(1 - 0.05*(i%4)), len(recorded)).with_options(fused=(i%2==0))
+		samples = np.asarray([recorded + rng.normal(scale=0.01, size=len(recorded)) for reciever in sp.reciever_coords])
+		pings.append((samples, ping_ctx))
+
+	def process(ping):
+		samples, ping_ctx = ping
+		return sp.coherent_summing(sp.produce_range_profiles_batch(samples, ping_ctx), ping_ctx)
+
+	start_time = time.perf_counter()
+	sequential = [process(ping) for ping in pings]
+	sequential_runtime = time.perf_counter() - start_time
+
+	start_time = time.perf_counter()
+	with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
+		parallel = list(executor.map(process, pings))
+	parallel_runtime = time.perf_counter() - start_time
+
+	max_diff = max(np.max(abs(z - z_parallel)) for z, z_parallel in zip(sequential, parallel))
+
+	print("\tsequential={:.4f}s, threads={:.4f}s, max diff={:.2e}".format(sequential_runtime, parallel_runtime, max_diff))
+
+
+def benchmark_decimation():
+	"""Compares processing a ping at the full sample rate and with decimated range profiles.
+
+	For each factor in DECIMATION_FACTORS, the recorded receive signal is processed into
+	range profiles and summed into an image, using both stage-by-stage and fused
+	processing. The range profiles are compared with every D-th sample of the full rate
+	range profiles, and the images with the full rate image. Both differences are printed
+	as the norm of the difference relative to the norm of the reference.
+	"""
+
+	print("Decimation after basebanding ({} receivers)".format(len(sp.reciever_coords)))
+
+	samples = recorded_samples()
+	ctx = sp.global_context().with_options(record_rx=False)
+
+	full = sp.produce_range_profiles_batch(samples, ctx)
+	z_full = abs(sp.coherent_summing(full, ctx))
+
+	for factor in DECIMATION_FACTORS:
+		for fused in [False, True]:
+			factor_ctx = ctx.with_options(decimation=factor, fused=fused)
+
+			def process():
+				range_profiles = sp.produce_range_profiles_batch(samples, factor_ctx)
+				return range_profiles, sp.coherent_summing(range_profiles, factor_ctx)
+
+			runtime, (range_profiles, z) = time_function(process)
+
+			reference = full[:, ::factor]
+			profile_diff = np.linalg.norm(range_profiles - reference) / np.linalg.norm(reference)
+			image_diff = np.linalg.norm(abs(z) - z_full) / np.linalg.norm(z_full)
+
+			print("\tD={:>2} {}: {:.4f}s, {} samples, profile diff={:.2e}, image diff={:.2e}".format(factor, "fused " if fused else "stages", runtime, range_profiles.shape[-1], profile_diff, image_diff))
+
+
+def benchmark_upsampling():
+	"""Measures the cost and accuracy of upsampling the range profiles before coherent
+	summing.
+
+	For each decimation factor in UPSAMPLE_DECIMATION_FACTORS and upsampling factor in
+	UPSAMPLE_FACTORS, the recorded receive signal is processed into range profiles and
+	summed into an image, and each is timed separately. The magnitude of each image is
+	compared with the image upsampled by UPSAMPLE_REFERENCE_FACTOR, which is close to
+	the image that would be obtained by interpolating every delay exactly. The difference
+	is printed as the norm of the difference relative to the norm of the reference.
+	"""
+
+	print("Upsampling before coherent summing ({} receivers)".format(len(sp.reciever_coords)))
+
+	samples = recorded_samples()
+	ctx = sp.global_context().with_options(record_rx=False, fused=True)
+
+	for decimation in UPSAMPLE_DECIMATION_FACTORS:
+		reference_ctx = ctx.with_options(decimation=decimation, upsampling=UPSAMPLE_REFERENCE_FACTOR)
+		z_reference = abs(sp.coherent_summing(sp.produce_range_profiles_batch(samples, reference_ctx), reference_ctx))
+
+		for factor in UPSAMPLE_FACTORS:
+			factor_ctx = ctx.with_options(decimation=decimation, upsampling=factor)
+
+			profile_runtime, range_profiles = time_function(sp.produce_range_profiles_batch, samples, factor_ctx)
+			summing_runtime, z = time_function(sp.coherent_summing, range_profiles, factor_ctx)
+
+			image_diff = np.linalg.norm(abs(z) - z_reference) / np.linalg.norm(z_reference)
+
+			print("\tD={:>2} U={:>2}: profiles={:.4f}s, summing={:.4f}s, {} samples, image diff={:.2e}".format(decimation, factor, profile_runtime, summing_runtime, range_profiles.shape[-1], image_diff))
+
+
+def benchmark_far_field():
+	"""Compares exact near-field coherent summing with far-field beamforming.
+
+	For each of the grid sizes in FAR_FIELD_GRID_SIZES, the image is formed using only
+	near-field coherent summing, using far-field beamforming from FAR_FIELD_RANGE onwards,
+	and using far-field beamforming at every range. The difference between the far-field
+	and exact images beyond FAR_FIELD_RANGE is printed as the norm of the difference 
+	relative to the norm of the exact image.
+	"""
+
+	print("Far-field beamforming ({} receivers, switch-over at {} m)".format(len(sp.reciever_coords), sp.FAR_FIELD_RANGE))
+
+	range_profiles = simulate_range_profiles()
+
+	for size in FAR_FIELD_GRID_SIZES:
+		rad, azm = sp.rad, sp.azm
+		try:
+			sp.rad = np.linspace(0, sp.r_max, size)
+			sp.azm = np.linspace(-sp.FIELD_OF_VIEW*np.pi/180, sp.FIELD_OF_VIEW*np.pi/180, size)
+
+			ctx = sp.global_context()
+			far = ctx.rad >= ctx.far_field_range
+
+			near_runtime, z = time_function(sp.coherent_summing, range_profiles, ctx.with_options(far_field=False))
+			mixed_runtime, z_mixed = time_function(sp.coherent_summing, range_profiles, ctx.with_options(far_field=True))
+			far_runtime, z_far = time_function(sp.coherent_summing, range_profiles, ctx.with_options(far_field=True, far_field_range=0))
+
+			image_diff = np.linalg.norm(abs(z_mixed[:, far]) - abs(z[:, far])) / np.linalg.norm(abs(z[:, far]))
+
+			print("\t{0}x{0}: near-field={1:.4f}s, switch-over={2:.4f}s, far-field={3:.4f}s, image diff={4:.2e}".format(size, near_runtime, mixed_runtime, far_runtime, image_diff))
+		finally:
+			sp.rad, sp.azm = rad, azm
+
+def benchmark_tiled_beamforming():
+	"""Compares coherent summing over the whole grid with tiled beamforming.
+
+	For each of the grid sizes in TILED_GRID_SIZES, the image is formed using the geometry
+	of the whole grid (both the first frame, which calculates the geometry, and later 
+	frames, which use the cached geometry) and then tile by tile using each number of 
+	worker processes in TILED_WORKERS. The memory taken by the geometry tables of the whole
+	grid and of a single tile, and the maximum difference between the images, are printed.
+	"""
+
+	print("Tiled beamforming ({} receivers, {}x{} tiles)".format(len(sp.reciever_coords), sp.BEAMFORMING_TILE_SIZE, sp.BEAMFORMING_TILE_SIZE))
+
+	range_profiles = simulate_range_profiles()
+
+	workers = sp.BEAMFORMING_WORKERS
+
+	for size in TILED_GRID_SIZES:
+		rad, azm = sp.rad, sp.azm
+		try:
+			sp.rad = np.linspace(0, sp.r_max, size)
+			sp.azm = np.linspace(-sp.FIELD_OF_VIEW*np.pi/180, sp.FIELD_OF_VIEW*np.pi/180, size)
+
+			ctx = sp.global_context().with_options(tiled=False)
+
+			sp.clear_geometry_cache()
+			start_time = time.perf_counter()
+			sp.coherent_summing(range_profiles, ctx)
+			cold_runtime = time.perf_counter() - start_time
+
+			warm_runtime, z = time_function(sp.coherent_summing, range_profiles, ctx)
+
+			index, steering = sp.beamforming_geometry(ctx)
+			grid_memory = (index.nbytes + steering.nbytes) / 1e6
+			tile_memory = grid_memory * min(sp.BEAMFORMING_TILE_SIZE, size)**2 / size**2
+			sp.clear_geometry_cache()
+
+			print("\t{0}x{0}: first frame={1:.4f}s, cached={2:.4f}s, geometry={3:.0f} MB ({4:.0f} MB per tile)".format(size, cold_runtime, warm_runtime, grid_memory, tile_memory))
+
+			for num_workers in TILED_WORKERS:
+				sp.BEAMFORMING_WORKERS = num_workers
+
+				# the pool is created before timing
+				if(num_workers > 1):
+					sp.get_beamforming_pool()
+
+				runtime, z_tiled = time_function(sp.coherent_summing, range_profiles, ctx.with_options(tiled=True))
+
+				print("\t\t{} worker(s): tiled={:.4f}s, max diff={:.2e}".format(num_workers, runtime, np.max(abs(z_tiled - z))))
+		finally:
+			sp.rad, sp.azm = rad, azm
+			sp.BEAMFORMING_WORKERS = workers
+
+	sp.shutdown_beamforming_pool()
+
+
+def benchmark_numba_backend():
+	"""Compares the compiled Numba kernels with the NumPy implementations they replace.
+
+	The recorded receive signal is processed stage by stage into range profiles, and then
+	summed into an image, once using the NumPy implementations and once using the kernels
+	in numba_kernels. This checks that the kernels produce the same range profiles and 
+	image, and the maximum difference relative to the peak of each is printed. 
+	
+	If numba is not installed, the kernels run as ordinary Python functions. The results
+	are still compared, but the runtimes are not printed as they are not representative.
+
+	Raises
+	------
+	AssertionError
+		If the range profiles or images differ by more than EQUIVALENCE_TOLERANCE
+	"""
+
+	print("Numba backend ({})".format("compiled" if numba_kernels.NUMBA_AVAILABLE else "numba not installed - kernels run as Python"))
+
+	samples = recorded_samples()
+	ctx = sp.global_context().with_options(record_rx=False, fused=False)
+
+	numba_kernels.warm_up()
+
+	use_numba = sp.USE_NUMBA
+
+	results = []
+	runtimes = []
+
+	try:
+		for numba in [False, True]:
+			sp.USE_NUMBA = numba
+
+			profile_runtime, range_profiles = time_function(sp.produce_range_profiles_batch, samples, ctx)
+			summing_runtime, z = time_function(sp.coherent_summing, range_profiles, ctx)
+
+			results.append((range_profiles, z))
+			runtimes.append((profile_runtime, summing_runtime))
+	finally:
+		sp.USE_NUMBA = use_numba
+
+	for i, name in enumerate(["range profiles", "image"]):
+		rel_diff = np.max(abs(results[1][i] - results[0][i])) / np.max(abs(results[0][i]))
+
+		if(numba_kernels.NUMBA_AVAILABLE):
+			print("\t{}: numpy={:.4f}s, numba={:.4f}s, max relative diff={:.2e}".format(name, runtimes[0][i], runtimes[1][i], rel_diff))
+		else:
+			print("\t{}: max relative diff={:.2e}".format(name, rel_diff))
+
+		np.testing.assert_allclose(results[1][i], results[0][i], rtol=0, atol=EQUIVALENCE_TOLERANCE * np.max(abs(results[0][i])), err_msg="numba and numpy {} differ".format(name))
+
+
+def benchmark_region_of_interest():
+	"""Compares imaging the full field of view with imaging only a region of interest.
+
+	The full grid, and each region in REGIONS_OF_INTEREST at each density in 
+	REGION_DENSITIES, is beamformed from the same range profiles. Both the first frame
+	(which calculates the geometry) and later frames (which use the cached geometry) are 
+	timed, and the number of grid positions is printed.
+	"""
+
+	print("Region of interest beamforming ({} receivers)".format(len(sp.reciever_coords)))
+
+	range_profiles = simulate_range_profiles()
+	ctx = sp.global_context()
+
+	def benchmark_grid(name, grid_ctx):
+		sp.clear_geometry_cache()
+		start_time = time.perf_counter()
+		sp.coherent_summing(range_profiles, grid_ctx)
+		cold_runtime = time.perf_counter() - start_time
+
+		warm_runtime, z = time_function(sp.coherent_summing, range_profiles, grid_ctx)
+
+		print("\t{}: {}x{} grid, first frame={:.4f}s, cached={:.4f}s".format(name, len(grid_ctx.azm), len(grid_ctx.rad), cold_runtime, warm_runtime))
+
+	benchmark_grid("full field of view", ctx)
+
+	for region in REGIONS_OF_INTEREST:
+		for density in REGION_DENSITIES:
+			benchmark_grid("{}-{} m, {} to {} deg, density {}".format(*region, density), ctx.with_region(*region, density=density))
+
+
+
+def benchmark_progressive_imaging():
+	"""Compares dense coherent summing with progressive (coarse to fine) coherent summing.
+
+	Both use the cached geometry of the full field of view at each density in 
+	PROGRESSIVE_DENSITIES. The time taken to produce the image at each level of 
+	sp.PROGRESSIVE_STRIDES is printed, along with the fraction of grid positions that 
+	match the dense image and the largest difference relative to the peak of the dense 
+	image. A last level replaced by dense summing (see sp.PROGRESSIVE_MIN_POSITIONS) is 
+	printed as dense.
+	"""
+
+	print("Progressive beamforming ({} receivers, strides {}, threshold {})".format(len(sp.reciever_coords), sp.PROGRESSIVE_STRIDES, sp.PROGRESSIVE_THRESHOLD))
+
+	range_profiles = simulate_range_profiles()
+
+	for density in PROGRESSIVE_DENSITIES:
+		ctx = sp.global_context().with_region(0, sp.r_max, -sp.FIELD_OF_VIEW, sp.FIELD_OF_VIEW, density=density)
+
+		dense_runtime, z_dense = time_function(sp.coherent_summing, range_profiles, ctx)
+
+		print("\t{}x{} grid, dense: {:.4f}s".format(len(ctx.azm), len(ctx.rad), dense_runtime))
+
+		# time taken to reach each level - the fastest run is reported
+		level_runtimes = [math.inf] * len(sp.PROGRESSIVE_STRIDES)
+
+		for _ in range(REPEATS):
+			start_time = time.perf_counter()
+			for level, z in enumerate(sp.progressive_coherent_summing(range_profiles, ctx)):
+				level_runtimes[level] = min(level_runtimes[level], time.perf_counter() - start_time)
+
+		images = list(sp.progressive_coherent_summing(range_profiles, ctx))
+
+		for level, z in enumerate(images):
+			exact = np.mean(np.isclose(z, z_dense))
+			diff = np.max(np.abs(np.abs(z) - np.abs(z_dense))) / np.max(np.abs(z_dense))
+
+			# the last image is dense if the grid is too small, or too much of it is refined
+			dense = level == len(images) - 1 and np.array_equal(z, z_dense)
+			label = "dense" if dense else "stride {}".format(sp.PROGRESSIVE_STRIDES[level])
+
+			print("\t\t{}: {:.4f}s ({:.0%} of dense), exact={:.1%}, max diff={:.3f}".format(label, level_runtimes[level], level_runtimes[level] / dense_runtime, exact, diff))
+
+
+
+def benchmark_continuous_acquisition():
+	"""Compares the frame rate of request driven imaging with continuous acquisition.
+
+	Simulated pings are used, which take acquisition.SIMULATED_PING_INTERVAL to acquire. 
+	Request driven imaging waits for each ping and then processes it, so its frame rate is
+	estimated from the sum of the two times. Continuous acquisition is run for 
+	CONTINUOUS_DURATION seconds, and its statistics are printed.
+	"""
+
+	print("Continuous acquisition (simulated ping interval {}s, queue depth {})".format(acquisition.SIMULATED_PING_INTERVAL, acquisition.PING_QUEUE_DEPTH))
+
+	ctx = sp.global_context()
+
+	runtime, z = time_function(lambda: sp.coherent_summing(sp.simulate_2D_range_profiles(ctx), ctx))
+	print("\trequest driven: {:.2f} frames/s".format(1 / (acquisition.SIMULATED_PING_INTERVAL + runtime)))
+
+	acquisition.start_acquisition(ctx, sim_mode=True)
+	time.sleep(CONTINUOUS_DURATION)
+	stats = acquisition.stop_acquisition()
+
+	print("\tcontinuous: {:.2f} frames/s ({} pings acquired, {} dropped)".format(stats["processing_fps"], stats["pings_acquired"], stats["pings_dropped"]))
+
+
+
+def benchmark_integration():
+	"""Benchmarks coherent and incoherent integration of simulated pings.
+
+	For each sliding window in INTEGRATION_WINDOWS (and an exponential moving average), 
+	INTEGRATION_PINGS pings are integrated. The average time to update the accumulator, 
+	the number of arrays it stores, and the noise in the image (standard deviation 
+	between 1 m and 3 m, where there are no targets, relative to the peak) are printed.
+	"""
+
+	print("Ping integration ({} pings)".format(INTEGRATION_PINGS))
+
+	ctx = sp.global_context()
+	pings = [sp.simulate_2D_range_profiles(ctx) for i in range(INTEGRATION_PINGS)]
+	empty = (ctx.rad > 1) & (ctx.rad < 3)
+
+	def noise(z):
+		return np.std(np.abs(z)[:, empty]) / np.max(np.abs(z))
+
+	print("\tsingle ping: noise={:.4f}".format(noise(sp.coherent_summing(pings[-1], ctx))))
+
+	for mode in integration.INTEGRATION_MODES:
+		settings = [{"window": window} for window in INTEGRATION_WINDOWS] + [{"decay": 0.9}]
+
+		for setting in settings:
+			integrator = integration.PingIntegrator(mode, **setting)
+			update_runtime = 0
+
+			for range_profiles in pings:
+				start_time = time.perf_counter()
+				range_profiles = integrator.integrate_range_profiles(range_profiles, ctx)
+				update_runtime += time.perf_counter() - start_time
+
+				z = sp.coherent_summing(range_profiles, ctx)
+
+				start_time = time.perf_counter()
+				z = integrator.integrate_image(z, ctx)
+				update_runtime += time.perf_counter() - start_time
+
+			accumulator = integrator.accumulator
+			stored = 1 if accumulator.decay is not None else len(accumulator.blocks) + (accumulator.current_count > 0)
+
+			print("\t{} {}={}: {:.5f}s per ping, {} arrays stored, noise={:.4f}".format(mode, *setting.popitem(), update_runtime / INTEGRATION_PINGS, stored, noise(z)))
+
+
+
+def benchmark_debug_capture():
+	"""Compares producing simulated range profiles with and without debug mode.
+
+	In debug mode the arrays of every intermediate figure are captured, but no figures 
+	are rendered. The time taken to render a single captured figure (on request) is also 
+	printed, along with the number of figures captured.
+	"""
+
+	print("Debug mode ({} receivers)".format(len(sp.reciever_coords)))
+
+	ctx = sp.global_context()
+	td_targets = simulate_delays()
+
+	runtime, range_profiles = time_function(sp.produce_range_profiles_batch_sim, td_targets, ctx)
+	debug_runtime, range_profiles = time_function(sp.produce_range_profiles_batch_sim, td_targets, ctx.with_options(debug=True))
+
+	start_time = time.perf_counter()
+	sp.debug_plot_png("0_1_receive.png")
+	render_runtime = time.perf_counter() - start_time
+
+	print("\tdebug off: {:.4f}s, debug on: {:.4f}s, {} figures captured, render one figure: {:.4f}s".format(runtime, debug_runtime, len(sp.debug_captures), render_runtime))
+
+
+def benchmark_rx_recording():
+	"""Compares saving the receive signal of every receiver as a text file with recording 
+	it using rx_recorder.
+
+	For each of RECORDING_PINGS pings, the time the processing thread spends saving (or 
+	queuing) the receive signals is measured. The time taken by the writer thread to 
+	write every queued signal, the size of each file, and the largest difference between 
+	the recorded and original samples are also printed.
+	"""
+
+	print("Receive signal recording ({} pings, {} receivers)".format(RECORDING_PINGS, len(sp.reciever_coords)))
+
+	samples = recorded_samples()
+
+	with tempfile.TemporaryDirectory() as directory:
+		text_filepath = os.path.join(directory, "recorded_RX_signal.txt")
+		binary_filepath = os.path.join(directory, "recorded_RX_signal.bin")
+
+		start_time = time.perf_counter()
+		for i in range(0, RECORDING_PINGS):
+			for n in range(0, len(samples)):
+				np.savetxt(text_filepath, samples[n], delimiter=',')
+		text_runtime = (time.perf_counter() - start_time) / RECORDING_PINGS
+
+		start_time = time.perf_counter()
+		for i in range(0, RECORDING_PINGS):
+			rx_recorder.record(binary_filepath, samples, sp.fs, np.arange(len(samples)))
+		record_runtime = (time.perf_counter() - start_time) / RECORDING_PINGS
+
+		rx_recorder.flush()
+		flush_runtime = time.perf_counter() - start_time
+
+		records = rx_recorder.read_recordings(binary_filepath)
+		error = max(np.max(np.abs(recorded - samples[channel])) for timestamp, fs, channel, recorded in records)
+
+		print("\tsavetxt: {:.5f}s per ping ({} kB, last receiver only)".format(text_runtime, os.path.getsize(text_filepath) // 1024))
+		print("\trx_recorder: {:.5f}s per ping, all written after {:.4f}s ({} kB, {} records, {} dropped), max error={:.2e}".format(record_runtime, flush_runtime, os.path.getsize(binary_filepath) // 1024, len(records), rx_recorder.recorder_stats()["dropped"], error))
+
+
+def benchmark_capture_archive():
+	"""Benchmarks writing, loading and replaying pings from a capture archive.
+
+	ARCHIVE_PINGS pings (the recorded receive signal of each receiver, converted to ADC 
+	codes) are appended to an archive. The time taken to open the archive and load a 
+	single ping, and a range of ARCHIVE_RANGE pings, from the middle of the archive is 
+	printed. A ping is then replayed through capture_2D_range_profiles, and the maximum 
+	difference from processing the same ping directly is printed, relative to the peak 
+	of the range profiles, and should be zero.
+	"""
+
+	print("Capture archive ({} pings, {} receivers)".format(ARCHIVE_PINGS, len(sp.reciever_coords)))
+
+	samples = recorded_samples()
+	codes = np.clip(np.rint(samples * (ARCHIVE_MAX_ADC_CODE - 1) / teensy_interface.ADC_REFERENCE_VOLTAGE), 0, ARCHIVE_MAX_ADC_CODE - 1)
+
+	ctx = sp.global_context().with_options(record_rx=False)
+
+	with tempfile.TemporaryDirectory() as directory:
+		filepath = os.path.join(directory, "capture")
+
+		start_time = time.perf_counter()
+		for i in range(0, ARCHIVE_PINGS):
+			capture_archive.append_ping(filepath, codes, sp.fs, ARCHIVE_MAX_ADC_CODE)
+		append_runtime = (time.perf_counter() - start_time) / ARCHIVE_PINGS
+
+		middle = ARCHIVE_PINGS // 2
+
+		def load_ping():
+			return np.array(capture_archive.CaptureArchive(filepath).ping(middle))
+
+		def load_range():
+			return np.array(capture_archive.CaptureArchive(filepath).pings(middle, middle + ARCHIVE_RANGE))
+
+		ping_runtime, ping = time_function(load_ping)
+		range_runtime, pings = time_function(load_range)
+
+		print("\tappend: {:.5f}s per ping ({} kB per ping)".format(append_runtime, os.path.getsize(filepath + capture_archive.DATA_EXTENSION) // ARCHIVE_PINGS // 1024))
+		print("\tload ping {}: {:.5f}s, load {} pings: {:.5f}s, codes match={}".format(middle, ping_runtime, ARCHIVE_RANGE, range_runtime, np.array_equal(ping, codes) and np.array_equal(pings[-1], codes)))
+
+		source = capture_archive.ReplaySource(filepath, start=middle)
+
+		replay_runtime, (range_profiles, replay_ctx) = time_function(sp.capture_2D_range_profiles, ctx, source)
+
+		sonar_data = capture_archive.codes_to_sonar_data(codes, sp.fs, ARCHIVE_MAX_ADC_CODE)
+		expected, expected_ctx = sp.sonar_data_range_profiles(sonar_data, ctx)
+
+		rel_diff = np.max(abs(range_profiles - expected)) / np.max(abs(expected))
+
+		print("\treplay: {:.4f}s per ping, max relative diff={:.2e}".format(replay_runtime, rel_diff))
+
+
+def benchmark_teensy_emulator():
+	"""Measures the latency from requesting sonar data to a 2D image, using the Teensy 
+	emulator in place of the microcontroller.
+
+	The time taken by teensy_interface.request_sonar_data for 1D ('g') and 2D ('f') 
+	requests is printed, along with the time the emulator takes to capture the samples 
+	(its latency) and the time to produce a 2D image from the sonar data. The end to end 
+	time from request to image is therefore printed without the hardware.
+	"""
+
+	print("Teensy emulator ({} channels, {} samples)".format(teensy_emulator.EMULATOR_CHANNELS, teensy_emulator.EMULATOR_SAMPLES))
+
+	device = teensy_interface.TEENSY_DEVICE
+	ctx = sp.global_context().with_options(record_rx=False)
+
+	try:
+		with teensy_emulator.start_emulator() as emulator:
+			short_runtime, sonar_data = time_function(teensy_interface.request_sonar_data, True)
+
+			stats = emulator.stats()
+			request_runtime, sonar_data = time_function(teensy_interface.request_sonar_data, False)
+			bytes_sent = (emulator.stats()["bytes_sent"] - stats["bytes_sent"]) // REPEATS
+
+			def produce_image(sonar_data):
+				range_profiles, image_ctx = sp.sonar_data_range_profiles(sonar_data, ctx)
+				return sp.coherent_summing(range_profiles, image_ctx)
+
+			image_runtime, z = time_function(produce_image, sonar_data)
+
+			print("\temulator latency={:.4f}s, {} kB per 2D request".format(emulator.latency, bytes_sent // 1024))
+			print("\trequest 1D: {:.4f}s, request 2D: {:.4f}s, image: {:.4f}s, request to image: {:.4f}s".format(short_runtime, request_runtime, image_runtime, request_runtime + image_runtime))
+	finally:
+		teensy_interface.TEENSY_DEVICE = device
+
+
+def benchmark_binary_transfer():
+	"""Compares the binary and ASCII formats used to transfer sonar data.
+
+	The size of a 2D ping in each format, and the time taken to decode it, are printed. 
+	The time taken by teensy_interface.request_sonar_data in each format is then measured
+	using the Teensy emulator. Both formats should decode to the same voltages.
+	"""
+
+	print("Binary transfer ({} channels, {} samples)".format(teensy_emulator.EMULATOR_CHANNELS, teensy_emulator.EMULATOR_SAMPLES))
+
+	device = teensy_interface.TEENSY_DEVICE
+
+	emulator = teensy_emulator.TeensyEmulator(seed=0)
+	emulator.pings = [emulator.simulate_ping()]
+
+	text = ("\r\n".join(emulator.sonar_lines()) + "\r\n").encode("ascii")
+	frame = emulator.sonar_frame()
+
+	text_runtime, text_data = time_function(teensy_interface.parse_sonar_text, text)
+	frame_runtime, frame_data = time_function(teensy_interface.decode_sonar_frame, frame)
+
+	max_diff = max(np.max(np.abs(np.asarray(text_data[key]) - frame_data[key])) for key in text_data if key.startswith("buffer"))
+
+	print("\tdecode ASCII: {:.4f}s ({} kB), decode binary: {:.5f}s ({} kB), max diff={:.2e}".format(text_runtime, len(text) // 1024, frame_runtime, len(frame) // 1024, max_diff))
+
+	try:
+		with teensy_emulator.start_emulator() as emulator:
+			text_request_runtime, sonar_data = time_function(teensy_interface.request_sonar_data, False, False)
+			frame_request_runtime, sonar_data = time_function(teensy_interface.request_sonar_data, False, True)
+
+			print("\trequest ASCII: {:.4f}s, request binary: {:.4f}s (emulator latency={:.4f}s)".format(text_request_runtime, frame_request_runtime, emulator.latency))
+	finally:
+		teensy_interface.TEENSY_DEVICE = device
+
+
+def benchmark_serial_reads():
+	"""Compares reading ASCII transfers until the serial timeout with reading them until
+	their terminator, using the Teensy emulator.
+
+	Reading until the timeout is how transfers were previously read: the serial port is 
+	read until no bytes arrive for SERIAL_TIMEOUT_SHORT (1D and status requests) or 
+	SERIAL_TIMEOUT_LONG (2D requests) seconds. teensy_interface.read_until_terminator 
+	instead returns as soon as the runtime line after 'end_buffer_transfer' (or the 
+	second line of a status request) arrives. Both should return the same sonar data.
+	"""
+
+	print("Serial reads (ASCII, {} channels, {} samples)".format(teensy_emulator.EMULATOR_CHANNELS, teensy_emulator.EMULATOR_SAMPLES))
+
+	device = teensy_interface.TEENSY_DEVICE
+
+	def read_until_timeout(command, timeout, size=teensy_interface.MAX_TRANSFER_BYTES):
+		teensy = serial.Serial(teensy_interface.TEENSY_DEVICE, teensy_interface.BAUD_RATE, timeout=timeout)
+		teensy.write(command.encode())
+		return teensy.read(size)
+
+	try:
+		with teensy_emulator.start_emulator() as emulator:
+			# respond to every request with the same ping, so that both reads can be compared
+			emulator.pings = emulator.pings[:1]
+
+			rows = [("status", "i", teensy_interface.SERIAL_TIMEOUT_SHORT, teensy_interface.request_status, ()),
+			        ("1D", "g", teensy_interface.SERIAL_TIMEOUT_SHORT, teensy_interface.request_sonar_data, (True, False)),
+			        ("2D", "f", teensy_interface.SERIAL_TIMEOUT_LONG, teensy_interface.request_sonar_data, (False, False))]
+
+			for name, command, timeout, request, args in rows:
+				size = 100 if command == "i" else teensy_interface.MAX_TRANSFER_BYTES
+				timeout_runtime, payload = time_function(read_until_timeout, command, timeout, size)
+				terminator_runtime, data = time_function(request, *args)
+
+				if(command == "i"):
+					match = data["connection"] == "Connected"
+				else:
+					reference = teensy_interface.parse_sonar_text(payload)
+					match = all(np.array_equal(reference[key], data[key]) for key in reference)
+
+				print("\t{}: until timeout: {:.4f}s, until terminator: {:.4f}s, same data: {}".format(name, timeout_runtime, terminator_runtime, match))
+	finally:
+		teensy_interface.TEENSY_DEVICE = device
+
+
+def benchmark_serial_connection():
+	"""Compares opening the serial port for every request with the serial connection that
+	teensy_interface keeps open, using the Teensy emulator.
+
+	The time taken by sequential status and 2D (binary) requests is printed for each. 
+	CONNECTION_CLIENTS threads then each make a 2D request at the same time, as several 
+	web clients would. When each thread opens its own port, their requests collide on the
+	serial port. The shared connection sends the commands one at a time, and coalesces 
+	identical requests, so fewer transfers are made than requests.
+	"""
+
+	print("Serial connection ({} clients)".format(CONNECTION_CLIENTS))
+
+	device = teensy_interface.TEENSY_DEVICE
+
+	def request_with_new_port(command, timeout, read):
+		teensy = serial.Serial(teensy_interface.TEENSY_DEVICE, teensy_interface.BAUD_RATE, timeout=timeout)
+		teensy.write(command.encode())
+		response = read(teensy)
+		teensy.close()
+		return response
+
+	def read_status(teensy):
+		return teensy_interface.read_until_terminator(teensy, b"\n", count=2, max_bytes=100)
+
+	def concurrent_requests(request):
+		with concurrent.futures.ThreadPoolExecutor(max_workers=CONNECTION_CLIENTS) as executor:
+			futures = [executor.submit(request) for i in range(0, CONNECTION_CLIENTS)]
+
+		return sum(1 for future in futures if future.exception() is not None)
+
+	try:
+		with teensy_emulator.start_emulator() as emulator:
+			new_status_runtime, status = time_function(request_with_new_port, "i", teensy_interface.SERIAL_TIMEOUT_SHORT, read_status)
+			status_runtime, status = time_function(teensy_interface.request_status)
+
+			new_request_runtime, sonar_data = time_function(request_with_new_port, "F", teensy_interface.SERIAL_TIMEOUT_LONG, teensy_interface.read_sonar_frame)
+			request_runtime, sonar_data = time_function(teensy_interface.request_sonar_data, False, True)
+
+			print("\tstatus: new port {:.5f}s, shared {:.5f}s; request 2D: new port {:.4f}s, shared {:.4f}s".format(new_status_runtime, status_runtime, new_request_runtime, request_runtime))
+
+			requests = emulator.stats()["requests"]
+			start_time = time.perf_counter()
+			new_failures = concurrent_requests(lambda: request_with_new_port("F", teensy_interface.SERIAL_TIMEOUT_LONG, teensy_interface.read_sonar_frame))
+			new_runtime = time.perf_counter() - start_time
+			new_transfers = emulator.stats()["requests"] - requests
+
+			requests = emulator.stats()["requests"]
+			start_time = time.perf_counter()
+			failures = concurrent_requests(lambda: teensy_interface.request_sonar_data(False, True))
+			runtime = time.perf_counter() - start_time
+			transfers = emulator.stats()["requests"] - requests
+
+			print("\tconcurrent 2D, new port: {:.4f}s, {} transfers, {} failed".format(new_runtime, new_transfers, new_failures))
+			print("\tconcurrent 2D, shared:   {:.4f}s, {} transfers, {} failed".format(runtime, transfers, failures))
+	finally:
+		teensy_interface.TEENSY_DEVICE = device
+
+
+def benchmark_ascii_parser():
+	"""Compares parsing sonar data in the ASCII format line by line with the vectorised
+	teensy_interface.parse_sonar_text.
+
+	A 2D transfer is recorded from the Teensy emulator, and parsed by each. Both should 
+	return the same voltages.
+	"""
+
+	print("ASCII parser ({} channels, {} samples)".format(teensy_emulator.EMULATOR_CHANNELS, teensy_emulator.EMULATOR_SAMPLES))
+
+	device = teensy_interface.TEENSY_DEVICE
+
+	def read_transfer(teensy):
+		return teensy_interface.read_until_terminator(teensy, teensy_interface.END_OF_TRANSFER, lines_after=teensy_interface.END_OF_TRANSFER_LINES)
+
+	try:
+		with teensy_emulator.start_emulator():
+			payload = teensy_interface.get_connection().request("f", read_transfer, teensy_interface.SERIAL_TIMEOUT_LONG)
+	finally:
+		teensy_interface.TEENSY_DEVICE = device
+
+	loop_runtime, loop_data = time_function(parse_sonar_text_loop, payload)
+	runtime, data = time_function(teensy_interface.parse_sonar_text, payload)
+
+	keys = [key for key in loop_data if key.startswith("buffer")]
+	max_diff = max(np.max(np.abs(np.asarray(loop_data[key]) - data[key])) for key in keys)
+
+	print("\t{} kB: loop: {:.4f}s, vectorised: {:.5f}s ({:.0f}x), {} buffers, max diff={:.2e}".format(len(payload) // 1024, loop_runtime, runtime, loop_runtime / runtime, len(keys), max_diff))
+
+
+# ====================================== MAIN ========================================== #
+
+if __name__ == "__main__":
+
+	# change filepath if run from terminal - assuming this script is run from signal_processing/
+	sp.DEBUG_DIR = "debug"
+	sp.RX_SAVE_FILEPATH = "receive_signal/recorded_RX_signal.bin"
+	sp.RX_LOAD_FILEPATH = "receive_signal/formatted_RX_signal.txt"
+
+	sp.set_debug_mode(False)
+
+	benchmark_coherent_summing()
+	benchmark_geometry_cache()
+	benchmark_fused_processing()
+	benchmark_concurrent_processing()
+	benchmark_decimation()
+	benchmark_upsampling()
+	benchmark_far_field()
+	benchmark_tiled_beamforming()
+	benchmark_numba_backend()
+	benchmark_region_of_interest()
+	benchmark_progressive_imaging()
+	benchmark_continuous_acquisition()
+	benchmark_integration()
+	benchmark_debug_capture()
+	benchmark_rx_recording()
+	benchmark_capture_archive()
+	benchmark_teensy_emulator()
+	benchmark_binary_transfer()
+	benchmark_serial_reads()
+	benchmark_serial_connection()
+	benchmark_ascii_parser()
+
+
+
+# ====================================== END =========================================== #
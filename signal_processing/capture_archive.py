@@ -0,0 +1,407 @@
+""" Archives raw pings from the microcontroller, and replays them in place of the sonar.
+
+A capture archive stores the raw ADC codes of every receiver for each ping, so that field
+data can be reprocessed offline (e.g. with different processing options) and the signal
+processing can be benchmarked on real signals without the hardware. An archive is made up
+of two files that are only ever appended to:
+
+	<archive>.u16 - data file. Each ping is stored as a fixed layout block of
+	num_channels x num_samples little-endian uint16 ADC codes, with the samples of each
+	channel (receiver) stored one after the other.
+
+	<archive>.idx - index file. Each ping has a fixed size entry (see INDEX_DTYPE)
+	containing the time it was captured, its sample rate and maximum ADC code, the number
+	of channels and samples, and the byte offset of its block in the data file.
+
+The data file is read using a numpy memory map, so any ping (or range of pings) is loaded
+by reading only the index and the bytes of those pings, however large the archive is. A
+ping is written to the data file before its index entry, so an archive that was being
+written when the program exited can still be read.
+
+ReplaySource provides request_sonar_data in the same format as teensy_interface, so that
+archived pings can be given to sonar_processing (see sonar_processing.request_sonar_data)
+or continuous acquisition in place of the microcontroller.
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	numpy, teensy_interface
+
+This file can also be imported as a module and contains the following functions:
+
+	* append_ping - appends the ADC codes of a ping to an archive
+	* archive_sonar_data - appends sonar data from the microcontroller to an archive
+	* codes_to_sonar_data - converts the ADC codes of a ping into sonar data
+
+ """
+
+
+# ===================================== IMPORTS ======================================== #
+
+import os
+import time
+import threading
+import numpy as np
+import teensy_interface
+from teensy_interface import TeensyError
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# file extensions of the data and index files of an archive
+global DATA_EXTENSION; DATA_EXTENSION = ".u16"
+global INDEX_EXTENSION; INDEX_EXTENSION = ".idx"
+
+# data type of the ADC codes in the data file
+global CODE_DTYPE; CODE_DTYPE = np.dtype("<u2")
+
+# layout of each entry in the index file
+global INDEX_DTYPE; INDEX_DTYPE = np.dtype([("timestamp", "<f8"),		# seconds since the epoch
+											("sample_rate", "<f8"),		# Hz
+											("max_adc_code", "<u4"),
+											("num_channels", "<u2"),
+											("num_samples", "<u4"),
+											("offset", "<u8")])			# bytes into data file
+
+# prevents two threads appending to the same archive at once
+global archive_lock; archive_lock = threading.Lock()
+
+
+# ================================= CLASS DEFINITIONS ================================== #
+
+
+class CaptureArchive:
+	"""Reads pings from a capture archive.
+
+	The index is read when the archive is opened, and can be read again (e.g. while the
+	archive is still being written) using refresh.
+
+	Attributes
+	----------
+	filepath : str
+		path of the archive, without the file extension
+	index : numpy.ndarray
+		entry of each ping in the index file (see INDEX_DTYPE)
+	"""
+	def __init__(self, filepath):
+		"""
+		Parameters
+		----------
+		filepath : str
+			path of the archive, without the file extension
+
+		Raises
+		------
+		FileNotFoundError
+			If the archive does not exist
+		"""
+
+		self.filepath = filepath
+		self.refresh()
+
+
+	def __len__(self):
+		""" returns the number of pings in the archive """
+
+		return len(self.index)
+
+
+	def refresh(self):
+		""" reads the index again, and maps any pings appended since it was last read """
+
+		# only whole entries and codes are read, as the last ping may be partly written
+		num_entries = os.path.getsize(self.filepath + INDEX_EXTENSION) // INDEX_DTYPE.itemsize
+		num_codes = os.path.getsize(self.filepath + DATA_EXTENSION) // CODE_DTYPE.itemsize
+
+		self.index = np.fromfile(self.filepath + INDEX_EXTENSION, dtype=INDEX_DTYPE, count=num_entries)
+
+		# a zero length file cannot be memory mapped
+		if(num_codes > 0):
+			self.data = np.memmap(self.filepath + DATA_EXTENSION, dtype=CODE_DTYPE, mode="r", shape=(num_codes,))
+		else:
+			self.data = np.zeros(0, dtype=CODE_DTYPE)
+
+
+	def ping(self, i):
+		"""Returns the ADC codes of a single ping.
+
+		Parameters
+		----------
+		i : int
+			index of the ping (negative indices count from the most recent ping)
+
+		Returns
+		-------
+		numpy.ndarray
+			read-only 2D array containing the ADC codes of each channel in its rows. The
+			array is a view of the memory mapped data file.
+		"""
+
+		entry = self.index[i]
+		start = int(entry["offset"]) // CODE_DTYPE.itemsize
+		shape = (int(entry["num_channels"]), int(entry["num_samples"]))
+
+		return self.data[start:start + shape[0] * shape[1]].reshape(shape)
+
+
+	def pings(self, start=0, stop=None):
+		"""Returns the ADC codes of a range of pings.
+
+		Parameters
+		----------
+		start : int, optional
+			index of the first ping
+		stop : int, optional
+			index after the last ping. Defaults to the end of the archive.
+
+		Returns
+		-------
+		numpy.ndarray
+			3D array containing the ADC codes of each ping, accessed as
+			codes[ping][channel][sample]. If every ping in the range has the same shape
+			(which is usually the case), the array is a view of the memory mapped data
+			file.
+
+		Raises
+		------
+		ValueError
+			If the pings in the range do not all have the same number of channels and
+			samples
+		"""
+
+		entries = self.index[start:stop]
+
+		if(len(entries) == 0):
+			return np.zeros((0, 0, 0), dtype=CODE_DTYPE)
+
+		shape = (int(entries["num_channels"][0]), int(entries["num_samples"][0]))
+		block_size = shape[0] * shape[1] * CODE_DTYPE.itemsize
+
+		if(np.any(entries["num_channels"] != shape[0]) or np.any(entries["num_samples"] != shape[1])):
+			raise ValueError("Pings in the range do not all have the same number of channels and samples")
+
+		# pings are appended one after the other, so are normally contiguous in the data
+		# file and can be returned as a single view
+		if(np.all(np.diff(entries["offset"].astype(np.int64)) == block_size)):
+			first = int(entries["offset"][0]) // CODE_DTYPE.itemsize
+			return self.data[first:first + len(entries) * shape[0] * shape[1]].reshape((len(entries),) + shape)
+
+		return np.stack([self.ping(i) for i in range(*slice(start, stop).indices(len(self)))])
+
+
+	def sonar_data(self, i):
+		""" returns a single ping as sonar data in the same format as
+		teensy_interface.request_sonar_data - see codes_to_sonar_data """
+
+		entry = self.index[i]
+
+		return codes_to_sonar_data(self.ping(i), float(entry["sample_rate"]), int(entry["max_adc_code"]))
+
+
+
+class ReplaySource:
+	"""Replays pings from a capture archive in place of the microcontroller.
+
+	Each call to request_sonar_data returns the next ping in the archive, in the same
+	format as teensy_interface.request_sonar_data. An instance can therefore be passed as
+	the source of sonar data wherever teensy_interface is used as the source (see
+	sonar_processing.request_sonar_data).
+
+	Attributes
+	----------
+	archive : CaptureArchive
+		the archive pings are replayed from
+	position : int
+		index of the next ping to replay
+	"""
+	def __init__(self, archive, start=0, stop=None, loop=False, realtime=False):
+		"""
+		Parameters
+		----------
+		archive : CaptureArchive or str
+			the archive (or path of the archive) to replay pings from
+		start : int, optional
+			index of the first ping to replay
+		stop : int, optional
+			index after the last ping to replay. Defaults to the end of the archive.
+		loop : bool, optional
+			if true, replaying starts again from start after the last ping
+		realtime : bool, optional
+			if true, each ping is not returned until the time between it and the previous
+			ping (when they were captured) has passed since the previous ping was returned
+		"""
+
+		if(isinstance(archive, str)):
+			archive = CaptureArchive(archive)
+
+		self.archive = archive
+		self.start, self.stop, step = slice(start, stop).indices(len(archive))
+		self.position = self.start
+		self.loop = loop
+		self.realtime = realtime
+		self.previous = None
+		self.lock = threading.Lock()
+
+
+	def request_sonar_data(self, short_timeout=False):
+		"""Returns the next ping in the archive as sonar data.
+
+		Parameters
+		----------
+		short_timeout : bool, optional
+			not used - accepted so that this can be called in the same way as
+			teensy_interface.request_sonar_data
+
+		Returns
+		-------
+		dict
+			the sample rate, maximum ADC code and the recieve signal buffer of each
+			channel - see codes_to_sonar_data
+
+		Raises
+		------
+		TeensyError
+			If every ping has been replayed (and loop is false)
+		"""
+
+		with self.lock:
+			if(self.position >= self.stop and self.loop):
+				self.position = self.start
+				self.previous = None
+
+			if(self.position >= self.stop):
+				raise TeensyError("End of capture archive: all {} pings have been replayed".format(self.stop - self.start))
+
+			i = self.position
+			self.position += 1
+
+			if(self.realtime):
+				timestamp = float(self.archive.index[i]["timestamp"])
+
+				if(self.previous is not None):
+					previous_timestamp, previous_time = self.previous
+					time.sleep(max(0, (timestamp - previous_timestamp) - (time.perf_counter() - previous_time)))
+
+				self.previous = (timestamp, time.perf_counter())
+
+		return self.archive.sonar_data(i)
+
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+def append_ping(filepath, codes, sample_rate, max_adc_code, timestamp=None):
+	"""Appends the ADC codes of a single ping to an archive, creating it if it does not
+	exist.
+
+	Parameters
+	----------
+	filepath : str
+		path of the archive, without the file extension
+	codes : numpy.ndarray
+		2D array containing the ADC codes of each channel in its rows
+	sample_rate : float
+		sample rate of the ADC [Hz]
+	max_adc_code : int
+		maximum ADC code (see teensy_interface.request_sonar_data)
+	timestamp : float, optional
+		time the ping was captured [seconds since the epoch]. Defaults to now.
+
+	Returns
+	-------
+	int
+		index of the ping in the archive
+	"""
+
+	codes = np.atleast_2d(np.asarray(codes, dtype=CODE_DTYPE))
+
+	if(timestamp is None):
+		timestamp = time.time()
+
+	directory = os.path.dirname(filepath)
+	if(directory != ""):
+		os.makedirs(directory, exist_ok=True)
+
+	with archive_lock:
+		# the data is written before the index entry, so that an entry never refers to
+		# data that has not been written
+		with open(filepath + DATA_EXTENSION, "ab") as data_file:
+			offset = data_file.tell()
+			data_file.write(codes.tobytes())
+
+		entry = np.array([(timestamp, sample_rate, max_adc_code, codes.shape[0], codes.shape[1], offset)], dtype=INDEX_DTYPE)
+
+		with open(filepath + INDEX_EXTENSION, "ab") as index_file:
+			index = index_file.tell() // INDEX_DTYPE.itemsize
+			index_file.write(entry.tobytes())
+
+	return index
+
+
+def archive_sonar_data(filepath, sonar_data, timestamp=None):
+	"""Appends sonar data from the microcontroller to an archive.
+
+	The voltage of each sample is converted back into the ADC code it was converted from
+	(see teensy_interface.request_sonar_data), so the exact ADC codes are archived.
+
+	Parameters
+	----------
+	filepath : str
+		path of the archive, without the file extension
+	sonar_data : dict
+		sonar data returned by teensy_interface.request_sonar_data
+	timestamp : float, optional
+		time the ping was captured [seconds since the epoch]. Defaults to now.
+
+	Returns
+	-------
+	int
+		index of the ping in the archive
+	"""
+
+	max_adc_code = sonar_data["max_adc_code"]
+	buffers = [sonar_data[key] for key in sonar_data if key.startswith("buffer")]
+
+	codes = np.rint(np.asarray(buffers) * (max_adc_code - 1) / teensy_interface.ADC_REFERENCE_VOLTAGE)
+
+	return append_ping(filepath, codes, sonar_data["sample_rate"], max_adc_code, timestamp)
+
+
+def codes_to_sonar_data(codes, sample_rate, max_adc_code):
+	"""Converts the ADC codes of a ping into sonar data, in the same format as
+	teensy_interface.request_sonar_data.
+
+	Parameters
+	----------
+	codes : numpy.ndarray
+		2D array containing the ADC codes of each channel in its rows
+	sample_rate : float
+		sample rate of the ADC [Hz]
+	max_adc_code : int
+		maximum ADC code
+
+	Returns
+	-------
+	dict
+		the sample rate, maximum ADC code and the recieve signal buffer (as voltages) of
+		each channel. The dictionary will look as follows:
+
+			{"sample_rate"  : 104120.0,
+			 "max_adc_code" : 4096,
+			 "buffer0"      : numpy.ndarray([1.2, 1.1, 1.1,...]),
+			 	...
+			 "buffer<n>"    : numpy.ndarray([...])}
+	"""
+
+	voltages = codes * teensy_interface.ADC_REFERENCE_VOLTAGE / (max_adc_code - 1)
+
+	sonar_data = {"sample_rate": sample_rate, "max_adc_code": max_adc_code}
+
+	for n in range(0, len(voltages)):
+		sonar_data["buffer{}".format(n)] = voltages[n]
+
+	return sonar_data
+
+
+
+# ====================================== END =========================================== #
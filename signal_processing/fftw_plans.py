@@ -0,0 +1,386 @@
+""" Keeps a registry of FFTW plans so that they can be reused across signal processing steps.
+
+Planning an FFT with FFTW is expensive compared to executing it, and every call to
+pyfftw.builders creates a new plan and new aligned arrays. This script keeps one plan for
+each combination of array shape, data type, direction (forward or inverse) and number of
+threads, and reuses it every time an FFT of that kind is computed. At most 
+PLAN_CACHE_SIZE plans are kept, removing the least recently used, as the shapes depend on
+each request (e.g. the region of interest).
+
+The knowledge FFTW gathers while planning (known as wisdom) can be saved to a file and
+loaded again at startup. Together with a higher planner effort (e.g. FFTW_MEASURE), this
+allows a web server to start with tuned plans without paying the planning cost on the
+first request.
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	numpy, pyfftw
+
+This file can also be imported as a module and contains the following functions:
+
+	* fft - computes the FFT along the last axis of an array using a cached plan
+	* ifft - computes the inverse FFT along the last axis of an array using a cached plan
+	* rfft - computes the FFT of a real array along its last axis using a cached plan
+	* irfft - computes a real array from the +'ve frequency components of its FFT using a
+	cached plan
+	* get_plan - returns the cached plan for a given shape, data type and direction
+	* set_planner_effort - sets the effort used by FFTW when creating new plans
+	* warm_up - creates plans for a list of array shapes ahead of time
+	* clear_plans - removes all plans from the registry
+	* load_wisdom - imports FFTW wisdom from WISDOM_FILEPATH
+	* save_wisdom - exports FFTW wisdom to WISDOM_FILEPATH
+
+ """
+
+
+# ===================================== IMPORTS ======================================== #
+
+import struct
+import threading
+import collections
+import numpy as np
+import pyfftw
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# effort used by FFTW to find a fast plan. FFTW_ESTIMATE plans almost instantly, while
+# FFTW_MEASURE and FFTW_PATIENT take longer to plan but produce faster FFTs.
+global PLANNER_EFFORT; PLANNER_EFFORT = "FFTW_ESTIMATE"
+
+# the planner efforts accepted by FFTW, from least to most effort
+global PLANNER_EFFORTS; PLANNER_EFFORTS = ["FFTW_ESTIMATE", "FFTW_MEASURE", "FFTW_PATIENT", "FFTW_EXHAUSTIVE"]
+
+# number of threads used by each FFT
+global FFTW_THREADS; FFTW_THREADS = 1
+
+# file that FFTW wisdom is saved to and loaded from. Note that if this script is imported
+# by the webserver, the path is relative to the webserver/ dir.
+global WISDOM_FILEPATH; WISDOM_FILEPATH = "../signal_processing/fftw_wisdom.bin"
+
+# the wisdom file holds the wisdom exported for each precision (see 
+# pyfftw.export_wisdom), each preceded by its length in bytes
+global WISDOM_LENGTH; WISDOM_LENGTH = struct.Struct("<Q")
+
+# maximum number of plans kept in the registry. Each plan owns aligned arrays the size of
+# the arrays it transforms, so the least recently used plans are removed. NB the webserver
+# plans 16 FFTs ahead of time (see webserver/main.py)
+global PLAN_CACHE_SIZE; PLAN_CACHE_SIZE = 32
+
+# registry mapping (shape, dtype, direction, threads) -> (plan, lock), ordered from least
+# to most recently used. The lock ensures that a plan, and the arrays it owns, is only 
+# used by one thread at a time
+global plans; plans = collections.OrderedDict()
+global plans_lock; plans_lock = threading.Lock()
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+def fft(a):
+	""" Computes the FFT along the last axis of an array using a cached plan.
+
+	Parameters
+	----------
+	a : numpy.ndarray
+		the array to transform. Real arrays are converted to complex.
+
+	Returns
+	-------
+	numpy.ndarray
+		the FFT of a
+	"""
+
+	return execute(a, "fft")
+
+
+def ifft(a, n=None):
+	""" Computes the inverse FFT along the last axis of an array using a cached plan.
+
+	Parameters
+	----------
+	a : numpy.ndarray
+		the array to transform
+	n : int, optional
+		number of components to transform. If the last axis of a is shorter, the 
+		remaining components are zero (e.g. an analytic signal can be obtained from only
+		its +'ve frequency components). Defaults to the length of the last axis of a.
+
+	Returns
+	-------
+	numpy.ndarray
+		the inverse FFT of a
+	"""
+
+	return execute(a, "ifft", n)
+
+
+def rfft(a):
+	""" Computes the FFT of a real array along its last axis using a cached plan.
+	
+	Only the non-negative frequency components are returned, as the remaining components
+	of the FFT of a real signal are the complex conjugates of these. This requires roughly
+	half the work and memory of a complex FFT.
+
+	Parameters
+	----------
+	a : numpy.ndarray
+		the real array to transform, with n samples along the last axis
+
+	Returns
+	-------
+	numpy.ndarray
+		the first n//2 + 1 components of the FFT of a
+	"""
+
+	return execute(a, "rfft")
+
+
+def irfft(a, n):
+	""" Computes a real array from the non-negative frequency components of its FFT (the 
+	inverse of rfft) using a cached plan.
+
+	Parameters
+	----------
+	a : numpy.ndarray
+		the first n//2 + 1 components of the FFT along the last axis
+	n : int
+		number of samples in the real array
+
+	Returns
+	-------
+	numpy.ndarray
+		the real array, with n samples along the last axis
+	"""
+
+	return execute(a, "irfft", n)
+
+
+def execute(a, direction, n=None):
+	""" Executes the cached plan for an array in the given direction.
+
+	The input is copied into the plan's own aligned array, and the result is copied out
+	again so that it is not overwritten when the plan is next executed. NB the input must
+	not be passed to the plan directly, as the plan may then keep the array as its own 
+	input array and overwrite it the next time it is executed.
+
+	Parameters
+	----------
+	a : numpy.ndarray
+		the array to transform
+	direction : str
+		one of "fft", "ifft", "rfft" or "irfft"
+	n : int, optional
+		number of samples in time domain along the last axis (see ifft and irfft). 
+		Defaults to the length of the last axis of a.
+
+	Returns
+	-------
+	numpy.ndarray
+		the transformed array
+	"""
+
+	a = np.asarray(a)
+
+	if(n is None):
+		n = a.shape[-1]
+
+	# single precision input is kept in single precision, everything else is double. The
+	# input to a real FFT is real, while all other FFTs take complex input
+	single = a.dtype in (np.float32, np.complex64)
+	
+	if(direction == "rfft"):
+		dtype = np.dtype(np.float32 if single else np.float64)
+	else:
+		dtype = np.dtype(np.complex64 if single else np.complex128)
+
+	plan, lock = get_plan(a.shape[:-1] + (n,), dtype, direction)
+
+	with lock:
+		# any components missing from an inverse FFT are zero
+		if(direction == "ifft" and a.shape[-1] < n):
+			plan.input_array[..., :a.shape[-1]] = a
+			plan.input_array[..., a.shape[-1]:] = 0
+		else:
+			plan.input_array[...] = a
+		
+		return plan().copy()
+
+
+def get_plan(shape, dtype, direction):
+	""" Returns the cached plan for a given shape, data type and direction.
+
+	A new plan is created using PLANNER_EFFORT and FFTW_THREADS if one does not already
+	exist, removing the least recently used plan if there are more than PLAN_CACHE_SIZE.
+
+	Parameters
+	----------
+	shape : tuple
+		shape of the arrays in time domain - the transform is along the last axis. For 
+		"irfft", this is the shape of the output, and the input only has the first 
+		n//2 + 1 components along its last axis.
+	dtype : numpy.dtype
+		data type of the arrays to transform - real for "rfft", else complex
+	direction : str
+		one of "fft", "ifft", "rfft" or "irfft"
+
+	Returns
+	-------
+	pyfftw.FFTW
+		the plan
+	threading.Lock
+		lock that must be held while executing the plan
+	"""
+
+	key = (tuple(shape), np.dtype(dtype).str, direction, FFTW_THREADS)
+
+	with plans_lock:
+		if(key in plans):
+			plans.move_to_end(key)
+
+		else:
+
+			if(direction == "fft"):
+				builder = pyfftw.builders.fft
+			elif(direction == "ifft"):
+				builder = pyfftw.builders.ifft
+			elif(direction == "rfft"):
+				builder = pyfftw.builders.rfft
+			elif(direction == "irfft"):
+				builder = pyfftw.builders.irfft
+			else:
+				raise ValueError("FFT direction not recognised: {}".format(direction))
+
+			if(direction == "irfft"):
+				a = pyfftw.empty_aligned(tuple(shape[:-1]) + (shape[-1]//2 + 1,), dtype=dtype)
+				plan = builder(a, n=shape[-1], planner_effort=PLANNER_EFFORT, threads=FFTW_THREADS)
+			else:
+				a = pyfftw.empty_aligned(shape, dtype=dtype)
+				plan = builder(a, planner_effort=PLANNER_EFFORT, threads=FFTW_THREADS)
+
+			plans[key] = (plan, threading.Lock())
+
+			# evict least recently used plans
+			while(len(plans) > PLAN_CACHE_SIZE):
+				plans.popitem(last=False)
+
+		return plans[key]
+
+
+def set_planner_effort(effort):
+	""" Sets the effort used by FFTW when creating new plans.
+
+	Existing plans are removed from the registry so that they are created again using the
+	new effort.
+
+	Parameters
+	----------
+	effort : str
+		one of "FFTW_ESTIMATE", "FFTW_MEASURE", "FFTW_PATIENT" or "FFTW_EXHAUSTIVE"
+
+	Raises
+	------
+	ValueError
+		If the planner effort is not recognised
+	"""
+
+	if(effort not in PLANNER_EFFORTS):
+		raise ValueError("Planner effort not recognised: {}".format(effort))
+
+	global PLANNER_EFFORT; PLANNER_EFFORT = effort
+
+	clear_plans()
+
+
+def warm_up(shapes):
+	""" Creates forward, inverse, real forward and real inverse plans for a list of array 
+	shapes ahead of time.
+
+	Parameters
+	----------
+	shapes : list
+		the shapes of the arrays that will be transformed, e.g. [(6200,), (8, 6200)]
+	"""
+
+	for shape in shapes:
+		get_plan(shape, np.complex128, "fft")
+		get_plan(shape, np.complex128, "ifft")
+		get_plan(shape, np.float64, "rfft")
+		get_plan(shape, np.complex128, "irfft")
+
+
+def clear_plans():
+	""" Removes all plans from the registry. """
+
+	with plans_lock:
+		plans.clear()
+
+
+def load_wisdom(filepath=None):
+	""" Imports FFTW wisdom from a file.
+
+	Parameters
+	----------
+	filepath : str, optional
+		file to load the wisdom from. Defaults to WISDOM_FILEPATH.
+
+	Returns
+	-------
+	bool
+		True if the wisdom was loaded, False if the file does not exist, could not be 
+		read, or is not in the format written by save_wisdom
+	"""
+
+	if(filepath is None):
+		filepath = WISDOM_FILEPATH
+
+	try:
+		with open(filepath, "rb") as file:
+			data = file.read()
+	except OSError:
+		return False
+
+	wisdom = []
+	offset = 0
+
+	while(offset < len(data)):
+		if(offset + WISDOM_LENGTH.size > len(data)):
+			return False
+
+		length, = WISDOM_LENGTH.unpack_from(data, offset)
+		offset += WISDOM_LENGTH.size
+
+		if(offset + length > len(data)):
+			return False
+
+		wisdom.append(data[offset:offset + length])
+		offset += length
+
+	if(len(wisdom) != len(pyfftw.export_wisdom())):
+		return False
+
+	pyfftw.import_wisdom(tuple(wisdom))
+
+	return True
+
+
+def save_wisdom(filepath=None):
+	""" Exports FFTW wisdom to a file.
+
+	Parameters
+	----------
+	filepath : str, optional
+		file to save the wisdom to. Defaults to WISDOM_FILEPATH.
+	"""
+
+	if(filepath is None):
+		filepath = WISDOM_FILEPATH
+
+	with open(filepath, "wb") as file:
+		for wisdom in pyfftw.export_wisdom():
+			file.write(WISDOM_LENGTH.pack(len(wisdom)))
+			file.write(wisdom)
+
+
+
+# ====================================== END =========================================== #
@@ -0,0 +1,321 @@
+""" Integrates (averages) consecutive pings to reduce noise in 2D sonar images.
+
+The echo from a distant target is weak, so a single ping gives a noisy image at long
+range. Averaging N pings reduces the noise power by up to a factor of N. Two kinds of
+integration are provided:
+
+	1) coherent - the range profiles of consecutive pings are averaged before coherent
+	summing. This gives the largest gain, but requires that the phase of each echo is
+	stable from ping to ping (i.e. a static scene and sonar).
+
+	2) incoherent - the magnitude of the beamformed image |z| of consecutive pings is
+	averaged. This does not depend on the phase of the echoes, but gives less gain.
+
+Both use a running accumulator, so each new ping costs a fixed amount of work regardless
+of how many pings are integrated, and the memory used is bounded:
+
+	* sliding window - the average of (about) the last `window` pings. The window is split
+	into at most INTEGRATION_BLOCKS blocks, and only the sum of each block is stored. When
+	the window is full, the oldest block is removed, so the average covers between
+	window - window/INTEGRATION_BLOCKS + 1 and window pings (exactly window pings if
+	window <= INTEGRATION_BLOCKS).
+
+	* exponential moving average - each new ping is weighted by (1 - decay), and the
+	previous average by decay. Only the average is stored.
+
+An accumulator is reset automatically if the shape or axes of what it integrates change
+(e.g. if the sample rate or the region of interest changes).
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	numpy
+
+This file can also be imported as a module and contains the following functions:
+
+	* get_integrator - returns the integrator for a set of integration settings, which
+	keeps its running accumulator between calls
+	* clear_integrators - removes all integrators, and their accumulators
+
+ """
+
+
+# ===================================== IMPORTS ======================================== #
+
+import collections
+import math
+import threading
+import numpy as np
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# kinds of integration - see module doc string
+global INTEGRATION_MODES; INTEGRATION_MODES = ["coherent", "incoherent"]
+
+# maximum number of blocks a sliding window is split into. The memory used by a sliding
+# window is at most INTEGRATION_BLOCKS + 1 arrays, regardless of the window length.
+global INTEGRATION_BLOCKS; INTEGRATION_BLOCKS = 8
+
+# maximum number of integrators (i.e. distinct integration settings) kept by
+# get_integrator - least recently used is removed first
+global INTEGRATOR_CACHE_SIZE; INTEGRATOR_CACHE_SIZE = 4
+
+# integrators kept between calls, keyed by their settings
+global integrators; integrators = collections.OrderedDict()
+global integrators_lock; integrators_lock = threading.Lock()
+
+
+# ================================= CLASS DEFINITIONS ================================== #
+
+
+class RunningAverage:
+	"""Running average of arrays, over a sliding window or with exponential decay.
+
+	Exactly one of window or decay must be given.
+
+	Attributes
+	----------
+	window : int or None
+		number of most recent arrays averaged over
+	decay : float or None
+		weight of the previous average when a new array is added
+	count : int
+		number of arrays currently included in the average (for a sliding window), or
+		added since the last reset (for exponential decay)
+	"""
+	def __init__(self, window=None, decay=None):
+		"""
+		Parameters
+		----------
+		window : int, optional
+			number of most recent arrays averaged over (at least 1)
+		decay : float, optional
+			weight of the previous average when a new array is added (0 <= decay < 1)
+
+		Raises
+		------
+		ValueError
+			If neither or both of window and decay are given, or either is out of range
+		"""
+
+		if((window is None) == (decay is None)):
+			raise ValueError("Exactly one of window and decay must be given")
+
+		if(window is not None and window < 1):
+			raise ValueError("Integration window must be at least 1 ping")
+
+		if(decay is not None and not 0 <= decay < 1):
+			raise ValueError("Integration decay must satisfy 0 <= decay < 1")
+
+		self.window = window
+		self.decay = decay
+		self.lock = threading.Lock()
+		self.reset()
+
+
+	def reset(self):
+		""" removes all arrays from the average """
+
+		self.key = None
+		self.count = 0
+		self.average = None
+
+		# sliding window only - (sum, count) of each full block, and of the current block
+		if(self.window is not None):
+			self.block_size = math.ceil(self.window / INTEGRATION_BLOCKS)
+			self.blocks = collections.deque()
+			self.current_sum = None
+			self.current_count = 0
+
+
+	def update(self, x, key=None):
+		"""Adds an array to the average, and returns the new average.
+
+		Parameters
+		----------
+		x : numpy.ndarray
+			the array to add
+		key : hashable, optional
+			identifies what x represents (e.g. its axes). If the key or the shape of x
+			differs from the previous array, the average is reset first.
+
+		Returns
+		-------
+		numpy.ndarray
+			the average including x
+		"""
+
+		x = np.asarray(x)
+
+		with self.lock:
+			if(self.average is not None and (key != self.key or x.shape != self.average.shape)):
+				self.reset()
+
+			self.key = key
+
+			if(self.decay is not None):
+				self.add_decay(x)
+			else:
+				self.add_window(x)
+
+			return self.average.copy()
+
+
+	def add_decay(self, x):
+		""" adds an array to the exponential moving average """
+
+		if(self.average is None):
+			self.average = x.astype(np.result_type(x, float))
+		else:
+			self.average = self.decay * self.average + (1 - self.decay) * x
+
+		self.count += 1
+
+
+	def add_window(self, x):
+		""" adds an array to the sliding window, removing the oldest block once full """
+
+		if(self.current_count == 0):
+			self.current_sum = x.astype(np.result_type(x, float))
+		else:
+			self.current_sum = self.current_sum + x
+
+		self.current_count += 1
+		self.count += 1
+
+		if(self.current_count == self.block_size):
+			self.blocks.append((self.current_sum, self.current_count))
+			self.current_sum = None
+			self.current_count = 0
+
+		while(self.count > self.window):
+			self.count -= self.blocks.popleft()[1]
+
+		# the total is summed from the blocks (at most INTEGRATION_BLOCKS + 1), rather
+		# than updated by subtracting the oldest block, so that rounding errors do not
+		# build up
+		total = sum(block_sum for block_sum, block_count in self.blocks)
+
+		if(self.current_count > 0):
+			total = total + self.current_sum
+
+		self.average = total / self.count
+
+
+
+class PingIntegrator:
+	"""Integrates consecutive pings, either coherently or incoherently.
+
+	Coherent integration averages the range profiles (see integrate_range_profiles) and
+	incoherent integration averages the magnitude of the image (see integrate_image). The
+	other method returns its input unchanged, so both can always be called.
+
+	Attributes
+	----------
+	mode : str
+		"coherent" or "incoherent"
+	accumulator : RunningAverage
+		running average of the range profiles or image magnitudes
+	"""
+	def __init__(self, mode, window=None, decay=None):
+		"""
+		Parameters
+		----------
+		mode : str
+			"coherent" or "incoherent"
+		window, decay
+			see RunningAverage
+
+		Raises
+		------
+		ValueError
+			If the mode is not recognised, or see RunningAverage
+		"""
+
+		if(mode not in INTEGRATION_MODES):
+			raise ValueError("Integration mode must be one of {}".format(", ".join(INTEGRATION_MODES)))
+
+		self.mode = mode
+		self.accumulator = RunningAverage(window, decay)
+
+
+	def integrate_range_profiles(self, range_profiles, ctx):
+		""" returns the average of the range profiles of recent pings (coherent mode), or
+		the range profiles unchanged (incoherent mode) """
+
+		if(self.mode != "coherent"):
+			return range_profiles
+
+		return self.accumulator.update(range_profiles, (ctx.profile_Δt, ctx.fc))
+
+
+	def integrate_image(self, z, ctx):
+		""" returns the average magnitude of the image of recent pings (incoherent mode),
+		or the image unchanged (coherent mode) """
+
+		if(self.mode != "incoherent"):
+			return z
+
+		return self.accumulator.update(np.abs(z), (ctx.rad[0], ctx.rad[-1], ctx.azm[0], ctx.azm[-1]))
+
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+def get_integrator(mode, window=None, decay=None, source=None):
+	"""Returns the integrator for a set of integration settings.
+
+	The same integrator is returned each time the same settings are given, so that its
+	running accumulator carries over from one ping (or web request) to the next. At most
+	INTEGRATOR_CACHE_SIZE integrators are kept, removing the least recently used.
+
+	Parameters
+	----------
+	mode : str
+		"coherent" or "incoherent"
+	window : int, optional
+		number of most recent pings integrated over (sliding window)
+	decay : float, optional
+		weight of the previous average when a new ping is integrated (exponential moving
+		average). Exactly one of window and decay must be given.
+	source : hashable, optional
+		identifies where the pings come from (e.g. simulated or real), so that pings from
+		different sources are not integrated together
+
+	Returns
+	-------
+	PingIntegrator
+		the integrator for these settings
+
+	Raises
+	------
+	ValueError
+		If the settings are not valid
+	"""
+
+	key = (mode, window, decay, source)
+
+	with integrators_lock:
+		if(key in integrators):
+			integrators.move_to_end(key)
+			return integrators[key]
+
+		integrator = PingIntegrator(mode, window, decay)
+		integrators[key] = integrator
+
+		while(len(integrators) > INTEGRATOR_CACHE_SIZE):
+			integrators.popitem(last=False)
+
+		return integrator
+
+
+def clear_integrators():
+	""" removes all integrators, and their running accumulators """
+
+	with integrators_lock:
+		integrators.clear()
+
+
+
+# ====================================== END =========================================== #
@@ -0,0 +1,187 @@
+""" Provides compiled kernels for the most memory intensive signal processing steps.
+
+The vectorised NumPy implementations of coherent summing and the compensation steps
+create temporary arrays the size of their inputs (e.g. a value for every receiver and
+grid position in coherent summing). The kernels in this script instead loop over each
+element and accumulate the result directly, and are compiled by Numba with the loop over
+range bins (or receivers) split between threads using prange.
+
+Numba is an optional dependency. If it is installed, the kernels are compiled the first
+time they are called (or when warm_up is called), and the compiled code is cached on disk
+so that later runs only need to load it. If it is not installed, NUMBA_AVAILABLE is False
+and the kernels are ordinary Python functions - these produce the same results and can be
+used to check the kernels, but are far too slow for imaging, so sonar_processing only
+uses the kernels if NUMBA_AVAILABLE is True.
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	numpy, numba (optional)
+
+This file can also be imported as a module and contains the following functions:
+
+	* coherent_sum - sums the value at the delay index of each receiver for every grid
+	position
+	* compensate - circularly shifts each row of an array and multiplies it by a factor
+	* scale_columns - multiplies each column of an array by a factor
+	* warm_up - compiles every kernel ahead of time
+
+ """
+
+
+# ===================================== IMPORTS ======================================== #
+
+import numpy as np
+
+try:
+	import numba
+except ImportError:
+	numba = None
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# true if numba is installed, and the kernels are compiled
+global NUMBA_AVAILABLE; NUMBA_AVAILABLE = numba is not None
+
+# the kernels are compiled with parallel loops and cached on disk if numba is installed,
+# else they are left as Python functions with prange replaced by range
+if(NUMBA_AVAILABLE):
+	jit = numba.njit(parallel=True, cache=True)
+	prange = numba.prange
+else:
+	jit = lambda func: func
+	prange = range
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+@jit
+def coherent_sum(range_profiles, index, steering, num_ranges):
+	""" Sums the value at the delay index of each receiver for every grid position.
+
+	This is equivalent to np.sum(range_profiles[n, index] * steering, axis=0) for the
+	first num_ranges range bins (see sonar_processing.coherent_summing), but does not
+	create an array containing the value of every receiver. The range bins are split
+	between threads. NB the indices are not bounds checked.
+
+	Parameters
+	----------
+	range_profiles : numpy.ndarray
+		2D complex array containing the range profile of each receiver
+	index : numpy.ndarray
+		index into each range profile, with shape (receiver, angle, range)
+	steering : numpy.ndarray
+		complex phase compensation and aperture taper, with shape (receiver, angle, range)
+	num_ranges : int
+		number of range bins (from the first) to sum
+
+	Returns
+	-------
+	numpy.ndarray
+		2D complex array of sums, accessed as [angle][range]
+	"""
+
+	num_recievers = index.shape[0]
+	num_angles = index.shape[1]
+
+	z = np.zeros((num_angles, num_ranges), dtype=np.complex128)
+
+	for r in prange(num_ranges):
+		for a in range(num_angles):
+			total = 0j
+			for n in range(num_recievers):
+				total += range_profiles[n, index[n, a, r]] * steering[n, a, r]
+			z[a, r] = total
+
+	return z
+
+
+@jit
+def compensate(xt, shift, factors):
+	""" Circularly shifts each row of an array and multiplies it by a factor.
+
+	This is equivalent to np.roll(xt, shift, axis=-1) * factors[:, None] (see
+	sonar_processing.non_ideal_compensation), computed in a single pass. The rows are
+	split between threads.
+
+	Parameters
+	----------
+	xt : numpy.ndarray
+		2D complex array, with one signal in each row
+	shift : int
+		number of samples to shift each row by
+	factors : numpy.ndarray
+		complex factor for each row
+
+	Returns
+	-------
+	numpy.ndarray
+		the shifted and scaled array
+	"""
+
+	num_rows = xt.shape[0]
+	num_samples = xt.shape[1]
+
+	yt = np.empty((num_rows, num_samples), dtype=np.complex128)
+
+	for i in prange(num_rows):
+		for k in range(num_samples):
+			yt[i, (k + shift) % num_samples] = xt[i, k] * factors[i]
+
+	return yt
+
+
+@jit
+def scale_columns(xt, factors):
+	""" Multiplies each column of an array by a factor.
+
+	This is equivalent to xt * factors (see sonar_processing.range_compensation). The
+	columns are split between threads.
+
+	Parameters
+	----------
+	xt : numpy.ndarray
+		2D complex array, with one signal in each row
+	factors : numpy.ndarray
+		real factor for each column
+
+	Returns
+	-------
+	numpy.ndarray
+		the scaled array
+	"""
+
+	num_rows = xt.shape[0]
+	num_samples = xt.shape[1]
+
+	yt = np.empty((num_rows, num_samples), dtype=np.complex128)
+
+	for k in prange(num_samples):
+		for i in range(num_rows):
+			yt[i, k] = xt[i, k] * factors[k]
+
+	return yt
+
+
+def warm_up():
+	""" Compiles every kernel ahead of time by calling it with small arrays.
+
+	Numba compiles a kernel the first time it is called with each combination of argument
+	types, which can take several seconds. Calling this function when a web server starts
+	ensures the first request does not pay this cost. Does nothing if numba is not
+	installed.
+	"""
+
+	if(not NUMBA_AVAILABLE):
+		return
+
+	xt = np.zeros((2, 4), dtype=np.complex128)
+
+	coherent_sum(xt, np.zeros((2, 3, 3), dtype=np.int64), np.zeros((2, 3, 3), dtype=np.complex128), 3)
+	compensate(xt, 1, np.ones(2, dtype=np.complex128))
+	scale_columns(xt, np.ones(4))
+
+
+
+# ====================================== END =========================================== #
@@ -0,0 +1,326 @@
+""" Records receive signals to a binary file on a background thread.
+
+Recording a receive signal used to format every sample as text and write it to a file on
+the same thread that processes the ping, and each recording replaced the previous one.
+Instead, record hands a copy of the samples to a writer thread and returns immediately,
+and the writer appends each receive signal to the end of a binary file, so that every
+recording is kept.
+
+So that recording every ping cannot fill the disk, a recording file is rotated once it
+would grow beyond MAX_RECORDING_BYTES: it is renamed with the number 1 before its
+extension (e.g. recorded_RX_signal.1.bin), any older files are renumbered, the oldest is
+deleted once there are more than RECORDING_BACKUPS of them, and a new file is started.
+The records of a ping are never split between files.
+
+Each receive signal is stored as a record made up of a fixed size header followed by its
+samples:
+
+	magic         4 bytes     b"SRX1" - marks the start of each record
+	timestamp     float64     time the signal was recorded [seconds since the epoch]
+	sample_rate   float64     sample rate of the signal [Hz]
+	channel       uint16      receiver that captured the signal
+	num_samples   uint32      number of samples that follow
+	samples       float32     num_samples samples of the receive signal [volts]
+
+All values are little-endian. As each record is self-contained, recordings can be appended
+to an existing file, and the file can be read (see read_recordings) even if the last
+record was only partly written.
+
+If the writer thread falls behind, at most RECORDER_QUEUE_SIZE pings (i.e. calls to
+record) wait to be written, after which the receive signals of further pings are dropped
+(and counted) rather than delaying the processing of the ping.
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	numpy
+
+This file can also be imported as a module and contains the following functions:
+
+	* record - queues receive signals to be appended to a recording file
+	* flush - waits until every queued receive signal has been written
+	* recorder_stats - returns the number of signals written and dropped
+	* rotate_recording - renames a full recording file, and deletes the oldest files
+	* read_recordings - reads every record in a recording file
+	* export_recording - saves a single recorded receive signal as a text file
+
+ """
+
+
+# ===================================== IMPORTS ======================================== #
+
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# header of each record - see module doc string
+global RECORD_MAGIC; RECORD_MAGIC = b"SRX1"
+global RECORD_HEADER; RECORD_HEADER = struct.Struct("<4sddHI")
+
+# data type of the recorded samples
+global RECORD_DTYPE; RECORD_DTYPE = np.dtype("<f4")
+
+# maximum number of pings waiting to be written - further pings are dropped
+global RECORDER_QUEUE_SIZE; RECORDER_QUEUE_SIZE = 64
+
+# size a recording file may grow to before it is rotated [bytes] (see module doc string).
+# If None, recording files are never rotated.
+global MAX_RECORDING_BYTES; MAX_RECORDING_BYTES = 100 * 2**20
+
+# number of rotated recording files kept, in addition to the file being written to
+global RECORDING_BACKUPS; RECORDING_BACKUPS = 4
+
+# pings waiting to be written, as (filepath, headers, samples), and the thread that writes
+# them - created when first used
+global recorder_queue; recorder_queue = queue.Queue(maxsize=RECORDER_QUEUE_SIZE)
+global recorder_thread; recorder_thread = None
+global recorder_lock; recorder_lock = threading.Lock()
+
+# number of receive signals written and dropped, and the most recent write error
+global recorder_counts; recorder_counts = {"written": 0, "dropped": 0, "error": None}
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+def record(filepath, samples, sample_rate, channels=0):
+	"""Queues receive signals to be appended to a recording file by the writer thread.
+
+	The samples are copied, so the caller may reuse its array as soon as this function
+	returns. If the queue is full, the receive signals are dropped. All receive signals 
+	given are recorded with the same timestamp.
+
+	Parameters
+	----------
+	filepath : string
+		recording file the receive signals are appended to. It is created if it does not
+		exist.
+	samples : numpy.ndarray
+		receive signal, or 2D array containing the receive signal of each receiver in its
+		rows
+	sample_rate : float
+		sample rate of the receive signals [Hz]
+	channels : int or numpy.ndarray, optional
+		receiver that captured each receive signal
+
+	Returns
+	-------
+	bool
+		true if the receive signals were queued, false if they were dropped
+	"""
+
+	samples = np.atleast_2d(samples)
+	channels = np.broadcast_to(channels, len(samples))
+	timestamp = time.time()
+
+	headers = [RECORD_HEADER.pack(RECORD_MAGIC, timestamp, float(sample_rate), int(channel), samples.shape[-1]) for channel in channels]
+
+	start_writer()
+
+	try:
+		recorder_queue.put_nowait((filepath, headers, samples.astype(RECORD_DTYPE)))
+	except queue.Full:
+		with recorder_lock:
+			recorder_counts["dropped"] += len(samples)
+		return False
+
+	return True
+
+
+def start_writer():
+	"""Starts the writer thread, if it is not already running."""
+
+	global recorder_thread
+
+	with recorder_lock:
+		if(recorder_thread is None):
+			recorder_thread = threading.Thread(target=write_recordings, name="rx-recorder", daemon=True)
+			recorder_thread.start()
+
+
+def write_recordings():
+	"""Appends queued receive signals to their recording files until the program exits.
+
+	Runs on the writer thread. The recording file is kept open between pings, is flushed
+	whenever the queue is empty, and is rotated before writing a ping that would take it
+	beyond MAX_RECORDING_BYTES.
+	"""
+
+	file = None
+
+	while(True):
+		filepath, headers, samples = recorder_queue.get()
+
+		try:
+			if(file is not None and file.name != filepath):
+				file.close()
+				file = None
+
+			if(file is None):
+				directory = os.path.dirname(filepath)
+				if(directory != ""):
+					os.makedirs(directory, exist_ok=True)
+
+				file = open(filepath, "ab")
+
+			# the file is opened in append mode, so tell gives its size (including any
+			# records written by a previous run)
+			num_bytes = len(headers) * RECORD_HEADER.size + samples.nbytes
+
+			if(MAX_RECORDING_BYTES is not None and 0 < file.tell() and MAX_RECORDING_BYTES < file.tell() + num_bytes):
+				file.close()
+				rotate_recording(filepath)
+				file = open(filepath, "ab")
+
+			for header, signal in zip(headers, samples):
+				file.write(header)
+				file.write(signal.tobytes())
+
+			if(recorder_queue.empty()):
+				file.flush()
+
+			with recorder_lock:
+				recorder_counts["written"] += len(headers)
+
+		except OSError as e:
+			with recorder_lock:
+				recorder_counts["error"] = str(e)
+
+			if(file is not None):
+				file.close()
+
+			file = None
+
+		finally:
+			recorder_queue.task_done()
+
+
+def rotate_recording(filepath):
+	"""Renames a recording file with the number 1 before its extension, so that a new
+	file can be started in its place.
+
+	Files rotated earlier are renumbered (1 becomes 2, and so on), and the oldest is
+	deleted so that at most RECORDING_BACKUPS rotated files are kept. If RECORDING_BACKUPS
+	is 0, the recording file is deleted.
+
+	Parameters
+	----------
+	filepath : string
+		recording file to rotate. It must exist.
+	"""
+
+	root, extension = os.path.splitext(filepath)
+	backup = lambda number: "{}.{}{}".format(root, number, extension)
+
+	if(RECORDING_BACKUPS < 1):
+		os.remove(filepath)
+		return
+
+	# the oldest file is replaced by the one before it
+	for number in range(RECORDING_BACKUPS - 1, 0, -1):
+		if(os.path.exists(backup(number))):
+			os.replace(backup(number), backup(number + 1))
+
+	os.replace(filepath, backup(1))
+
+
+def flush():
+	"""Waits until every queued receive signal has been written to its recording file."""
+
+	recorder_queue.join()
+
+
+def recorder_stats():
+	"""Returns the number of receive signals written and dropped, and the most recent
+	write error (or None), as a dictionary."""
+
+	with recorder_lock:
+		return dict(recorder_counts)
+
+
+def read_recordings(filepath):
+	"""Reads every record in a recording file.
+
+	A partly written record at the end of the file (e.g. if the program exited while
+	writing) is ignored. Only the given file is read - older records may be in rotated
+	files (see rotate_recording).
+
+	Parameters
+	----------
+	filepath : string
+		recording file written by record
+
+	Returns
+	-------
+	list
+		(timestamp, sample_rate, channel, samples) of each record, in the order they were
+		recorded
+
+	Raises
+	------
+	ValueError
+		If the file does not contain records in the expected format
+	"""
+
+	with open(filepath, "rb") as file:
+		data = file.read()
+
+	records = []
+	offset = 0
+
+	while(offset + RECORD_HEADER.size <= len(data)):
+		magic, timestamp, sample_rate, channel, num_samples = RECORD_HEADER.unpack_from(data, offset)
+
+		if(magic != RECORD_MAGIC):
+			raise ValueError("Format of recording not recognised: no record found at byte {}".format(offset))
+
+		offset += RECORD_HEADER.size
+		end = offset + num_samples * RECORD_DTYPE.itemsize
+
+		if(end > len(data)):
+			break
+
+		samples = np.frombuffer(data, dtype=RECORD_DTYPE, count=num_samples, offset=offset)
+		records.append((timestamp, sample_rate, channel, samples.astype(float)))
+
+		offset = end
+
+	return records
+
+
+def export_recording(filepath, text_filepath, index=-1, channel=None):
+	"""Saves a single recorded receive signal as a text file, with one sample per line.
+
+	This is the format of the text file that a recorded receive signal is loaded from to
+	be used as the transmitted chirp (see sonar_processing.RX_LOAD_FILEPATH).
+
+	Parameters
+	----------
+	filepath : string
+		recording file written by record
+	text_filepath : string
+		text file the receive signal is saved to
+	index : int, optional
+		index of the record to save, counting only records from channel (if given).
+		Defaults to the most recent record.
+	channel : int, optional
+		if given, only records from this receiver are counted
+
+	Raises
+	------
+	IndexError
+		If there is no record at index
+	"""
+
+	records = [r for r in read_recordings(filepath) if channel is None or r[2] == channel]
+
+	np.savetxt(text_filepath, records[index][3], delimiter=',')
+
+
+
+# ====================================== END =========================================== #
@@ -32,6 +32,15 @@ discussed briefly below:
 		
 			* generate_2D_image
 
+		The following function can be called to generate a 2D image from coarse to fine
+		using either mode, yielding an image at each level:
+		
+			* generate_2D_image_progressive
+
+The functions that use real data request it from the connected microcontroller by 
+default, but can instead be given another source of sonar data, such as pings replayed 
+from a capture archive (see request_sonar_data and capture_archive.ReplaySource).
+
 
 This script was designed be run directly from the terminal, or run indirectly by a web 
 server.	
@@ -39,7 +48,18 @@ server.
 This script requires that the following libraries be installed  within the Python 
 environment you are running this script in:
 
-	matplotlib, numpy, pyfftw, teensy_interface
+	matplotlib, numpy, pyfftw, fftw_plans, numba_kernels, teensy_interface, rx_recorder, 
+	capture_archive
+
+Each signal processing step takes the parameters it needs (axes, chirp parameters, scene
+geometry and calibration) from an immutable ProcessingContext, so that pings can be 
+processed by multiple threads at once. If no context is provided, a snapshot of the global
+variables is used. The following functions create a context:
+
+	* global_context
+	* ProcessingContext.with_sample_rate
+	* ProcessingContext.with_options
+	* ProcessingContext.with_region
 
 This file can also be imported to provide the following individual signal processing 
 steps:
@@ -53,8 +73,14 @@ steps:
 	* apply_window_function
 	* to_baseband
 	* non_ideal_compensation
+	* decimate
+	* upsample
 	* range_compensation
 	* coherent_summing
+	* integrated_coherent_summing
+	* progressive_coherent_summing
+	* far_field_summing
+	* tiled_coherent_summing
 	
  """
 
@@ -68,13 +94,24 @@ import matplotlib;
 matplotlib.use('agg')
 
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.ticker import FormatStrFormatter
 import random
 import numpy as np
-import pyfftw
+import fftw_plans
+import numba_kernels
 import math
 import time
+import os
+import atexit
+import hashlib
+import collections
+import threading
+import concurrent.futures
+from multiprocessing import shared_memory
 import teensy_interface
+import rx_recorder
+import capture_archive
 
 
 # ================================= GLOBAL VARIABLES =================================== #
@@ -125,6 +162,11 @@ global FIELD_OF_VIEW; FIELD_OF_VIEW = 29
 global rad; rad = np.linspace(0, r_max, 150)
 global azm; azm = np.linspace(-FIELD_OF_VIEW*np.pi/180, FIELD_OF_VIEW*np.pi/180, 150)
 
+# maximum number of grid positions (range bins x azimuth angles) in a region of interest 
+# (see ProcessingContext.with_region). The geometry of each position takes 24 bytes per
+# receiver, so a much denser grid could exhaust the memory of the server.
+global MAX_REGION_POSITIONS; MAX_REGION_POSITIONS = 1000*1000
+
 # the origin (0,0) is defined as the location of the transmitter 
 global transmit_coord; transmit_coord = (0.0,0.0)
 
@@ -132,13 +174,186 @@ global transmit_coord; transmit_coord = (0.0,0.0)
 global reciever_spacing; reciever_spacing = 0.01 
 
 global reciever_coords; reciever_coords = [(reciever_spacing*3.5, 3*np.pi/2),(reciever_spacing*2.5, 3*np.pi/2),(reciever_spacing*1.5, 3*np.pi/2),(reciever_spacing*0.5, 3*np.pi/2),(reciever_spacing*0.5, np.pi/2),(reciever_spacing*1.5, np.pi/2),(reciever_spacing*2.5, np.pi/2),(reciever_spacing*3.5, np.pi/2)]
+# window function applied to receivers to reduce side-lobes in azimuth plane
+global appature_window; appature_window = [0.5, 0.8,0.95,1,1,0.95,0.8, 0.5]
+#global appature_window; appature_window = [1,1,1,1,1,1,1,1]
+
 global target_coords; target_coords = [(5 , 10*np.pi/180),(8.5 , 0*np.pi/180)] 						# global target_coords; target_coords = [(4,10*np.pi/180),(5,10*np.pi/180),(6,10*np.pi/180),(7,10*np.pi/180),(5.5,10*np.pi/180)] 
 
 
+# CALIBRATION
+
+# phase and gain compensation factors for each receiver, assumes 8 receivers. These were
+# determined by placing a corner reflector 2m away from the sonar directly on boresight 
+# (see non_ideal_compensation). Phase factors are in radians.
+global phase_comp_factors; phase_comp_factors = [-2.077,-2.7717,0.1492,-0.803,1.2544,1.2544,0.1028,2.4675] #phase_comp_factors = [-0.856, -1.329, 1.693, 1.054, 3.171, -2.967, 2.302, -1.429] #comp_factors = [1.3451, -2.479, 2.368, 2.429, -2.940, -2.639, 2.510, -0.977] #comp_factors = [2.0, -2.1, 2.6, 2.7, -2.1, -2.2, 3.0, -0.7] #comp_factors = [-0.1707, 0.5777, -0.9882,-0.9321, -2.5832, 0.4118, -0.5452, 1.9282] #comp_factors = [1.3451, 0.3382, 2.368, 2.429, -2.940, -2.639, 2.510, -0.977]
+global gain_comp_factors; gain_comp_factors = [1/0.0866,1/0.1009,1/0.07615,1/0.0839,1/0.06921,1/0.06902,1/0.0906,1/0.08533]
+
+
+# CACHES
+
+# the reference chirp, fused responses and beamforming geometry are computed once and 
+# cached, keyed by the parameters they depend on, so that they can be shared between all 
+# the pings (and threads) that use the same parameters. This lock protects all the caches.
+global cache_lock; cache_lock = threading.Lock()
+
+
+# FUSED PROCESSING
+
+# if fused processing is active, the steps from pulse compression through to range 
+# compensation are combined into a single frequency response and a single time domain 
+# multiplier, which are precomputed and cached (see fused_processing). The stage-by-stage
+# processing is still used in debug mode so that the intermediate plots can be saved.
+global FUSED_PROCESSING; FUSED_PROCESSING = False
+
+# maximum number of fused responses kept in memory - least recently used is evicted first
+global FUSED_CACHE_SIZE; FUSED_CACHE_SIZE = 8
+
+# in-memory cache mapping fused response key -> (Hw, mt, rt)
+global fused_cache; fused_cache = collections.OrderedDict()
+
+
+# DECIMATION
+
+# after basebanding, the signal only occupies the bandwidth B around 0 Hz, but is still
+# sampled at fs. If the decimation factor is greater than 1, the basebanded signal is 
+# low-pass filtered and only every DECIMATION_FACTOR-th sample is kept, so that range 
+# compensation, coherent summing and storing the range profiles all work on fewer 
+# samples (see decimate). The decimated sample rate fs/DECIMATION_FACTOR must be at least
+# the bandwidth B.
+global DECIMATION_FACTOR; DECIMATION_FACTOR = 1
+
+# half the length of the anti-alias filter, in decimated samples. A longer filter has a 
+# sharper cut-off, allowing a larger decimation factor for the same bandwidth. 
+global DECIMATION_FILTER_SPAN; DECIMATION_FILTER_SPAN = 16
+
+# maximum number of anti-alias filters kept in memory - least recently used is evicted 
+# first
+global DECIMATION_CACHE_SIZE; DECIMATION_CACHE_SIZE = 4
+
+# in-memory cache mapping anti-alias filter key -> frequency response of filter
+global decimation_cache; decimation_cache = collections.OrderedDict()
+
+
+# UPSAMPLING
+
+# coherent summing picks the sample of each range profile nearest to the two-way delay of
+# a grid position, so the delay is rounded to the nearest profile_Δt. If the upsampling
+# factor is greater than 1, each range profile is interpolated once by this factor by
+# zero-padding its spectrum (see upsample), so that the nearest sample is much closer to
+# the true delay without any extra work for each grid position. NB the range profiles are
+# this many times longer.
+global UPSAMPLE_FACTOR; UPSAMPLE_FACTOR = 1
+
+
+# FAR-FIELD BEAMFORMING
+
+# beyond a few array lengths, the echo from a grid position reaches every receiver with
+# the same envelope delay, and only the phase differs between receivers by a fixed
+# progression along the (uniform, linear) array. If far-field beamforming is active,
+# every azimuth beam at each range beyond FAR_FIELD_RANGE is formed at once using a
+# zero-padded FFT across the receivers (see far_field_summing), while closer ranges use
+# the exact near-field coherent summing.
+global FAR_FIELD_BEAMFORMING; FAR_FIELD_BEAMFORMING = False
+
+# range [meters] from which far-field beamforming is used. The phase error of the
+# far-field approximation at the edge of the array is about π*L^2/(4*λ*r) for an array of
+# length L, i.e. 2L^2/λ ≈ 1.1 m gives an error of about π/8.
+global FAR_FIELD_RANGE; FAR_FIELD_RANGE = 2
+
+# number of points in the FFT across the receivers. Each azimuth angle uses the nearest
+# FFT bin, so more points give more accurate steering.
+global FAR_FIELD_FFT_SIZE; FAR_FIELD_FFT_SIZE = 256
+
+
+# NUMBA BACKEND
+
+# if true, coherent summing and the dead-time, phase, gain and range compensation use the
+# compiled kernels in numba_kernels, which avoid creating large temporary arrays. Enabled
+# by default if numba is installed - else the NumPy implementations are used.
+global USE_NUMBA; USE_NUMBA = numba_kernels.NUMBA_AVAILABLE
+
+
+# TILED BEAMFORMING
+
+# the geometry tables of the whole grid take 24 bytes per receiver and grid position
+# (e.g. 192 MB for a 1000x1000 grid), plus the same again while summing. If tiled
+# beamforming is active, the grid is instead split into tiles of at most
+# BEAMFORMING_TILE_SIZE x BEAMFORMING_TILE_SIZE positions, and the geometry of each tile is
+# calculated, summed and discarded in turn, so that memory use is bounded by the tile size
+# (see tiled_coherent_summing). The tiles are shared between BEAMFORMING_WORKERS processes.
+# The geometry of the tiles is not cached, so it is calculated again for every frame. 
+# Tiled beamforming therefore trades time for memory: on a 1000x1000 grid, a tiled frame 
+# took 0.48s, against 0.13s for a frame using the cached geometry of the whole grid (and
+# 0.71s for the first frame, which calculates it), while holding 12 MB of geometry per 
+# tile rather than 192 MB. Only enable it if the grid's geometry does not fit in memory.
+global TILED_BEAMFORMING; TILED_BEAMFORMING = False
+
+# number of range bins and azimuth angles in each tile
+global BEAMFORMING_TILE_SIZE; BEAMFORMING_TILE_SIZE = 250
+
+# number of worker processes that tiles are evaluated by. If 1, the tiles are evaluated
+# one at a time in the calling process. Each tile is already summed by vectorised numpy
+# operations, and extra workers only help if there are spare cores to run them on. On a 
+# machine with a single core, sending the range profiles and each image tile between 
+# processes cost more than it saved (on 1000x1000, 1 worker took 0.48s, 2 workers 0.52s 
+# and 4 workers 0.55s), so a single worker is used by default. On a machine with more 
+# cores, increase this if benchmark.benchmark_tiled_beamforming shows a speedup.
+global BEAMFORMING_WORKERS; BEAMFORMING_WORKERS = 1
+
+# (number of workers, process pool) used for tiled beamforming - created when first used,
+# and reused by later images (see get_beamforming_pool)
+global beamforming_pool; beamforming_pool = None
+global beamforming_pool_lock; beamforming_pool_lock = threading.Lock()
+
+
+# PROGRESSIVE IMAGING
+
+# a progressive image is first beamformed on a coarse grid (every PROGRESSIVE_STRIDES[0]th
+# angle and range bin), and then refined at each following stride, but only in the cells
+# whose energy at the previous level is at least PROGRESSIVE_THRESHOLD times the peak 
+# energy of the coarsest level (see progressive_coherent_summing). Each stride must 
+# divide the previous stride, and the last stride must be 1 (the full grid).
+global PROGRESSIVE_STRIDES; PROGRESSIVE_STRIDES = [4, 2, 1]
+global PROGRESSIVE_THRESHOLD; PROGRESSIVE_THRESHOLD = 0.01
+
+# number of neighbouring cells (along each axis) that are also refined around each cell 
+# above the threshold, so that echoes falling between coarse grid positions are not lost
+global PROGRESSIVE_MARGIN; PROGRESSIVE_MARGIN = 1
+
+# summing only the cells that are refined costs more per grid position than dense coherent
+# summing, so refining only saves time on large grids with few echoes. Progressive and 
+# dense summing break even at about 150x150 grid positions (see benchmark.py), so on grids
+# with fewer than PROGRESSIVE_MIN_POSITIONS positions, the coarse image is followed 
+# directly by the dense image. Likewise, if more than PROGRESSIVE_MAX_REFINE_FRACTION of 
+# the grid is to be refined at the next level, the dense image is the last level instead.
+global PROGRESSIVE_MIN_POSITIONS; PROGRESSIVE_MIN_POSITIONS = 200*200
+global PROGRESSIVE_MAX_REFINE_FRACTION; PROGRESSIVE_MAX_REFINE_FRACTION = 0.5
+
+
+# BEAMFORMING GEOMETRY CACHE
+
+# the delay indices and phase steering terms used in coherent summing depend only on the 
+# geometry of the scene and the sample rate, and not on the received signals. They are 
+# therefore computed once and cached, keyed by all the parameters they depend on. A change
+# in sample rate will select (or compute) the matching entry automatically.
+
+# maximum number of geometry tables kept in memory - least recently used is evicted first
+global GEOMETRY_CACHE_SIZE; GEOMETRY_CACHE_SIZE = 4
+
+# if not None, geometry tables are also saved to this directory as .npz files so that they
+# survive a restart
+global GEOMETRY_CACHE_DIR; GEOMETRY_CACHE_DIR = None
+
+# in-memory cache mapping geometry key -> (index, steering)
+global geometry_cache; geometry_cache = collections.OrderedDict()
+
+
 # DEBUGGING 
 
-# if debug mode is active, each intermediate figure will be saved for later inspection
-# and can help with debugging
+# if debug mode is active, the arrays of each intermediate figure will be captured for 
+# later inspection and can help with debugging. A figure is only rendered when it is 
+# requested (see capture_debug_plot and debug_plot_png)
 global DEBUG_MODE_ACTIVE; DEBUG_MODE_ACTIVE = False
 
 # this is the path that debugging figures are saved to. Note that if this script is called
@@ -147,11 +362,21 @@ global DEBUG_MODE_ACTIVE; DEBUG_MODE_ACTIVE = False
 # be changed to debug/ in __main__.
 global DEBUG_DIR; DEBUG_DIR = "../signal_processing/debug"
 
-# this variable keeps track of the current receiver being processed, and is used to
-# label each of the intermediate plots generated by debug mode. In the case of 1D mode,
-# where only one receiver is used, this variable is fixed to 0
+# the receiver used to label the intermediate plots generated by debug mode, and to select
+# the calibration factors, when a signal processing step is called without a context. The
+# receiver being processed is otherwise given by the context (see ProcessingContext)
 global DEBUG_ACTIVE_RECIEVER; DEBUG_ACTIVE_RECIEVER = 0
 
+# the most recent capture of each intermediate figure, mapping filename -> (plot function,
+# arguments), and the png of each figure that has been rendered since it was captured.
+# Only the latest ping is kept, so memory use is bounded by the number of figures.
+global debug_captures; debug_captures = {}
+global debug_pngs; debug_pngs = {}
+
+# the most recent range profile of each receiver, used to plot all range profiles together
+global debug_range_profiles; debug_range_profiles = {}
+global debug_lock; debug_lock = threading.Lock()
+
 
 # RECORDING RECEIVE SIGNAL
 
@@ -159,10 +384,13 @@ global DEBUG_ACTIVE_RECIEVER; DEBUG_ACTIVE_RECIEVER = 0
 # often lead to poor results - thus it is preferable to calibrate the system by recording
 # the receive echo off a strong target, and using that as the waveform to match with all
 # future receive signals. Note that the receive signal must be formatted correctly before
-# it can be used again - can use Microsoft Excel. NB only record RX when in 1D mode, else
-# each receiver will overwrite the previous one  
+# it can be used again - rx_recorder.export_recording saves a single recorded receive 
+# signal as a text file, which can then be formatted (e.g. using Microsoft Excel)
 
-# if record Rx mode is active, the received waveform will be saved in a text file. 
+# if record Rx mode is active, every received waveform is appended to a binary recording
+# file (see rx_recorder) by a background thread, tagged with its time, sample rate and 
+# receiver number. The file is rotated once it reaches rx_recorder.MAX_RECORDING_BYTES, so
+# at most a few hundred megabytes of recordings are kept.
 global RECORD_RX; RECORD_RX = True
 
 # if true, the recorded waveform will be read in and used for matching
@@ -170,66 +398,424 @@ global USE_RECORDED_RX; USE_RECORDED_RX = True
 
 # the file paths used to save and load the recorded signals - note save and load use
 # different files to prevent acidental overwriting
-global RX_SAVE_FILEPATH; RX_SAVE_FILEPATH = "../signal_processing/receive_signal/recorded_RX_signal.txt"
+global RX_SAVE_FILEPATH; RX_SAVE_FILEPATH = "../signal_processing/receive_signal/recorded_RX_signal.bin"
 global RX_LOAD_FILEPATH; RX_LOAD_FILEPATH = "../signal_processing/receive_signal/formatted_RX_signal.txt"
 
+# if true, the recorded waveform is also saved as a binary .npz file next to the text file
+# (e.g. formatted_RX_signal.npz) the first time it is read, and this much faster binary 
+# file is read instead of the text file from then on. The modification time and size of 
+# the text file are saved with it, and the .npz file is written again if either changes.
+global RX_LOAD_SIDECAR; RX_LOAD_SIDECAR = True
+
+# the reference chirp is only loaded (or simulated) once, and kept in memory in both time
+# and frequency domains. It is loaded again if the file it was loaded from changes, or if
+# the sample rate or number of samples changes - see load_reference_chirp
+global REFERENCE_CHIRP_CACHE_SIZE; REFERENCE_CHIRP_CACHE_SIZE = 4
+
+# in-memory cache mapping reference chirp key -> (xt, Xw)
+global reference_chirp_cache; reference_chirp_cache = collections.OrderedDict()
+
+
+# ARCHIVING CAPTURES
+
+# if not None, the raw ADC codes of every ping received from the microcontroller are 
+# appended to the capture archive at this path (without file extension), so that they can
+# be reprocessed or replayed later - see capture_archive
+global ARCHIVE_FILEPATH; ARCHIVE_FILEPATH = None
+
 
 # =============================== FUNCTION DEFINITIONS ================================= #
 
 
+# PROCESSING CONTEXT
+
+class ProcessingContext(collections.namedtuple("ProcessingContext", ["fs", "N", "Δt", "t_max", "t", "s", "s_max", "Δω", "Δf", "ω", "f", "f_axis", "c", "r_max", "fc", "T", "B", "K", "f0", "λ", "rad", "azm", "transmit_coord", "reciever_coords", "appature_window", "phase_comp_factors", "gain_comp_factors", "use_recorded_rx", "record_rx", "fused", "decimation", "upsampling", "far_field", "far_field_range", "tiled", "debug", "reciever"])):
+	"""Immutable set of parameters used to process a ping.
+
+	Each signal processing step reads the axes, chirp parameters, scene geometry and
+	calibration factors it needs from a context rather than from the global variables.
+	A context cannot be changed once created, and all of its arrays are read-only, so
+	several pings can be processed at once (e.g. by the threads of a web server) without
+	affecting each other, even if they use different sample rates. A modified copy of a
+	context is created using with_sample_rate, with_options or with_region.
+
+	The tables that are expensive to compute (the reference chirp, fused responses and
+	beamforming geometry) are cached separately, keyed by the parameters of the context
+	they were computed for, and are shared by all contexts with the same parameters.
+
+	If a signal processing step is called without a context, a snapshot of the global
+	variables is used instead (see global_context).
+
+	Attributes
+	----------
+	fs, N, Δt, t_max, t, s, s_max, Δω, Δf, ω, f, f_axis
+		sample rate, number of samples, and time, distance and frequency axes - see the
+		global variables of the same name
+	c, r_max, fc, T, B, K, f0, λ
+		speed of sound, max range, and chirp parameters
+	rad, azm, transmit_coord, reciever_coords, appature_window
+		polar grid of the 2D image, and location and aperture taper of each transducer
+	phase_comp_factors, gain_comp_factors
+		calibration factors for each receiver
+	use_recorded_rx : bool
+		if true, the recorded receive signal is used as the transmitted chirp
+	record_rx : bool
+		if true, the receive signal is appended to RX_SAVE_FILEPATH
+	fused : bool
+		if true, fused processing is used (see fused_processing)
+	decimation : int
+		factor the basebanded signal is decimated by (see decimate). The range profiles 
+		are sampled at profile_t, with spacing profile_Δt.
+	upsampling : int
+		factor the range profiles are interpolated by after decimation (see upsample)
+	far_field : bool
+		if true, far-field beamforming is used beyond far_field_range (see 
+		far_field_summing)
+	far_field_range : float
+		range [meters] from which far-field beamforming is used
+	tiled : bool
+		if true, near-field beamforming is split into tiles (see tiled_coherent_summing)
+	debug : bool
+		if true, the intermediate figures are saved (see DEBUG_MODE_ACTIVE)
+	reciever : int or numpy.ndarray
+		the receiver (or array of receivers, one for each row of a 2D array) being
+		processed. Used to select the calibration factors and label intermediate figures.
+	"""
+
+	__slots__ = ()
+
+
+	@property
+	def profile_Δt(self):
+		"""Sample spacing of the (decimated and upsampled) range profiles [seconds]."""
+		
+		return self.Δt * self.decimation / self.upsampling
+
+
+	@property
+	def profile_t(self):
+		"""Time axis of the (decimated and upsampled) range profiles."""
+		
+		t = self.t[::self.decimation]
+		
+		if(self.upsampling == 1):
+			return t
+		
+		# the upsampled samples are evenly spaced between the decimated samples
+		return t[0] + np.arange(len(t)*self.upsampling) * (self.t[-1] - self.t[0])/(self.N - 1) * self.decimation/self.upsampling
+
+
+	@property
+	def profile_s(self):
+		"""Distance axis of the (decimated and upsampled) range profiles."""
+		
+		if(self.upsampling == 1):
+			return self.s[::self.decimation]
+		
+		return 0.5 * self.profile_t * self.c
+
+
+	def with_sample_rate(self, new_sample_rate, num_samples):
+		"""Returns a copy of the context with a new sample rate, and all the axes that
+		depend on the sample rate. See change_sample_rate.
+
+		Parameters
+		----------
+		new_sample_rate: float
+			the new sample rate in Hz
+		num_samples: int
+			the number of samples to be used in signal processing
+		"""
+
+		return self._replace(fs=new_sample_rate, N=num_samples, **calc_axes(new_sample_rate, num_samples, self.c))
+	
+	
+	def with_region(self, min_range, max_range, min_angle, max_angle, density=1):
+		"""Returns a copy of the context with the polar grid of the 2D image (rad and azm)
+		replaced by a region of interest.
+		
+		Only the grid positions within the region are beamformed, so the time taken to 
+		form an image scales with the area of the region rather than the full field of 
+		view. The spacing of the new grid is that of the current grid divided by density,
+		e.g. a density of 2 gives twice as many range bins per meter and azimuth angles 
+		per degree.
+		
+		Parameters
+		----------
+		min_range, max_range: float
+			range bounds of the region [meters], between 0 and r_max
+		min_angle, max_angle: float
+			azimuth bounds of the region [degrees], between -90 and 90
+		density: float, optional
+			density of the new grid relative to the current grid. Defaults to 1.
+		
+		Raises
+		------
+		ValueError
+			If the bounds are outside the limits above or in the wrong order, the density
+			is not a positive finite number, or the new grid would have more than 
+			MAX_REGION_POSITIONS positions
+		"""
+		
+		if(not 0 <= min_range < max_range <= self.r_max):
+			raise ValueError("Range bounds must satisfy 0 <= min < max <= {} m".format(self.r_max))
+		
+		if(not -90 < min_angle < max_angle < 90):
+			raise ValueError("Azimuth bounds must satisfy -90 < min < max < 90 degrees")
+		
+		if(not (np.isfinite(density) and density > 0)):
+			raise ValueError("Grid density must be a positive finite number")
+		
+		# spacing of the current grid
+		Δr = (self.rad[-1] - self.rad[0]) / (len(self.rad) - 1)
+		Δθ = (self.azm[-1] - self.azm[0]) / (len(self.azm) - 1)
+		
+		num_ranges = max(2, int(round((max_range - min_range) / Δr * density)) + 1)
+		num_angles = max(2, int(round(np.radians(max_angle - min_angle) / Δθ * density)) + 1)
+		
+		if(num_ranges * num_angles > MAX_REGION_POSITIONS):
+			raise ValueError("Region of interest of {}x{} positions exceeds the maximum of {} positions - reduce the density or the size of the region".format(num_angles, num_ranges, MAX_REGION_POSITIONS))
+		
+		rad = np.linspace(min_range, max_range, num_ranges)
+		azm = np.linspace(np.radians(min_angle), np.radians(max_angle), num_angles)
+		
+		return self._replace(rad=read_only(rad), azm=read_only(azm))
+
+
+	def with_options(self, **options):
+		"""Returns a copy of the context with any of use_recorded_rx, record_rx, fused,
+		decimation, upsampling, far_field, far_field_range, tiled, debug or reciever 
+		replaced.
+
+		Raises
+		------
+		ValueError
+			If any other field is given. The remaining fields depend on each other, and
+			cannot be replaced one at a time.
+		"""
+
+		unknown = set(options) - {"use_recorded_rx", "record_rx", "fused", "decimation", "upsampling", "far_field", "far_field_range", "tiled", "debug", "reciever"}
+
+		if(len(unknown) > 0):
+			raise ValueError("Context options not recognised: {}".format(", ".join(sorted(unknown))))
+
+		return self._replace(**options)
+
+
+
+def global_context():
+	"""Returns a ProcessingContext containing a snapshot of the global variables.
+
+	The arrays are copied, so changes to the global variables (e.g. by change_sample_rate)
+	made after the snapshot is taken do not affect the context. The signal processing
+	steps call this function when no context is provided.
+
+	Returns
+	-------
+	ProcessingContext
+		the current global parameters
+	"""
+
+	return ProcessingContext(
+		fs=fs, N=N, Δt=Δt, t_max=t_max, t=read_only(t), s=read_only(s), s_max=s_max,
+		Δω=Δω, Δf=Δf, ω=read_only(ω), f=read_only(f), f_axis=read_only(f_axis),
+		c=c, r_max=r_max, fc=fc, T=T, B=B, K=K, f0=f0, λ=λ,
+		rad=read_only(rad), azm=read_only(azm), transmit_coord=tuple(transmit_coord),
+		reciever_coords=tuple(tuple(coord) for coord in reciever_coords),
+		appature_window=read_only(appature_window),
+		phase_comp_factors=read_only(phase_comp_factors),
+		gain_comp_factors=read_only(gain_comp_factors),
+		use_recorded_rx=USE_RECORDED_RX, record_rx=RECORD_RX, fused=FUSED_PROCESSING,
+		decimation=DECIMATION_FACTOR, upsampling=UPSAMPLE_FACTOR, 
+		far_field=FAR_FIELD_BEAMFORMING, far_field_range=FAR_FIELD_RANGE, 
+		tiled=TILED_BEAMFORMING, debug=DEBUG_MODE_ACTIVE, reciever=DEBUG_ACTIVE_RECIEVER)
+
+
+
+def calc_axes(new_sample_rate, num_samples, c):
+	"""Calculates the time, distance and frequency axes for a sample rate and number of
+	samples.
+
+	Returns
+	-------
+	dict
+		maps the name of each axis (e.g. "Δt", "t", "f_axis") to its value. Arrays are
+		read-only.
+	"""
+
+	Δt = 1/new_sample_rate							# sample spacing in time domain [seconds]
+	t_max = num_samples*Δt							# max range [seconds]
+	t = np.linspace(0, t_max, num_samples)			# time axis
+
+	s = 0.5 * t * c									# distance axis
+	s_max = 0.5 * t_max * c							# max range [meters]
+
+	Δω = 2*np.pi/(num_samples*Δt)					# sample spacing in freq domain [rad]
+	Δf = Δω/(2*np.pi)								# sample spacing in freq domain [Hz]
+	ω = np.linspace(0, (num_samples-1)*Δω, num_samples)	# freq axis [rad]
+	f = ω/(2*np.pi)									# freq axis [Hz]
+
+	# alt freq axis, first element maps to 0 Hz
+	if num_samples%2==0:	# case N even
+		f_axis = np.linspace(-num_samples/2, num_samples/2-1, num_samples)*Δf
+	else:					# case N odd
+		f_axis = np.linspace(-(num_samples-1)/2, (num_samples-1)/2, num_samples)*Δf
+
+	for axis in (t, s, ω, f, f_axis):
+		axis.flags.writeable = False
+
+	return {"Δt" : Δt, "t_max" : t_max, "t" : t, "s" : s, "s_max" : s_max, "Δω" : Δω, "Δf" : Δf, "ω" : ω, "f" : f, "f_axis" : f_axis}
+
+
+
 # 1D SIGNAL PROCESSING ALGORITHMS
 
-def make_chirp():
+def make_chirp(ctx=None):
 	""" Defines a chirp signal and returns signal in time and frequency domains. 
 	
 	The properties of the chrip, including its duration, center frequency, and chirp rate
 	are defined as global variables.
 	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		chirp signal in time domain x(t)
+	numpy.ndarray
+		chirp signal in frequency domain X(w) - the first N//2 + 1 components, as the 
+		remaining components of a real signal are their complex conjugates (see 
+		full_spectrum)
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	# either read in a file containing the "transmitted" chirp, or create simulated chirp - 
+	# the chirp is kept in memory after the first call (see load_reference_chirp)
+	xt, Xw = load_reference_chirp(ctx)
+	
+	
+	# if debug mode is active, capture this intermediate figure for later inspection. This
+	# is only done for the first receiver as the TX signal will be the same. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug and ctx.reciever==0):
+		capture_debug_plot("_1_chirp.png", plot_debug_panels, "Transmitted chirp x(t)", [(ctx.t, xt, "t [s]", "x(t)"), (ctx.f_axis, np.fft.fftshift(abs(full_spectrum(Xw, ctx.N))), "f [Hz]", "X(f)")], hspace=0.3)
+	
+	
+	return xt , Xw
+
+
+
+def load_reference_chirp(ctx=None):
+	"""Returns the reference chirp in time and frequency domains, loading or simulating 
+	it only if the cached copy is out of date.
+	
+	The chirp is either read in from RX_LOAD_FILEPATH (if use_recorded_rx) or simulated.
+	The chirp is cached, keyed by use_recorded_rx, the file path, the modification time
+	and size of the file, the sample rate, the number of samples, and the parameters of 
+	the simulated chirp. At most REFERENCE_CHIRP_CACHE_SIZE chirps are kept in memory. If
+	RX_LOAD_SIDECAR is true, the recorded chirp is read from a binary .npz file next to 
+	the text file, which is created from the text file when needed. The .npz file stores
+	the modification time and size of the text file it was created from, and is created 
+	again if these no longer match (e.g. the text file is replaced by an older copy). 
+	
+	The returned arrays are shared between calls and are therefore read-only.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
 	Returns
 	-------
 	numpy.ndarray
 		chirp signal in time domain x(t)
 	numpy.ndarray
-		chirp signal in frequency domain X(w)
+		chirp signal in frequency domain X(w) - the first N//2 + 1 components
 	"""
 	
-	# either read in a file containing the "transmitted" chirp, or create simulated chirp
-	if(USE_RECORDED_RX):
-		xt = np.loadtxt(RX_LOAD_FILEPATH)
+	if(ctx is None):
+		ctx = global_context()
+	
+	if(ctx.use_recorded_rx):
+		stat = os.stat(RX_LOAD_FILEPATH)
+		source = (RX_LOAD_FILEPATH, stat.st_mtime_ns, stat.st_size)
+		key = (source, ctx.fs, ctx.N)
 	else:
-		xt = rect((t - T/2)/T)*np.cos(2*np.pi*(f0*t+0.5*K*t**2))
+		key = (None, ctx.fs, ctx.N, params_key(ctx.t, ctx.T, ctx.f0, ctx.K))
 	
-	fft = pyfftw.builders.fft(xt) # compute fft
-	Xw = fft() 
+	return lru_cache_lookup(reference_chirp_cache, key, REFERENCE_CHIRP_CACHE_SIZE, lambda: calc_reference_chirp(ctx, key[0]))
+
+
+
+def calc_reference_chirp(ctx, source=None):
+	"""Loads or simulates the reference chirp in time and frequency domains. See 
+	load_reference_chirp.
 	
+	Parameters
+	----------
+	ctx : ProcessingContext
+		parameters used for processing
+	source : tuple, optional
+		(path, modification time in ns, size) of RX_LOAD_FILEPATH, as used to key the 
+		cached chirp. Read from the file if not provided.
 	
-	# if debug mode is active, save this intermediate figure for later inspection. This is
-	# only done if for the first receiver and TX signal will be the same 
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE and DEBUG_ACTIVE_RECIEVER==0):
-		fig, (tplot, fplot) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Transmitted chirp x(t)", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.3)
+	Returns
+	-------
+	numpy.ndarray
+		chirp signal in time domain x(t), read-only
+	numpy.ndarray
+		chirp signal in frequency domain X(w) - the first N//2 + 1 components, read-only
+	"""
+	
+	if(ctx.use_recorded_rx):
+		if(source is None):
+			stat = os.stat(RX_LOAD_FILEPATH)
+			source = (RX_LOAD_FILEPATH, stat.st_mtime_ns, stat.st_size)
 		
-		tplot.plot(t,xt,linewidth=0.7, color="#2da6f7")
-		tplot.set_xlabel("t [s]")
-		tplot.set_ylabel("x(t)")
+		sidecar_filepath = os.path.splitext(source[0])[0] + ".npz"
+		stamp = np.array(source[1:], dtype=np.int64)
+		xt = None
 		
-		fplot.plot(f_axis, np.fft.fftshift(abs(Xw)),linewidth=0.7, color="#2da6f7")
-		fplot.set_xlabel("f [Hz]")
-		fplot.set_ylabel("X(f)")
+		# only use the binary file if it was created from this version of the text file
+		if(RX_LOAD_SIDECAR and os.path.isfile(sidecar_filepath)):
+			try:
+				with np.load(sidecar_filepath) as sidecar:
+					if(np.array_equal(sidecar["source"], stamp)):
+						xt = sidecar["xt"]
+			except (OSError, KeyError, ValueError):
+				pass # created again from the text file below
 		
-		#plt.show(block=False)
-		save_figure(fig, "_1_chirp.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+		if(xt is None):
+			xt = np.loadtxt(source[0])
+			
+			if(RX_LOAD_SIDECAR):
+				# written to a temporary file first, so other threads never read a 
+				# partially written file
+				temp_filepath = "{}.{}.tmp".format(sidecar_filepath, threading.get_ident())
+				
+				try:
+					with open(temp_filepath, "wb") as file:
+						np.savez(file, xt=xt, source=stamp)
+					os.replace(temp_filepath, sidecar_filepath)
+				except OSError:
+					pass # the text file can still be used if the directory is read-only
+	else:
+		xt = rect((ctx.t - ctx.T/2)/ctx.T)*np.cos(2*np.pi*(ctx.f0*ctx.t+0.5*ctx.K*ctx.t**2))
 	
+	Xw = fftw_plans.rfft(xt) # compute fft of real signal
 	
-	return xt , Xw
-
+	xt.flags.writeable = False
+	Xw.flags.writeable = False
+	
+	return xt, Xw
 
 
-def simulate_recieve_signal(td_targets):
+def simulate_recieve_signal(td_targets, ctx=None):
 	"""Simulates what the recieve signal would look like for given targets in a scene.
 	
 	This function is called when in simulation mode.  
@@ -239,56 +825,54 @@ def simulate_recieve_signal(td_targets):
 	td_targets : list
 		array containing the time delay (td) between transmitting the pulse, and recieving 
 		an echo for each of the targets. A longer td means the target is further away.
+		A 2D array can also be provided containing the time delays for each receiver, in
+		which case one recieve signal is simulated for each row.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
 	numpy.ndarray
 		recieved signal in time domain v(t)
 	numpy.ndarray
-		recieved signal in frequency domain V(w)
+		recieved signal in frequency domain V(w) - the first N//2 + 1 components (see 
+		full_spectrum)
 	"""
 	
-	vt = 0
-	for i in range(0,len(td_targets)):
-		td = td_targets[i] 
-		R = 0.5 * td * c
-		A = 1/R**2
-		v = A*rect((t - (T/2+td) )/T)*np.cos(2*np.pi*(f0*(t-td)+0.5*K*(t-td)**2))
-		vt = vt + v
-
-	vt = vt + generate_noise()
+	if(ctx is None):
+		ctx = global_context()
 	
-	fft = pyfftw.builders.fft(vt) # compute fft
-	Vw = fft() 
+	td_targets = np.asarray(td_targets, dtype=float)
 	
+	# one recieve signal for each row of time delays
+	vt = np.zeros(td_targets.shape[:-1] + (ctx.N,))
 	
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot, fplot) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Recieved signal v(t)", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.3)
-		
-		tplot.plot(s,vt,linewidth=0.7, color="#2da6f7")
-		tplot.set_xlabel("t [s]")
-		tplot.set_ylabel("v(t)")
-		
-		fplot.plot(f_axis, np.fft.fftshift(abs(Vw)),linewidth=0.7, color="#2da6f7")
-		fplot.set_xlabel("f [Hz]")
-		fplot.set_ylabel("V(f)")
+	t, T = ctx.t, ctx.T
+	
+	for row in np.ndindex(td_targets.shape[:-1]):
+		for td in td_targets[row]:
+			R = 0.5 * td * ctx.c
+			A = 1/R**2
+			v = A*rect((t - (T/2+td) )/T)*np.cos(2*np.pi*(ctx.f0*(t-td)+0.5*ctx.K*(t-td)**2))
+			vt[row] = vt[row] + v
 		
-		#plt.show(block=False)
-		save_figure(fig, "{}_1_receive.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+		vt[row] = vt[row] + generate_noise(ctx)
+	
+	Vw = fftw_plans.rfft(vt) # compute fft of real signal
+	
+	
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_1_receive.png".format(ctx.reciever), plot_debug_panels, "Recieved signal v(t)", [(ctx.s, vt, "t [s]", "v(t)"), (ctx.f_axis, np.fft.fftshift(abs(full_spectrum(Vw, ctx.N))), "f [Hz]", "V(f)")], hspace=0.3)
 	
 	
 	return vt, Vw
 
 
-def prepare_recieve_signal(samples):
+def prepare_recieve_signal(samples, ctx=None):
 	"""Prepares the recieved signal for further processing by applying BPF centered on fc.
-	Also saves recieved waveform is RECORD_RX==true
+	Also records recieved waveform is RECORD_RX==true
 	
 	This function is used when recieving actual sonar data, as opposed to using simulated
 	data.
@@ -299,51 +883,39 @@ def prepare_recieve_signal(samples):
 	----------
 	samples : numpy.ndarray
 		array containing all samples of the recieved signal. It is important that this is
-		a numpy array.
+		a numpy array. A 2D array containing the samples from each receiver in its rows 
+		can also be provided.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
 	numpy.ndarray
 		processed signal in time domain v(t)
 	numpy.ndarray
-		processed signal in frequency domain V(w)
+		processed signal in frequency domain V(w) - the first N//2 + 1 components (see 
+		full_spectrum)
 	"""
 	
+	if(ctx is None):
+		ctx = global_context()
+	
 	vt = samples
 	
-	# save receive signal as text file if in record mode (i.e. RECORD_RX == True)
-	if(RECORD_RX):
-		np.savetxt(RX_SAVE_FILEPATH, vt, delimiter=',')
+	# record receive signal if in record mode (i.e. RECORD_RX == True)
+	record_recieve_signal(vt, ctx)
 	
-	fft = pyfftw.builders.fft(vt) # compute fft
-	Vw = fft() 
+	Vw = fftw_plans.rfft(vt) # compute fft of real signal
 	
 	# BPF
-	window = rect((f -fc % (N * Δf))/B)
-	Vw = Vw * (window + window[::-1]) # to account for the +'ve and -'ve freq
-	fft = pyfftw.builders.ifft(Vw) # compute inverse fft
-	vt = fft() 
+	Vw = Vw * bandpass_window(ctx)[:Vw.shape[-1]]
+	vt = fftw_plans.irfft(Vw, vt.shape[-1]) # compute inverse fft
 	
 	
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot, fplot) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Recieved signal v(t)", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.4)
-
-		tplot.plot(t,vt,linewidth=0.7, color="#2da6f7")
-		tplot.set_xlabel("t [s]")
-		tplot.set_ylabel("v(t)")
-		
-		fplot.plot(f_axis, np.fft.fftshift(abs(Vw)),linewidth=0.7, color="#2da6f7")
-		fplot.set_xlabel("f [Hz]")
-		fplot.set_ylabel("V(f)")
-		
-		#plt.show()
-		save_figure(fig, "{}_1_receive.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_1_receive.png".format(ctx.reciever), plot_debug_panels, "Recieved signal v(t)", [(ctx.t, vt, "t [s]", "v(t)"), (ctx.f_axis, np.fft.fftshift(abs(full_spectrum(Vw, ctx.N))), "f [Hz]", "V(f)")])
 	
 	
 	
@@ -351,33 +923,41 @@ def prepare_recieve_signal(samples):
 	
 
 
-def pulse_compression(Xw,Vw): 
+def pulse_compression(Xw, Vw, ctx=None): 
 	"""Performs pulse compression on the recieved signal using an inverse filter.
 	
 	Inverse filter designed to detect the presence of a waveform of known structure (in 
 	this case a chirp signal) buried in the presence of additive noise. The output will
 	typically exhibit a sharp peak in response to the presence of the desired waveform.
 	
+	Both signals are real, so only their first N//2 + 1 frequency components are used, 
+	and only these components of the output are returned (see full_spectrum). The full
+	spectra of N components can also be provided.
+	
 	Parameters
 	----------
 	Xw : numpy.ndarray
 		the transmit signal in frequency domain
 	Vw: numpy.ndarray
 		the recieved signal in frequency domain after being prepared
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
 	numpy.ndarray
 		processed signal in time domain y(t)
 	numpy.ndarray
-		processed signal in frequency domain Y(w)
+		processed signal in frequency domain Y(w) - the first N//2 + 1 components
 	"""
 	
-	# defines a window over the bandwidth of the transmitted chirp
-	window = rect((f -fc % (N * Δf))/B)
-		
-	# applies inverse filter to received signal 
-	Yw = Vw/Xw * (window + window[::-1]) # to account for the +'ve and -'ve freq
+	if(ctx is None):
+		ctx = global_context()
+	
+	num_components = ctx.N//2 + 1
+	
+	# applies inverse filter to received signal over the bandwidth of the transmitted chirp
+	Yw = Vw[..., :num_components]/Xw[..., :num_components] * bandpass_window(ctx)[:num_components]
 	
 	# replaces any Nan with 0
 	Yw = np.nan_to_num(Yw) 
@@ -386,163 +966,136 @@ def pulse_compression(Xw,Vw):
 	#Hw = np.conj(Xw) # conjugate of X.
 	#Yw = Hw * Vw
 		
-	fft = pyfftw.builders.ifft(Yw) # compute inverse fft
-	yt = fft() 
+	yt = fftw_plans.irfft(Yw, ctx.N) # compute inverse fft
 	
 
 	# if debug mode is active, save this intermediate figure for later inspection
 	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
 	# command below - NB NOT USED CURRENTLY
 	
-	#if(DEBUG_MODE_ACTIVE):
+	#if(ctx.debug):
 	if(False):
 		fig, (tplot, fplot) = plt.subplots(2, 1, figsize=(8,6))
 		fig.suptitle("Output of inverse filter y(t)", y=0.94)
 		plt.subplots_adjust(top=0.89,hspace=0.3)
 		
-		tplot.plot(t,abs(yt),linewidth=0.7, color="#2da6f7")
+		tplot.plot(ctx.t,abs(yt),linewidth=0.7, color="#2da6f7")
 		tplot.set_xlabel("t [s]")
 		tplot.set_ylabel("y(t)")
 		
-		fplot.plot(f_axis, np.fft.fftshift(abs(Yw)),linewidth=0.7, color="#2da6f7")
+		fplot.plot(ctx.f_axis, np.fft.fftshift(abs(full_spectrum(Yw, ctx.N))),linewidth=0.7, color="#2da6f7")
 		fplot.set_xlabel("f [Hz]")
 		fplot.set_ylabel("Y(f)")
 		
 		#plt.show()
-		save_figure(fig, "{}_2_inverse_filter.png".format(DEBUG_ACTIVE_RECIEVER))
+		save_figure(fig, "{}_2_inverse_filter.png".format(ctx.reciever))
 		plt.close()
 	
 	
 	return yt, Yw
 
 
-def to_analytic_signal(Xw):
+def to_analytic_signal(Xw, ctx=None):
 	"""Converts signal to analytic form by zero-ing out negative frequency components. 
 	
+	Only the first N//2 + 1 components (the +'ve frequencies) are kept and returned, as
+	the remaining components are zero. The analytic signal is obtained from these with a 
+	single N point inverse FFT (see fftw_plans.ifft).
+	
 	Parameters
 	----------
 	Xw: numpy.ndarray
-		signal, in frequency domain, to convert to analytic form
+		signal, in frequency domain, to convert to analytic form - either the full 
+		spectrum of N components, or only the first N//2 + 1 components. If a 2D array 
+		is provided, each row is converted.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
 	numpy.ndarray
 		processed signal in time domain y(t)
 	numpy.ndarray
-		processed signal in frequency domain Y(w)
+		processed signal in frequency domain Y(w) - the first N//2 + 1 components
 	"""
 	
-	# analytic signal must be multiple by 2 to compensate for losing its -'ve frequencies
-	Yw = 2*Xw 
+	if(ctx is None):
+		ctx = global_context()
 	
-	for i in range(0,len(Yw)):
-		if (i > len(Yw)/2):
-			Yw[i] = 0
+	# analytic signal must be multiple by 2 to compensate for losing its -'ve frequencies
+	# i.e. all frequency components above N/2, which are left out
+	Yw = 2*Xw[..., :ctx.N//2 + 1]
 
-	fft = pyfftw.builders.ifft(Yw) # compute inverse fft
-	yt = fft() 
+	yt = fftw_plans.ifft(Yw, ctx.N) # compute inverse fft
 	
 	
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot, fplot) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Output of inverse filter y(t) - analytic", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.3)
-		
-		tplot.plot(t,abs(yt),linewidth=0.7, color="#2da6f7")
-		tplot.set_xlabel("t [s]")
-		tplot.set_ylabel("y(t)")
-		
-		fplot.plot(f_axis, np.fft.fftshift(abs(Yw)),linewidth=0.7, color="#2da6f7")
-		fplot.set_xlabel("f [Hz]")
-		fplot.set_ylabel("Y(f)")
-		
-		#plt.show(block=True)
-		save_figure(fig, "{}_2_filter.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_2_filter.png".format(ctx.reciever), plot_debug_panels, "Output of inverse filter y(t) - analytic", [(ctx.t, abs(yt), "t [s]", "y(t)"), (ctx.f_axis, np.fft.fftshift(abs(analytic_spectrum(Yw, ctx.N))), "f [Hz]", "Y(f)")], hspace=0.3)
 	
 	
 	
 	return yt, Yw
 	
 
-def apply_window_function(Xw):
+def apply_window_function(Xw, ctx=None):
 	"""Apply window function to signal to reduce sidelobes.
 	
 	Multipying a signal by a window function after having undergone pulse compression will 
 	reduce the magnitude of the sidelobes in the response. A Blackman window function is 
 	used in this case.
 	
+	The window is zero above N/2 (i.e. for the -'ve frequencies), so only the first 
+	N//2 + 1 components are multiplied and returned (see to_analytic_signal).
+	
 	Parameters
 	----------
 	Xw: numpy.ndarray
-		signal, in frequency domain, to convert to analytic form
+		signal, in frequency domain, to apply the window function to - either the full
+		spectrum of N components, or only the first N//2 + 1 components
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
 	numpy.ndarray
 		processed signal in time domain y(t)
 	numpy.ndarray
-		processed signal in frequency domain Y(w)
+		processed signal in frequency domain Y(w) - the first N//2 + 1 components
 	"""
 	
-	#co-efficients for Blackman window 
-	a0 = 0.42
-	a1 = 0.5
-	a2 = 0.08
+	if(ctx is None):
+		ctx = global_context()
 	
-	# if the desired bandwidth of the window function is different to the bandwidth of the
-	# chirp signal, then change the 1 in the following expression
-	B_window = B * 1
+	num_components = ctx.N//2 + 1
 	
 	# define window transfer function
-	Hw = a0 - a1*np.cos((2 * np.pi * (f+fc+B/2))/(B_window)) + a2*np.cos((4 * np.pi * (f+fc+B/2))/(B_window))
-	Hw = Hw * rect((f-fc)/B)
+	Hw = blackman_window(ctx)
 
-	Yw = Xw * Hw 
+	Yw = Xw[..., :num_components] * Hw[:num_components]
 	
-	fft = pyfftw.builders.ifft(Yw) # compute inverse fft
-	yt = fft() 
+	yt = fftw_plans.ifft(Yw, ctx.N) # compute inverse fft
 	
 	
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below 
-	
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot, fplot, hplot) = plt.subplots(3, 1, figsize=(8,6))
-		fig.suptitle("Output after window function y(t)", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.4)
-		
-		tplot.plot(t,abs(yt),linewidth=0.7, color="#2da6f7")
-		tplot.set_xlabel("t [s]")
-		tplot.set_ylabel("y(t)")
-		
-		fplot.plot(f, abs(Yw),linewidth=0.7, color="#2da6f7")
-		fplot.set_xlabel("f [Hz]")
-		fplot.set_ylabel("Y(f)")
-		
-		hplot.plot(f, abs(Hw),linewidth=0.7, color="#2da6f7")
-		hplot.set_xlabel("f [Hz]")
-		hplot.set_ylabel("H(f)")
-		
-		#plt.show(block=True)
-		save_figure(fig, "{}_3_window.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_3_window.png".format(ctx.reciever), plot_debug_panels, "Output after window function y(t)", [(ctx.t, abs(yt), "t [s]", "y(t)"), (ctx.f, abs(analytic_spectrum(Yw, ctx.N)), "f [Hz]", "Y(f)"), (ctx.f, abs(Hw), "f [Hz]", "H(f)")])
 	
 	
 	return yt, Yw
 
 
-def to_baseband(xt):
+def to_baseband(xt, ctx=None):
 	"""Translate the provided signal to baseband (i.e. centered around 0Hz).
 	
 	Parameters
 	----------
 	xt: numpy.ndarray
 		signal, in time domain, to convert to baseband form
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
@@ -552,38 +1105,25 @@ def to_baseband(xt):
 		basebanded signal in frequency domain Y(w)
 	"""
 	
+	if(ctx is None):
+		ctx = global_context()
+	
 	# multiplying signal by exponential function in time domain is equivalent to 
 	# translation in frequency domain
-	yt = xt * np.exp(-2*1j*np.pi*fc*t) 
+	yt = xt * np.exp(-2*1j*np.pi*ctx.fc*ctx.t) 
 	
-	fft = pyfftw.builders.fft(yt) # compute fft
-	Yw = fft() 
+	Yw = fftw_plans.fft(yt) # compute fft
 	
 
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot, fplot) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Output after basebanding y(t)", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.4)
-		
-		tplot.plot(t,abs(yt),linewidth=0.7, color="#2da6f7")
-		tplot.set_xlabel("t [s]")
-		tplot.set_ylabel("|y(t)|")
-		
-		fplot.plot(f_axis, np.fft.fftshift(abs(Yw)),linewidth=0.7, color="#2da6f7")
-		fplot.set_xlabel("f [Hz]")
-		fplot.set_ylabel("Y(f)")
-		
-		#plt.show()
-		save_figure(fig, "{}_4_baseband.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_4_baseband.png".format(ctx.reciever), plot_debug_panels, "Output after basebanding y(t)", [(ctx.t, abs(yt), "t [s]", "|y(t)|"), (ctx.f_axis, np.fft.fftshift(abs(Yw)), "f [Hz]", "Y(f)")])
 	
 	
 	return yt, Yw
 
-def non_ideal_compensation(xt):
+def non_ideal_compensation(xt, reciever=None, ctx=None):
 	"""Compensates for phase offset due to no ideal effects in the system. This includes
 	compensating for deadtime, phase, and gain.
 	
@@ -597,7 +1137,13 @@ def non_ideal_compensation(xt):
 	Parameters
 	----------
 	xt: numpy.ndarray
-		time domain signal to perform compensation
+		time domain signal to perform compensation. If a 2D array is provided, each row is
+		compensated using the factors of the corresponding receiver in reciever.
+	reciever: int or numpy.ndarray, optional
+		the receiver (or array of receivers, one for each row of xt) that the signal was
+		captured by. Defaults to the receiver of the context.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
@@ -607,41 +1153,169 @@ def non_ideal_compensation(xt):
 		phase compensated signal in frequency domain Y(w)
 	"""
 	
-	# DEAD-TIME COMPENSATION
+	if(ctx is None):
+		ctx = global_context()
 	
-	# move end portion of RX array to start to compensate for deadtime
-	xt = np.concatenate((xt[(len(xt)-410):len(xt)], xt[0:(len(xt)-410)]))
-	fft = pyfftw.builders.fft(xt) # compute fft
-	Xw = fft() 
+	if(reciever is None):
+		reciever = ctx.reciever
+	
+	# the dead-time, phase and gain compensation below are applied in a single pass by the
+	# compiled kernel, if available
+	if(USE_NUMBA):
+		factors = np.atleast_1d(np.exp(1j*ctx.phase_comp_factors[reciever]) * ctx.gain_comp_factors[reciever])
+		yt = numba_kernels.compensate(np.ascontiguousarray(np.atleast_2d(xt), dtype=complex), 410, factors).reshape(np.shape(xt))
+		Yw = fftw_plans.fft(yt) # compute fft
+		
+		return yt, Yw
+	
+	
+	# DEAD-TIME COMPENSATION
+	
+	# move end portion of RX array to start to compensate for deadtime
+	xt = np.roll(xt, 410, axis=-1)
 	
 	
 	# PHASE COMPENSATION
+	
+	# apply compensation factor to current receiver - the factors are shaped as a column 
+	# so that each row of a 2D array is compensated by its own receiver's factor
+	yt = xt * np.exp(1j*ctx.phase_comp_factors[reciever])[..., None] 	
+	
+	# GAIN COMPENSATION
+	
+	#apply compensation factor to current receiver
+	yt = yt * ctx.gain_comp_factors[reciever][..., None] 	
+	Yw = fftw_plans.fft(yt) # compute fft
+	
+	
+	return yt, Yw
+
 
-	# phase compensation factors for each receiver in radians, assumes 8 receivers
-	phase_comp_factors = [-0.856, -1.329, 1.693, 1.054, 3.171, -2.967, 2.302, -1.429] #comp_factors = [1.3451, -2.479, 2.368, 2.429, -2.940, -2.639, 2.510, -0.977] #comp_factors = [2.0, -2.1, 2.6, 2.7, -2.1, -2.2, 3.0, -0.7] #comp_factors = [-0.1707, 0.5777, -0.9882,-0.9321, -2.5832, 0.4118, -0.5452, 1.9282] #comp_factors = [1.3451, 0.3382, 2.368, 2.429, -2.940, -2.639, 2.510, -0.977]
-	phase_comp_factors = [-2.077,-2.7717,0.1492,-0.803,1.2544,1.2544,0.1028,2.4675]
+def decimate(xt, ctx=None):
+	"""Reduces the sample rate of the basebanded signal by the decimation factor D of the
+	context.
 	
+	After basebanding, the signal only occupies the bandwidth B around 0 Hz, so it can be 
+	represented by far fewer samples. The signal is first low-pass filtered with cut-off
+	fs/(2D) to prevent aliasing, and then only every D-th sample is kept, i.e. the 
+	samples at profile_t. The anti-alias filter is a linear phase FIR filter (a sinc 
+	tapered by a Blackman window) with DECIMATION_FILTER_SPAN decimated samples on either 
+	side of its center, so it does not delay the signal. 
 	
-	# apply compensation factor to current receiver
-	yt = xt * np.exp(1j*phase_comp_factors[DEBUG_ACTIVE_RECIEVER]) 	
-	fft = pyfftw.builders.fft(yt) # compute fft
-	Yw = fft() 
+	The filter is applied as a linear convolution in the frequency domain. Only the 
+	samples that are kept are computed, by folding the spectrum of the filtered signal 
+	into D times fewer components before the inverse FFT. The frequency response of the
+	filter is cached (see decimation_filter).
 	
-	# GAIN COMPENSATION
+	The range profiles produced from the decimated signal use the time axis profile_t, 
+	and sample spacing profile_Δt of the context, e.g. for range compensation and 
+	coherent summing.
 	
-	# gain compensation factors for each receiver in radians, assumes 8 receivers
-	gain_comp_factors = [1/0.0866,1/0.1009,1/0.07615,1/0.0839,1/0.06921,1/0.06902,1/0.0906,1/0.08533]
+	Parameters
+	----------
+	xt: numpy.ndarray
+		basebanded signal in time domain. If a 2D array is provided, each row is 
+		decimated.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
-	#apply compensation factor to current receiver
-	yt = yt * gain_comp_factors[DEBUG_ACTIVE_RECIEVER] 	
-	fft = pyfftw.builders.fft(yt) # compute fft
-	Yw = fft() 
+	Returns
+	-------
+	numpy.ndarray
+		decimated signal in time domain y(t)
+	numpy.ndarray
+		decimated signal in frequency domain Y(w)
+	
+	Raises
+	------
+	ValueError
+		If the decimated sample rate fs/D is less than the bandwidth B
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	D = ctx.decimation
+	
+	if(ctx.fs/D < ctx.B):
+		raise ValueError("Decimation factor {} is too large - the decimated sample rate must be at least the bandwidth ({} Hz)".format(D, ctx.B))
+	
+	num_samples = xt.shape[-1]
+	span = DECIMATION_FILTER_SPAN * D
+	
+	# zero-pad the signal so that the convolution with the filter does not wrap around, 
+	# and so that the padded length is a multiple of D
+	padded_length = -(-(num_samples + 2*span) // D) * D
+	padded = np.zeros(xt.shape[:-1] + (padded_length,), dtype=complex)
+	padded[..., :num_samples] = xt
+	
+	Yw = fftw_plans.fft(padded) * decimation_filter(padded_length, D)
+	
+	# keeping every D-th sample of the filtered signal is equivalent to summing its
+	# spectrum over D consecutive blocks, and computing a D times shorter inverse FFT
+	Yw = np.sum(Yw.reshape(Yw.shape[:-1] + (D, padded_length//D)), axis=-2) / D
+	yt = fftw_plans.ifft(Yw)[..., :len(range(0, num_samples, D))]
+	
+	Yw = fftw_plans.fft(yt) # compute fft
+	
+	
+	return yt, Yw
+
+
+def upsample(Xw, ctx=None):
+	"""Interpolates the basebanded (and decimated) signal by the upsampling factor U of the
+	context.
+	
+	Coherent summing rounds the delay of every grid position to the nearest sample of each
+	range profile, which introduces a phase error of up to half a sample. Interpolating
+	each range profile once by zero-padding its spectrum reduces this error by a factor of
+	U, while coherent summing still only extracts the nearest sample. As the basebanded
+	signal occupies the frequencies around 0 Hz, the zeros are inserted in the middle of
+	the spectrum (i.e. around the Nyquist frequency), and the component at the Nyquist
+	frequency of an even length signal is split equally between the +'ve and -'ve halves.
+	
+	The upsampled signal is sampled at profile_t, with spacing profile_Δt.
+	
+	Parameters
+	----------
+	Xw: numpy.ndarray
+		basebanded signal in frequency domain. If a 2D array is provided, each row is
+		upsampled.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		upsampled signal in time domain y(t)
+	numpy.ndarray
+		upsampled signal in frequency domain Y(w)
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	U = ctx.upsampling
+	
+	num_samples = Xw.shape[-1]
+	half = (num_samples + 1)//2		# number of components below the Nyquist frequency
+	
+	# scale by U so that the amplitude of the signal is unchanged by the longer inverse FFT
+	Yw = np.zeros(Xw.shape[:-1] + (num_samples*U,), dtype=complex)
+	Yw[..., :half] = U * Xw[..., :half]
+	Yw[..., num_samples*U - (num_samples - half):] = U * Xw[..., half:]
+	
+	if(num_samples % 2 == 0):
+		Yw[..., half] = Yw[..., -half] / 2
+		Yw[..., -half] = Yw[..., -half] / 2
+	
+	yt = fftw_plans.ifft(Yw) # compute ifft
 	
 	
 	return yt, Yw
 
 
-def range_compensation(xt):
+def range_compensation(xt, ctx=None):
 	"""Compensates for R^2 reduction in echo strength.
 	
 	Two targets of equal size will produce echos of different strengths if they are at 
@@ -652,7 +1326,10 @@ def range_compensation(xt):
 	Parameters
 	----------
 	xt: numpy.ndarray
-		time domain signal to perform range compensation
+		time domain signal to perform range compensation, sampled at profile_t (i.e. 
+		after decimation and upsampling, if any)
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
@@ -662,68 +1339,186 @@ def range_compensation(xt):
 		range compensated signal in frequency domain Y(w)
 	"""
 	
-	#array of compensation factors
-	comp_factors = 0.5 * t * c
+	if(ctx is None):
+		ctx = global_context()
 	
-	yt = xt * comp_factors**2
+	#array of compensation factors
+	comp_factors = 0.5 * ctx.profile_t * ctx.c
 	
-	fft = pyfftw.builders.fft(yt) # compute fft
-	Yw = fft() 
+	if(USE_NUMBA):
+		yt = numba_kernels.scale_columns(np.ascontiguousarray(np.atleast_2d(xt), dtype=complex), comp_factors**2).reshape(np.shape(xt))
+	else:
+		yt = xt * comp_factors**2
 	
+	Yw = fftw_plans.fft(yt) # compute fft
 	
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot1, tplot2) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Output before and after compensation", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.4)
-		
-		tplot1.plot(t,abs(xt),linewidth=0.7, color="#2da6f7")
-		tplot1.set_xlabel("t [s]")
-		tplot1.set_ylabel("x(t)")
-		
-		tplot2.plot(t,abs(yt),linewidth=0.7, color="#2da6f7")
-		tplot2.set_xlabel("t [s]")
-		tplot2.set_ylabel("y(t)")
-		
-		#plt.show(block = True)
-		save_figure(fig, "{}_5_comp.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
 	
-	# if debug mode is active, produce a single  plot with all range profiles super 
-	# imposed for both magnitude and phase
-	if(DEBUG_MODE_ACTIVE):
-		# plot magnitude curve for each receiver on same figure
-		plt.figure(num="mag")
-		plt.plot(s,abs(yt),linewidth=0.7)
-		plt.legend(('r0', 'r1', 'r2', 'r3', 'r4', 'r5', 'r6', 'r7'))
-		plt.title("Combined Range Profiles - magnitude")
-		plt.xlabel("d [m]")
-		plt.ylabel("|y(t)|")
-		
-		# plot phase curve for each receiver on same figure
-		plt.figure(num="phase")
-		plt.plot(s,np.angle(yt),linewidth=0.7)
-		plt.legend(('r0', 'r1', 'r2', 'r3', 'r4', 'r5', 'r6', 'r7'))
-		plt.title("Combined Range Profiles - phase")
-		plt.xlabel("d [m]")
-		plt.ylabel("<y(t)")
-		plt.show(block=False)
-		
-		# save each plot if this is the last receiver
-		if(DEBUG_ACTIVE_RECIEVER==7):
-			plt.figure(num="mag")
-			save_figure(plt.gcf(), "all_profile_mags.png")
-			plt.close()
-			plt.figure(num="phase")
-			save_figure(plt.gcf(), "all_profile_phases.png")
-			plt.close()
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_5_comp.png".format(ctx.reciever), plot_debug_panels, "Output before and after compensation", [(ctx.profile_t, abs(xt), "t [s]", "x(t)"), (ctx.profile_t, abs(yt), "t [s]", "y(t)")])
+		
+		# the range profiles of all receivers are also plotted together, for both 
+		# magnitude and phase
+		capture_debug_range_profile(ctx.reciever, ctx.profile_s, yt)
 	
 	return yt, Yw
 
 
-def produce_range_profile_sim(td_targets):
+def fused_response(Xw, reciever=None, simulated=False, ctx=None):
+	"""Returns the combined frequency response and time domain multipliers that are 
+	equivalent to the steps from pulse compression through to range compensation.
+	
+	The BPF, inverse filter, conversion to analytic form, and window function are each a
+	multiplication by a fixed spectrum, and are combined into a single frequency response.
+	The dead-time compensation (a circular shift in time) is included in this response as
+	a linear phase ramp. The basebanding, and phase and gain compensation are each a 
+	multiplication by a fixed signal in time, and are combined into a single time domain 
+	multiplier. Since the dead-time shift is applied before basebanding, the basebanding 
+	signal is shifted by the same amount. The range compensation is returned as a separate
+	multiplier, as it is applied after decimation and upsampling (see decimate and 
+	upsample).
+	
+	The response is cached, keyed by the sample rate, axes, decimation and upsampling 
+	factors, transmit signal, and calibration factors it depends on.
+	
+	Parameters
+	----------
+	Xw : numpy.ndarray
+		the transmit signal in frequency domain - either the full spectrum of N 
+		components, or only the first N//2 + 1 components
+	reciever: int or numpy.ndarray, optional
+		the receiver (or array of receivers) to include the calibration factors of. 
+		Defaults to the receiver of the context. Not used for simulated data.
+	simulated: bool, optional
+		if true, the BPF, dead-time, phase and gain compensation are left out as they are 
+		not applied to simulated data
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		combined frequency response H(w) - the first N//2 + 1 components, as the response
+		is zero for the -'ve frequencies
+	numpy.ndarray
+		combined time domain multiplier m(t). If an array of receivers is provided, this 
+		contains one row for each receiver.
+	numpy.ndarray
+		range compensation r(t), sampled at profile_t
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	if(reciever is None):
+		reciever = ctx.reciever
+	
+	# the receiver is not relevant for simulated data, and is left out of the key so that
+	# all receivers share the same response
+	if(simulated):
+		reciever = 0
+	
+	N, t = ctx.N, ctx.t
+	
+	params = (ctx.fs, N, t, ctx.decimation, ctx.upsampling, ctx.fc, ctx.B, ctx.c, Xw, reciever, simulated, ctx.phase_comp_factors, ctx.gain_comp_factors)
+	
+	def calc_fused_response():
+		
+		# only the +'ve frequencies are kept, as the analytic signal zeroes the rest
+		num_components = N//2 + 1
+		bpf = bandpass_window(ctx)[:num_components]
+		
+		# BPF and inverse filter - NB the BPF is applied twice for real data, once when the 
+		# signal is prepared and again during pulse compression
+		if(simulated):
+			Hw = np.nan_to_num(bpf/Xw[:num_components])
+		else:
+			Hw = np.nan_to_num(bpf*bpf/Xw[:num_components])
+		
+		# analytic signal - double +'ve frequencies
+		Hw = 2*Hw
+		
+		# window function
+		Hw = Hw * blackman_window(ctx)[:num_components]
+		
+		# basebanding and range compensation
+		mt = np.exp(-2*1j*np.pi*ctx.fc*t) 
+		rt = (0.5 * ctx.profile_t * ctx.c)**2
+		
+		if(not simulated):
+			# dead-time compensation as a linear phase ramp, i.e. a circular shift by 410 
+			# samples, and the basebanding signal shifted to match
+			Hw = Hw * np.exp(-2*1j*np.pi*np.arange(num_components)*410/N)
+			mt = np.roll(mt, 410)
+			
+			# phase and gain compensation
+			mt = mt * (np.exp(1j*ctx.phase_comp_factors[reciever]) * ctx.gain_comp_factors[reciever])[..., None]
+		
+		return Hw, mt, rt
+	
+	return lru_cache_lookup(fused_cache, params_key(*params), FUSED_CACHE_SIZE, calc_fused_response)
+
+
+def fused_processing(Xw, Vw, reciever=None, simulated=False, ctx=None):
+	"""Performs all steps from pulse compression through to range compensation at once.
+	
+	This is equivalent to applying pulse_compression, to_analytic_signal, 
+	apply_window_function, to_baseband, non_ideal_compensation (real data only), decimate
+	and upsample (if the decimation and upsampling factors are greater than 1) and 
+	range_compensation in turn, but requires only a single multiplication in each of the 
+	frequency and time domains, and a single inverse FFT before decimation (see 
+	fused_response). For real 
+	data, the recieved signal should not be prepared using prepare_recieve_signal first,
+	as the BPF is included in the fused response.
+	
+	Since the fused response zeroes all -'ve frequencies (i.e. the components above N/2),
+	only the first N//2 + 1 components of the recieved signal are required. These can be 
+	obtained directly using a real FFT (fftw_plans.rfft), which halves the work and 
+	memory of transforming the recieved signal.
+	
+	Parameters
+	----------
+	Xw : numpy.ndarray
+		the transmit signal in frequency domain
+	Vw: numpy.ndarray
+		the recieved signal in frequency domain - either the full spectrum of N 
+		components, or only the first N//2 + 1 components. A 2D array containing one 
+		receiver in each row can also be provided.
+	reciever: int or numpy.ndarray, optional
+		the receiver (or array of receivers, one for each row of Vw) that the signal was 
+		captured by. Defaults to the receiver of the context.
+	simulated: bool, optional
+		if true, the steps that are only required for real data are left out
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		range profile y(t)
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	Hw, mt, rt = fused_response(Xw, reciever, simulated, ctx)
+	
+	# the -'ve frequency components are zero, so only the +'ve components are multiplied
+	Yw = Vw[..., :len(Hw)] * Hw
+	
+	yt = fftw_plans.ifft(Yw, ctx.N) * mt
+	
+	if(ctx.decimation > 1):
+		yt, Yw = decimate(yt, ctx)
+	
+	if(ctx.upsampling > 1):
+		yt, Yw = upsample(fftw_plans.fft(yt), ctx)
+	
+	return yt * rt
+
+
+def produce_range_profile_sim(td_targets, ctx=None):
 	"""Performs all signal processing steps to produce 1D range profile from simulated 
 	data.
 	
@@ -735,6 +1530,8 @@ def produce_range_profile_sim(td_targets):
 	td_targets : list
 		array containing the time delay (td) between transmitting the pulse, and recieving 
 		an echo for each of the targets. A longer td means the target is further away.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
@@ -742,44 +1539,41 @@ def produce_range_profile_sim(td_targets):
 		range profile y(t)
 	"""
 	
+	if(ctx is None):
+		ctx = global_context()
+	
 	# dont use recorded RX when in sim mode
-	global USE_RECORDED_RX; USE_RECORDED_RX = False
+	ctx = ctx.with_options(use_recorded_rx=False)
 	
-	xt, Xw = make_chirp()
-	vt, Vw = simulate_recieve_signal(td_targets)
-	yt, Yw = pulse_compression(Xw, Vw)
-	yt, Yw = to_analytic_signal(Yw)
-	yt, Yw = apply_window_function(Yw)
-	yt, Yw = to_baseband(yt)
-	yt, Yw = range_compensation(yt)
+	xt, Xw = make_chirp(ctx)
+	vt, Vw = simulate_recieve_signal(td_targets, ctx)
 	
+	# the fused processing cannot produce any intermediate plots
+	if(ctx.fused and not ctx.debug):
+		return fused_processing(Xw, Vw, simulated=True, ctx=ctx)
+	
+	yt, Yw = pulse_compression(Xw, Vw, ctx)
+	yt, Yw = to_analytic_signal(Yw, ctx)
+	yt, Yw = apply_window_function(Yw, ctx)
+	yt, Yw = to_baseband(yt, ctx)
+	if(ctx.decimation > 1):
+		yt, Yw = decimate(yt, ctx)
+	if(ctx.upsampling > 1):
+		yt, Yw = upsample(Yw, ctx)
+	yt, Yw = range_compensation(yt, ctx)
 	
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot1, tplot2) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Processed Range Profile", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.4)
-		
-		tplot1.plot(s,abs(yt),linewidth=0.7, color="#2da6f7")
-		tplot1.set_xlabel("d [m]")
-		tplot1.set_ylabel("{}".format("|y(t)|"))
-		
-		tplot2.plot(s, np.angle(yt),linewidth=0.7, color="#2da6f7")
-		tplot2.set_xlabel("d [m]")
-		tplot2.set_ylabel("<y(t)")
-		
-		#plt.show(block = True)
-		save_figure(fig, "{}_6_range_profile.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+	
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_6_range_profile.png".format(ctx.reciever), plot_debug_panels, "Processed Range Profile", [(ctx.profile_s, abs(yt), "d [m]", "|y(t)|"), (ctx.profile_s, np.angle(yt), "d [m]", "<y(t)")])
 	
 	
 	
 	return yt
 
 	
-def produce_range_profile(samples):
+def produce_range_profile(samples, ctx=None):
 	"""Performs all signal processing steps to produce 1D range profile from real data.
 	
 	Real data refers to data that is captured from a scene using an actual sonar, as 
@@ -790,6 +1584,8 @@ def produce_range_profile(samples):
 	----------
 	samples: numpy.ndarray
 		array of digital samples collected by a microcontroller from the sonar.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
@@ -797,75 +1593,197 @@ def produce_range_profile(samples):
 		range profile y(t)
 	"""
 	
-	# use recorded RX when in sim mode
-	global USE_RECORDED_RX; USE_RECORDED_RX = True
+	if(ctx is None):
+		ctx = global_context()
 	
-	xt, Xw = make_chirp()
-	vt, Vw = prepare_recieve_signal(np.asarray(samples)) #NB must convert to numpy array
-	yt, Yw = pulse_compression(Xw, Vw)
-	yt, Yw = to_analytic_signal(Yw)
-	yt, Yw = apply_window_function(Yw)
-	yt, Yw = to_baseband(yt)
-	yt, Yw = non_ideal_compensation(yt)
-	yt, Yw = range_compensation(yt)
+	# use recorded RX when using real data
+	ctx = ctx.with_options(use_recorded_rx=True)
 	
+	xt, Xw = make_chirp(ctx)
 	
-	# if debug mode is active, save this intermediate figure for later inspection
-	# to plot this figure in a window (i.e not the browser), uncomment the plt.show()
-	# command below
-	if(DEBUG_MODE_ACTIVE):
-		fig, (tplot1, tplot2) = plt.subplots(2, 1, figsize=(8,6))
-		fig.suptitle("Processed Range Profile", y=0.94)
-		plt.subplots_adjust(top=0.89,hspace=0.4)
-		
-		tplot1.plot(t,abs(yt),linewidth=0.7, color="#2da6f7")
-		tplot1.set_xlabel("d [m]")
-		tplot1.set_ylabel("{}".format("|y(t)|"))
-		
-		tplot2.plot(t, np.angle(yt),linewidth=0.7, color="#2da6f7")
-		tplot2.set_xlabel("d [m]")
-		tplot2.set_ylabel("<y(t)")
-		
-		#plt.show(block=False)
-		save_figure(fig, "{}_8_range_profile.png".format(DEBUG_ACTIVE_RECIEVER))
-		plt.close()
+	# the fused processing cannot produce any intermediate plots
+	if(ctx.fused and not ctx.debug):
+		vt = np.asarray(samples) #NB must convert to numpy array
+		record_recieve_signal(vt, ctx)
+		return fused_processing(Xw, fftw_plans.rfft(vt), ctx=ctx)
 	
+	vt, Vw = prepare_recieve_signal(np.asarray(samples), ctx) #NB must convert to numpy array
+	yt, Yw = pulse_compression(Xw, Vw, ctx)
+	yt, Yw = to_analytic_signal(Yw, ctx)
+	yt, Yw = apply_window_function(Yw, ctx)
+	yt, Yw = to_baseband(yt, ctx)
+	yt, Yw = non_ideal_compensation(yt, ctx=ctx)
+	if(ctx.decimation > 1):
+		yt, Yw = decimate(yt, ctx)
+	if(ctx.upsampling > 1):
+		yt, Yw = upsample(Yw, ctx)
+	yt, Yw = range_compensation(yt, ctx)
+	
+	
+	# if debug mode is active, capture this intermediate figure for later inspection. The
+	# figure is only rendered if it is requested (see capture_debug_plot)
+	if(ctx.debug):
+		capture_debug_plot("{}_8_range_profile.png".format(ctx.reciever), plot_debug_panels, "Processed Range Profile", [(ctx.profile_t, abs(yt), "d [m]", "|y(t)|"), (ctx.profile_t, np.angle(yt), "d [m]", "<y(t)")])
+	
+	
+	return yt
+
+
+def produce_range_profiles_batch_sim(td_targets, ctx=None):
+	"""Performs all signal processing steps to produce a 1D range profile for every 
+	receiver from simulated data.
+	
+	This function is equivalent to calling produce_range_profile_sim for each receiver, 
+	but every signal processing step is applied to a 2D array containing all receivers at 
+	once, with each FFT computed along the rows. If debug mode is active, each receiver is
+	processed separately instead so that its intermediate plots can be saved.
+	
+	Parameters
+	----------
+	td_targets : list
+		2D array containing the time delay (td) between transmitting the pulse, and 
+		recieving an echo for each of the targets (columns) for each receiver (rows).
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array containing range profile y(t) for each receiver
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	# intermediate plots are produced for one receiver at a time
+	if(ctx.debug):
+		range_profiles = []
+		for n in range(0, len(td_targets)):
+			range_profiles.append(produce_range_profile_sim(td_targets[n], ctx.with_options(reciever=n)))
+		return np.asarray(range_profiles)
+	
+	# dont use recorded RX when in sim mode
+	ctx = ctx.with_options(use_recorded_rx=False)
+	
+	xt, Xw = make_chirp(ctx)
+	vt, Vw = simulate_recieve_signal(td_targets, ctx)
+	
+	if(ctx.fused):
+		return fused_processing(Xw, Vw, simulated=True, ctx=ctx)
+	
+	yt, Yw = pulse_compression(Xw, Vw, ctx)
+	yt, Yw = to_analytic_signal(Yw, ctx)
+	yt, Yw = apply_window_function(Yw, ctx)
+	yt, Yw = to_baseband(yt, ctx)
+	if(ctx.decimation > 1):
+		yt, Yw = decimate(yt, ctx)
+	if(ctx.upsampling > 1):
+		yt, Yw = upsample(Yw, ctx)
+	yt, Yw = range_compensation(yt, ctx)
+	
+	return yt
+
+
+def produce_range_profiles_batch(samples, ctx=None):
+	"""Performs all signal processing steps to produce a 1D range profile for every 
+	receiver from real data.
+	
+	This function is equivalent to calling produce_range_profile for each receiver, but 
+	every signal processing step is applied to a 2D array containing all receivers at 
+	once, with each FFT computed along the rows. The calibration factors of each receiver
+	are applied to the corresponding row. If debug mode is active, each receiver is 
+	processed separately instead so that its intermediate plots can be saved.
+	
+	Parameters
+	----------
+	samples: numpy.ndarray
+		2D array of digital samples collected by a microcontroller from the sonar, with 
+		shape (receivers, samples).
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array containing range profile y(t) for each receiver
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	samples = np.asarray(samples) #NB must convert to numpy array
+	
+	# intermediate plots are produced for one receiver at a time
+	if(ctx.debug):
+		range_profiles = []
+		for n in range(0, len(samples)):
+			range_profiles.append(produce_range_profile(samples[n], ctx.with_options(reciever=n)))
+		return np.asarray(range_profiles)
+	
+	# use recorded RX when using real data, and process every receiver at once
+	ctx = ctx.with_options(use_recorded_rx=True, reciever=np.arange(len(samples)))
+	
+	xt, Xw = make_chirp(ctx)
+	
+	if(ctx.fused):
+		record_recieve_signal(samples, ctx)
+		return fused_processing(Xw, fftw_plans.rfft(samples), ctx=ctx)
+	
+	vt, Vw = prepare_recieve_signal(samples, ctx)
+	yt, Yw = pulse_compression(Xw, Vw, ctx)
+	yt, Yw = to_analytic_signal(Yw, ctx)
+	yt, Yw = apply_window_function(Yw, ctx)
+	yt, Yw = to_baseband(yt, ctx)
+	yt, Yw = non_ideal_compensation(yt, ctx=ctx)
+	if(ctx.decimation > 1):
+		yt, Yw = decimate(yt, ctx)
+	if(ctx.upsampling > 1):
+		yt, Yw = upsample(Yw, ctx)
+	yt, Yw = range_compensation(yt, ctx)
 	
 	return yt
 
 
 
-def generate_1D_image_sim():
+def generate_1D_image_sim(ctx=None):
 	"""Generates complete 1D range profile image using simulated data.
 	
 	This function is called when in simulation mode.  This function first generates the
 	simulation data, then uses this data to obtain a processed range profile to display.  
 	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
 	Returns
 	-------
 	matplotlib.figure.Figure
 		1D range profile image
 	"""
 	
-	# this variable keeps track of the current receiver being processed, and is used to
-	# label some of the intermediate plots generated by debug mode. In the case of 1D mode
-	# where only one receiver is used, this variable is fixed to 0
-	global DEBUG_ACTIVE_RECIEVER; DEBUG_ACTIVE_RECIEVER =0
+	if(ctx is None):
+		ctx = global_context()
+	
+	# the receiver being processed is used to label some of the intermediate plots 
+	# generated by debug mode. In the case of 1D mode where only one receiver is used, the
+	# receiver is fixed to 0
+	ctx = ctx.with_options(reciever=0)
 	
 	two_way_delay_to_targets = []
 	
 	for target in target_coords:
-		two_way_dist = calc_dist_polar(transmit_coord, target)+calc_dist_polar(target, reciever_coords[0])			
-		two_way_delay = two_way_dist/c
+		two_way_dist = calc_dist_polar(ctx.transmit_coord, target)+calc_dist_polar(target, ctx.reciever_coords[0])			
+		two_way_delay = two_way_dist/ctx.c
 		two_way_delay_to_targets.append(two_way_delay)
 		
-	yt = produce_range_profile_sim(two_way_delay_to_targets)
+	yt = produce_range_profile_sim(two_way_delay_to_targets, ctx)
 		
 
 	fig, (splot) = plt.subplots(1, 1, figsize=(8,6))
-	plt.subplots_adjust(top=0.97,right = 0.95, left = 0.15)
+	fig.subplots_adjust(top=0.97,right = 0.95, left = 0.15)
 
-	splot.plot(s,abs(yt),linewidth=0.7, color="#2da6f7")
+	splot.plot(ctx.profile_s,abs(yt),linewidth=0.7, color="#2da6f7")
 	splot.set_xlabel("d [m]")
 	splot.set_ylabel("{}".format("|y(t)|"))
 	#plt.show()
@@ -874,7 +1792,7 @@ def generate_1D_image_sim():
 
 	
 
-def generate_1D_image():
+def generate_1D_image(ctx=None, source=None):
 	"""Generates complete 1D range profile image using actual sonar data.
 	
 	This function is used when recieving actual sonar data, as opposed to using simulated
@@ -883,7 +1801,15 @@ def generate_1D_image():
 	recievers can be provided by the sonar. However, for 1D range profiling only a single 
 	reciever is required. Reciever 0 is used by default. The sampling rate is also 
 	obtained from the microcontroller in this function, and used to update the sampling 
-	rate used in signal processing.
+	rate of the context used in signal processing.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	source : optional
+		source of sonar data used in place of the microcontroller (see 
+		request_sonar_data)
 	
 	Returns
 	-------
@@ -891,30 +1817,32 @@ def generate_1D_image():
 		1D range profile image
 	"""
 	
-	# this variable keeps track of the current receiver being processed, and is used to
-	# label some of the intermediate plots generated by debug mode. In the case of 1D mode
-	# where only one receiver is used, this variable is fixed to 0
-	global DEBUG_ACTIVE_RECIEVER; DEBUG_ACTIVE_RECIEVER =0
+	if(ctx is None):
+		ctx = global_context()
+	
+	# the receiver being processed is used to label some of the intermediate plots 
+	# generated by debug mode. In the case of 1D mode where only one receiver is used, the
+	# receiver is fixed to 0
+	ctx = ctx.with_options(reciever=0)
 	
 	# dictionary stores all sonar data - use short_timeout=True for 1D sonar
-	dict = teensy_interface.request_sonar_data(short_timeout=True)
+	dict = request_sonar_data(source, short_timeout=True)
 	
 	# could not connect to teensy - return empty figure
 	if(len(dict)==0):
 		raise teensy_interface.SerialFormatError("","error from microcontroller")
 		
-	# the sample rate is also included in the sonar data, and must be removes from the
-	# dict before signal processing. The sample rate used is this script is updated to
-	# the sample rate from the sonar data
-	change_sample_rate(dict.pop("sample_rate"),len(dict["buffer0"]))
+	# the sample rate is also included in the sonar data. The sample rate of the context 
+	# is updated to the sample rate from the sonar data
+	ctx = ctx.with_sample_rate(dict["sample_rate"],len(dict["buffer0"]))
 	
 	# uses reciever0 of the sonar by default
-	yt = produce_range_profile(dict["buffer0"])
+	yt = produce_range_profile(dict["buffer0"], ctx)
 
 
 	fig, (splot) = plt.subplots(1, 1, figsize=(8,6))
-	plt.subplots_adjust(top=0.97, right = 0.95, left = 0.15)
-	splot.plot(s,abs(yt),linewidth=0.7, color="#2da6f7")
+	fig.subplots_adjust(top=0.97, right = 0.95, left = 0.15)
+	splot.plot(ctx.profile_s,abs(yt),linewidth=0.7, color="#2da6f7")
 	splot.set_xlabel("d [m]")
 	splot.set_ylabel("{}".format("|y(t)|"))
 	plt.show()
@@ -927,7 +1855,7 @@ def generate_1D_image():
 # 2D SIGNAL PROCESSING ALGORITHMS
 
 
-def coherent_summing(range_profiles):
+def coherent_summing(range_profiles, ctx=None):
 	"""Constructs a 2D image from the processed signals from each reciever.
 	
 	This algorithms works as follows: the scene is first divided into a polar grid. Then 
@@ -937,12 +1865,26 @@ def coherent_summing(range_profiles):
 	a target if it occupied that particular position in the grid. Each of these values 
 	are then summed using the appropriate phase compensation and aperture taping to 
 	reduce sidelobes. This process is repeated for every point in the grid to construct 
-	an image.
+	an image. 
+	
+	The delays and phase compensation for every point in the grid are obtained from the
+	geometry cache (see beamforming_geometry), so only the extraction and summing of 
+	values is done for each new set of range profiles. The delays are rounded to the 
+	nearest sample, so range profiles that were upsampled (see upsample) give a more 
+	accurate phase at no extra cost.
+	
+	If far-field beamforming is active for the context, the ranges from far_field_range
+	onwards are instead beamformed using far_field_summing. NB rad must then be in
+	ascending order. If tiled beamforming is active, the remaining (near-field) ranges are
+	beamformed one tile at a time using tiled_coherent_summing, rather than using the 
+	cached geometry of the whole grid.
 	
 	Parameters
 	----------
 	range_profiles: numpy.ndarray
 		2D array containing processed range profile from each reciever.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
@@ -956,194 +1898,1094 @@ def coherent_summing(range_profiles):
 		magnitude/range must be stored in the second dimension.
 	"""
 	
-	# NB must be [angle][magnitude] - see doc string
-	z = np.zeros((len(azm),len(rad)))
+	if(ctx is None):
+		ctx = global_context()
 	
-	# declare array stores complex numbers
-	z = np.array(z, dtype=complex)
+	range_profiles = np.asarray(range_profiles)
 	
+	# number of range bins (from the start of rad) that use near-field beamforming
+	num_near = len(ctx.rad)
+	if(ctx.far_field):
+		num_near = np.count_nonzero(ctx.rad < ctx.far_field_range)
 	
-	# apply window function to receivers to reduce side-lobes in azimuth plane
-	appature_window = [0.5, 0.8,0.95,1,1,0.95,0.8, 0.5]
-	#appature_window = [1,1,1,1,1,1,1,1]
+	z = np.zeros((len(ctx.azm), len(ctx.rad)), dtype=complex)
 	
+	if(num_near > 0 and ctx.tiled):
+		z[:, :num_near] = tiled_coherent_summing(range_profiles, num_near, ctx)
 	
-	for i in range(0, len(rad)): # for every range bin
-		for j in range(0, len(azm)): # for every azimuth angle
+	elif(num_near > 0):
+		# delay index and phase steering (including aperture taper) for every receiver and
+		# grid position - shape is (receiver, angle, range). NB must be [angle][magnitude]
+		# - see doc string
+		index, steering = beamforming_geometry(ctx)
 		
+		if(USE_NUMBA):
+			# extract, compensate and sum the values without storing them (see 
+			# numba_kernels)
+			z[:, :num_near] = numba_kernels.coherent_sum(np.ascontiguousarray(range_profiles, dtype=complex), index, steering, num_near)
+		else:
+			# extract value from each range profile at index and apply phase compensation
+			reciever_index = np.arange(len(range_profiles))[:, None, None]
+			values = range_profiles[reciever_index, index[..., :num_near]] * steering[..., :num_near]
+			
+			# sum over receivers
+			z[:, :num_near] = np.sum(values, axis=0)
 	
-			# polar coordinate given as (r, theta)
-			#focus_point = (rad[i],azm[j]) 
-			focus_point = (rad[i],azm[j])
-
-			#distance between transmitter,  focus point, and reference point (0,0)
-			dref = calc_dist_polar(transmit_coord, focus_point) + calc_dist_polar(focus_point, (0,0))
-
-			# convert distance to time
-			tref = dref / c  
-
-			for n in range(0, len(reciever_coords)): # for every receiver	
-
-				# distance between transmitter,  focus point, and receiver	
-				two_way_dist = calc_dist_polar(transmit_coord, focus_point) + calc_dist_polar(focus_point, reciever_coords[n])
-
-				# convert distance to time delay
-				two_way_td = two_way_dist / c 
-
-				# find index in range profile corresponding to time delay two_way_td
-				index = int(round(two_way_td / Δt))
-
-				# extract value from range profile at index and apply phase compensation
-				value = range_profiles[n][index] * np.exp(2*1j*np.pi*fc*(two_way_td)) * appature_window[n] #* np.exp(2*1j*np.pi*fc*(two_way_td-tref)) 
-
-
-
-				# NB must be [j][i] as later plot expects [angle, magnitude]
-				z[j][i] = z[j][i] + value 
+	if(num_near < len(ctx.rad)):
+		z[:, num_near:] = far_field_summing(range_profiles, num_near, ctx)
 	
 	z = z**0.5
 	
 	return z
 
 
-def plot_2D_image(z):
-	"""Plots polar 2D sonar image.
+def integrated_coherent_summing(range_profiles, integrator=None, ctx=None):
+	"""Constructs a 2D image from the processed signals from each reciever, integrated 
+	with the previous pings given to the integrator.
 	
-	Real data refers to data that is captured from a scene using an actual sonar, as 
-	opposed to using simulated data. This function only produces the range profile and is 
-	not responsible for aquiring sonar data. 
+	For coherent integration, the range profiles are averaged with those of the previous
+	pings before coherent summing. For incoherent integration, the magnitude of the image 
+	is averaged with those of the previous pings after coherent summing. The integrator 
+	keeps a running accumulator, so the cost does not depend on the number of pings 
+	integrated (see integration).
 	
 	Parameters
 	----------
-	z: numpy.ndarray
-		2D array of values to plot. Must be in polar coordinates.
+	range_profiles: numpy.ndarray
+		2D array containing processed range profile from each reciever.
+	integrator : integration.PingIntegrator, optional
+		integrator holding the previous pings. If None, no integration is done.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
-	matplotlib.figure.Figure
-		2D sonar image
+	numpy.ndarray
+		2D sonar image array z (see coherent_summing)
 	"""
 	
-	fig = plt.figure(figsize=(12,8))
-	r, th = np.meshgrid(rad, azm)
-	ax = plt.subplot(projection="polar")
+	if(ctx is None):
+		ctx = global_context()
 	
-	ax.set_thetamin(FIELD_OF_VIEW) # in degrees
-	ax.set_thetamax(-FIELD_OF_VIEW) # in degrees
-	#ax.set_theta_offset(np.pi/2)
+	if(integrator is not None):
+		range_profiles = integrator.integrate_range_profiles(range_profiles, ctx)
 	
-	ax.tick_params(axis='y', colors='black', direction="inout", pad=-20)
-	ax.yaxis.set_major_formatter(FormatStrFormatter('%dm'))
+	z = coherent_summing(range_profiles, ctx)
 	
-	plt.pcolormesh(th, r, abs(z), cmap="inferno")
-	plt.plot(azm, r, color='k', ls='none') 
-	plt.colorbar()
-	#plt.colorbar(orientation='horizontal')
-	#plt.grid()
-	plt.subplots_adjust(left=0.0, right=1.0, top=0.95, bottom=0.05)
-	plt.show(block=True)
+	if(integrator is not None):
+		z = integrator.integrate_image(z, ctx)
 	
-		
-	return fig
+	return z
+
+
+def progressive_coherent_summing(range_profiles, ctx=None):
+	"""Constructs a 2D image from coarse to fine, refining only the cells that contain 
+	echoes.
 	
+	The grid is first beamformed at every PROGRESSIVE_STRIDES[0]th angle and range bin, 
+	and each value is used for the whole cell (stride x stride grid positions) around it. 
+	At each following stride, only the cells whose energy |z|^2 at the previous level is 
+	at least PROGRESSIVE_THRESHOLD times the peak energy of the coarsest level (plus 
+	PROGRESSIVE_MARGIN neighbouring cells) are beamformed at the finer stride, reusing the
+	grid positions already summed. The remaining cells keep their coarse values. 
 	
-
-def generate_2D_image_sim():
-	"""Generates complete 2D sonar image using simulated data.
+	As most of a sonar image is empty, only a fraction of the grid positions are summed. 
+	At the last level (stride 1), the refined cells match the dense image, but the cells 
+	below the threshold keep their coarse values, so the image is an approximation of the
+	dense image away from the echoes (see benchmark.benchmark_progressive_imaging). The 
+	delays and phase compensation are taken from the geometry cache (see 
+	beamforming_geometry). NB far-field and tiled beamforming are not used.
 	
-	This function is called when in simulation mode.  This function first generates the
-	simulation data for each reciever, then uses this data to obtain processed range 
-	profiles for each reciever, before finally using these range profiles to build a 2D 
-	sonar image using a technique called coherrent summing.
+	The coarse image is always yielded first. Summing only the refined cells costs more 
+	per grid position than dense summing, and the two break even at about 150x150 grid 
+	positions. On a grid with fewer than PROGRESSIVE_MIN_POSITIONS positions, the coarse
+	image is therefore followed by the dense image, which is the last level. Likewise, if 
+	more than PROGRESSIVE_MAX_REFINE_FRACTION of the grid is to be refined at the next 
+	level (e.g. in a cluttered scene), the dense image is yielded as the last level.
 	
-	Returns
-	-------
-	matplotlib.figure.Figure
-		2D sonar image
+	Parameters
+	----------
+	range_profiles: numpy.ndarray
+		2D array containing processed range profile from each reciever.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Yields
+	------
+	numpy.ndarray
+		2D sonar image array z at each level, from coarsest to finest, accessed as 
+		z[angle][magnitude] (see coherent_summing)
+	
+	Raises
+	------
+	ValueError
+		If a stride in PROGRESSIVE_STRIDES does not divide the previous stride, or the
+		last stride is not 1
 	"""
 	
-	# this variable keeps track of the current receiver being processed, and is used to
-	# label some of the intermediate plots generated by debug mode
-	global DEBUG_ACTIVE_RECIEVER; DEBUG_ACTIVE_RECIEVER = 0
+	if(ctx is None):
+		ctx = global_context()
 	
-	# holds processed range profiles from each reciever
-	range_profiles = [] 
+	strides = list(PROGRESSIVE_STRIDES)
 	
-	# generate simulation data for each receiver and then range profile
-	for reciever in reciever_coords:
-		two_way_delay_to_targets = []
-		for target in target_coords:
-			two_way_dist = calc_dist_polar(transmit_coord, target) + calc_dist_polar(target, reciever)
-			two_way_delay = two_way_dist/c
-			two_way_delay_to_targets.append(two_way_delay)
-			
-			
-		range_profiles.append(produce_range_profile_sim(two_way_delay_to_targets))
+	if(strides[-1] != 1 or any(prev % stride != 0 for prev, stride in zip(strides, strides[1:]))):
+		raise ValueError("each stride must divide the previous stride, and the last stride must be 1")
+	
+	range_profiles = np.asarray(range_profiles)
+	
+	num_angles = len(ctx.azm)
+	num_ranges = len(ctx.rad)
+	
+	# dense coherent summing, without far-field or tiled beamforming so that the image
+	# matches the last level of a progressive image
+	dense_ctx = ctx.with_options(far_field=False, tiled=False)
+	
+	# geometry with the grid positions flattened - shape is (receiver, angle*range)
+	index, steering = beamforming_geometry(ctx)
+	index = index.reshape(len(index), -1)
+	steering = steering.reshape(len(steering), -1)
+	
+	# sums at each grid position, and whether they have been summed at a coarser level
+	sums = np.zeros((num_angles, num_ranges), dtype=complex)
+	summed = np.zeros((num_angles, num_ranges), dtype=bool)
+	
+	# grid positions to refine at the next level - the whole grid at the first level
+	refine = np.ones((num_angles, num_ranges), dtype=bool)
+	
+	z = np.zeros((num_angles, num_ranges), dtype=complex)
+	peak = None
+	
+	for stride in strides:
+		# grid positions of this level that are in a cell to refine, and were not summed at
+		# a coarser level
+		angles, ranges = np.nonzero(refine[::stride, ::stride] & ~summed[::stride, ::stride])
+		positions = stride*angles*num_ranges + stride*ranges
 		
-		# increment after each receiver has been processed
-		DEBUG_ACTIVE_RECIEVER+=1
+		values = np.take_along_axis(range_profiles, index[:, positions], axis=1) * steering[:, positions]
+		sums.flat[positions] = np.sum(values, axis=0)
+		summed.flat[positions] = True
+		
+		# use the value of each grid position of this level for its whole cell
+		level = sums[::stride, ::stride]
+		cells = np.repeat(np.repeat(level**0.5, stride, axis=0), stride, axis=1)[:num_angles, :num_ranges]
+		np.copyto(z, cells, where=refine)
+		
+		yield z.copy()
+		
+		if(stride == 1):
+			break
+		
+		# too small to save time by refining
+		if(num_angles * num_ranges < PROGRESSIVE_MIN_POSITIONS):
+			yield coherent_summing(range_profiles, dense_ctx)
+			return
+		
+		# find the cells to refine at the next level
+		energy = np.abs(level)**2
+		
+		if(peak is None):
+			peak = energy.max()
+		
+		above = energy >= PROGRESSIVE_THRESHOLD * peak
+		
+		for _ in range(PROGRESSIVE_MARGIN):
+			grown = above.copy()
+			grown[1:, :] |= above[:-1, :]
+			grown[:-1, :] |= above[1:, :]
+			above = grown.copy()
+			above[:, 1:] |= grown[:, :-1]
+			above[:, :-1] |= grown[:, 1:]
+		
+		refine = np.repeat(np.repeat(above, stride, axis=0), stride, axis=1)[:num_angles, :num_ranges]
+		
+		# too much of the grid to refine to save time
+		if(np.mean(refine) > PROGRESSIVE_MAX_REFINE_FRACTION):
+			yield coherent_summing(range_profiles, dense_ctx)
+			return
+
+
+def tiled_coherent_summing(range_profiles, num_ranges=None, ctx=None):
+	"""Performs near-field coherent summing one tile of the polar grid at a time.
+	
+	The grid is split into tiles of at most BEAMFORMING_TILE_SIZE angles by 
+	BEAMFORMING_TILE_SIZE range bins. The geometry of each tile is calculated, used and 
+	discarded in turn (see sum_tile), so memory use is bounded by the tile size rather 
+	than the grid size. NB the geometry is therefore calculated for every image, rather 
+	than cached.
+	
+	If BEAMFORMING_WORKERS is greater than 1, the tiles are evaluated by a pool of worker 
+	processes (see get_beamforming_pool). The range profiles are copied once into shared 
+	memory, which every worker reads from, and only the summed tiles are sent back.
+	
+	Parameters
+	----------
+	range_profiles: numpy.ndarray
+		2D array containing processed range profile from each reciever.
+	num_ranges: int, optional
+		number of range bins (from the start of rad) to beamform. Defaults to all of rad.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array of summed values, accessed as [angle][range]. NB unlike 
+		coherent_summing, the square root is not taken.
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	if(num_ranges is None):
+		num_ranges = len(ctx.rad)
+	
+	range_profiles = np.ascontiguousarray(range_profiles)
+	geometry = (ctx.reciever_coords, ctx.transmit_coord, ctx.c, ctx.fc, ctx.profile_Δt, ctx.appature_window)
+	
+	# (angles, ranges) slices of each tile
+	tiles = []
+	for first_angle in range(0, len(ctx.azm), BEAMFORMING_TILE_SIZE):
+		for first_range in range(0, num_ranges, BEAMFORMING_TILE_SIZE):
+			tiles.append((slice(first_angle, first_angle + BEAMFORMING_TILE_SIZE), slice(first_range, min(first_range + BEAMFORMING_TILE_SIZE, num_ranges))))
+	
+	z = np.zeros((len(ctx.azm), num_ranges), dtype=complex)
+	
+	if(BEAMFORMING_WORKERS <= 1):
+		for angles, ranges in tiles:
+			z[angles, ranges] = sum_tile(range_profiles, ctx.rad[ranges], ctx.azm[angles], geometry)
+		return z
+	
+	shm = shared_memory.SharedMemory(create=True, size=range_profiles.nbytes)
+	
+	try:
+		shared = np.ndarray(range_profiles.shape, dtype=range_profiles.dtype, buffer=shm.buf)
+		shared[...] = range_profiles
+		del shared
+		
+		pool = get_beamforming_pool()
+		futures = [(angles, ranges, pool.submit(beamform_tile, shm.name, range_profiles.shape, range_profiles.dtype.str, ctx.rad[ranges], ctx.azm[angles], geometry)) for angles, ranges in tiles]
+		
+		for angles, ranges, future in futures:
+			z[angles, ranges] = future.result()
+	finally:
+		shm.close()
+		shm.unlink()
+	
+	return z
+
+
+def sum_tile(range_profiles, rad, azm, geometry):
+	"""Performs coherent summing for a single tile of the polar grid.
+	
+	Parameters
+	----------
+	range_profiles: numpy.ndarray
+		2D array containing processed range profile from each reciever.
+	rad: numpy.ndarray
+		radial axis of the tile [m]
+	azm: numpy.ndarray
+		azimuth axis of the tile [rad]
+	geometry: tuple
+		the remaining parameters of calc_beamforming_geometry, i.e. reciever_coords, 
+		transmit_coord, c, fc, Δt and appature_window
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array of summed values for the tile, accessed as [angle][range]
+	"""
+	
+	index, steering = calc_beamforming_geometry(rad, azm, *geometry)
+	
+	if(USE_NUMBA):
+		return numba_kernels.coherent_sum(np.ascontiguousarray(range_profiles, dtype=complex), index, steering, len(rad))
+	
+	reciever_index = np.arange(len(range_profiles))[:, None, None]
+	
+	return np.sum(range_profiles[reciever_index, index] * steering, axis=0)
+
+
+def beamform_tile(shm_name, shape, dtype, rad, azm, geometry):
+	"""Performs coherent summing for a single tile in a worker process, reading the range
+	profiles from shared memory.
+	
+	Parameters
+	----------
+	shm_name: str
+		name of the shared memory block containing the range profiles
+	shape: tuple
+		shape of the range profiles
+	dtype: str
+		data type of the range profiles
+	rad, azm, geometry
+		see sum_tile
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array of summed values for the tile, accessed as [angle][range]
+	"""
+	
+	shm = shared_memory.SharedMemory(name=shm_name)
+	
+	range_profiles = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+	z = sum_tile(range_profiles, rad, azm, geometry)
+	
+	# the array must be released before the shared memory can be closed
+	del range_profiles
+	shm.close()
+	
+	return z
+
+
+def get_beamforming_pool():
+	"""Returns the process pool used for tiled beamforming.
+	
+	The pool is created the first time it is needed, and created again if 
+	BEAMFORMING_WORKERS has changed since.
+	
+	Returns
+	-------
+	concurrent.futures.ProcessPoolExecutor
+		pool with BEAMFORMING_WORKERS worker processes
+	"""
+	
+	global beamforming_pool
+	
+	with beamforming_pool_lock:
+		if(beamforming_pool is None or beamforming_pool[0] != BEAMFORMING_WORKERS):
+			if(beamforming_pool is not None):
+				beamforming_pool[1].shutdown()
+			
+			beamforming_pool = (BEAMFORMING_WORKERS, concurrent.futures.ProcessPoolExecutor(max_workers=BEAMFORMING_WORKERS))
+		
+		return beamforming_pool[1]
+
+
+def shutdown_beamforming_pool():
+	"""Shuts down the process pool used for tiled beamforming, if it was created. Called 
+	automatically when the program exits."""
+	
+	global beamforming_pool
+	
+	with beamforming_pool_lock:
+		if(beamforming_pool is not None):
+			beamforming_pool[1].shutdown()
+			beamforming_pool = None
+
+
+# shut down the worker processes when the program (e.g. the webserver) exits
+atexit.register(shutdown_beamforming_pool)
+
+
+def far_field_summing(range_profiles, first=0, ctx=None):
+	"""Forms every azimuth beam at each range using a far-field approximation.
+	
+	In the far field, the two-way delay from the transmitter, via a grid position at
+	(r, θ), to a receiver at y_n along a uniform linear array is approximately
+	(2r - y_n*sin(θ))/c. The envelope delay 2r/c is then the same for every receiver, so
+	a single value is extracted from each range profile per range bin. The steering phase
+	exp(-2πi*fc*y_n*sin(θ)/c) is a linear progression across the array, so the sum over
+	receivers for every angle is the FFT across the receivers, evaluated at the spatial
+	frequency y_1*sin(θ)/λ (cycles per receiver) of each angle. The FFT is zero-padded
+	to FAR_FIELD_FFT_SIZE points and each angle uses its nearest bin, which gives a cost
+	of O(R*A + R*M*log(M)) for R ranges, A angles and an M point FFT, rather than
+	O(R*A*receivers).
+	
+	The range indices, FFT bins and phase terms are cached (see far_field_geometry).
+	
+	Parameters
+	----------
+	range_profiles: numpy.ndarray
+		2D array containing processed range profile from each reciever.
+	first: int, optional
+		index of the first range bin of rad to beamform
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array of beams, accessed as [angle][range], for the range bins from first
+		onwards. NB unlike coherent_summing, the square root is not taken.
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	range_index, range_phase, fft_bin, angle_phase = far_field_geometry(ctx)
+	
+	# extract a single value from each range profile per range bin, and apply the
+	# aperture taper - shape is (range, receiver)
+	values = np.asarray(range_profiles)[:, range_index[first:]].T * np.asarray(ctx.appature_window)
+	
+	# sum over receivers for every spatial frequency - shape is (range, FFT bin)
+	padded = np.zeros((len(values), FAR_FIELD_FFT_SIZE), dtype=complex)
+	padded[:, :values.shape[1]] = values
+	spectrum = fftw_plans.fft(padded)
+	
+	# pick the bin of each angle - shape is (angle, range)
+	z = spectrum[:, fft_bin].T * angle_phase[:, None] * range_phase[first:]
+	
+	return z
+
+
+def calc_far_field_geometry(rad, azm, reciever_coords, transmit_coord, c, fc, Δt, fft_size):
+	"""Calculates the range index, FFT bin and phase terms used in far-field beamforming.
+	
+	Parameters
+	----------
+	rad: numpy.ndarray
+		radial axis of the polar grid [m]
+	azm: numpy.ndarray
+		azimuth axis of the polar grid [rad]
+	reciever_coords: list
+		polar coordinates (r, theta) of each receiver
+	transmit_coord: tuple
+		polar coordinates (r, theta) of the transmitter
+	c: float
+		speed of sound [m/s]
+	fc: float
+		center frequency of sonar [Hz]
+	Δt: float
+		sample spacing of the range profiles [s], i.e. profile_Δt
+	fft_size: int
+		number of points in the FFT across the receivers
+	
+	Returns
+	-------
+	numpy.ndarray
+		index into each range profile for each range bin
+	numpy.ndarray
+		carrier phase term for each range bin
+	numpy.ndarray
+		FFT bin for each azimuth angle
+	numpy.ndarray
+		phase term for each azimuth angle, referencing the steering phase to the position
+		of the transmitter and first receiver
+	
+	Raises
+	------
+	ValueError
+		If the receivers are not evenly spaced along the y axis, or the transmitter is not
+		on the y axis
+	"""
+	
+	# rectangular coordinates of each transducer
+	reciever_x = np.array([coord[0]*np.cos(coord[1]) for coord in reciever_coords])
+	reciever_y = np.array([coord[0]*np.sin(coord[1]) for coord in reciever_coords])
+	transmit_x = transmit_coord[0]*np.cos(transmit_coord[1])
+	transmit_y = transmit_coord[0]*np.sin(transmit_coord[1])
+	
+	spacing = reciever_y[1] - reciever_y[0]
+	
+	if(not np.allclose(np.diff(reciever_y), spacing) or not np.allclose(np.append(reciever_x, transmit_x), 0)):
+		raise ValueError("Far-field beamforming requires a uniform linear array of receivers along the y axis, with the transmitter on the same axis")
+	
+	# envelope delay and carrier phase of each range bin
+	two_way_td = 2 * np.asarray(rad) / c
+	range_index = np.round(two_way_td / Δt).astype(int)
+	range_phase = np.exp(2*1j*np.pi*fc*two_way_td)
+	
+	# spatial frequency of each angle in cycles per receiver, rounded to the nearest FFT
+	# bin. NB the spatial frequency may exceed 0.5 if the spacing is more than λ/2, in
+	# which case it wraps around the FFT (i.e. grating lobes)
+	λ = c / fc
+	nearest_bin = np.round(spacing*np.sin(azm)/λ * fft_size).astype(int)
+	spatial_freq = nearest_bin / fft_size
+	fft_bin = nearest_bin % fft_size
+	
+	# the FFT references the steering phase to the first receiver, so shift the reference
+	# to the origin, including the path from the transmitter
+	angle_phase = np.exp(-2*1j*np.pi*spatial_freq*(reciever_y[0] + transmit_y)/spacing)
+	
+	return range_index, range_phase, fft_bin, angle_phase
+
+
+def far_field_geometry(ctx=None):
+	"""Returns the range index, FFT bin and phase terms used in far-field beamforming for
+	the current scene geometry and sample rate.
+	
+	The tables are kept in the in-memory geometry cache alongside the near-field tables
+	(see beamforming_geometry), keyed by all the parameters they depend on.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	tuple
+		range index, range phase, FFT bin and angle phase - see calc_far_field_geometry
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	params = (ctx.rad, ctx.azm, ctx.reciever_coords, ctx.transmit_coord, ctx.c, ctx.fc, ctx.profile_Δt, FAR_FIELD_FFT_SIZE)
+	key = "far_field_" + params_key(*params)
+	
+	return lru_cache_lookup(geometry_cache, key, GEOMETRY_CACHE_SIZE, lambda: calc_far_field_geometry(*params))
+
+
+def calc_beamforming_geometry(rad, azm, reciever_coords, transmit_coord, c, fc, Δt, appature_window):
+	"""Calculates the delay index and phase steering term for every receiver and grid 
+	position used in coherent summing.
+	
+	All grid positions are evaluated at once by broadcasting the polar grid against the
+	receiver coordinates.
+	
+	Parameters
+	----------
+	rad: numpy.ndarray
+		radial axis of the polar grid [m]
+	azm: numpy.ndarray
+		azimuth axis of the polar grid [rad]
+	reciever_coords: list
+		polar coordinates (r, theta) of each receiver
+	transmit_coord: tuple
+		polar coordinates (r, theta) of the transmitter
+	c: float
+		speed of sound [m/s]
+	fc: float
+		center frequency of sonar [Hz]
+	Δt: float
+		sample spacing of the range profiles [s], i.e. profile_Δt after decimation and 
+		upsampling
+	appature_window: list
+		aperture taper applied to each receiver
+	
+	Returns
+	-------
+	numpy.ndarray
+		index into each range profile, with shape (receiver, angle, range)
+	numpy.ndarray
+		complex phase compensation and aperture taper, with shape (receiver, angle, range)
+	"""
+	
+	# polar coordinate given as (r, theta) for every grid position - shape (angle, range)
+	r, th = np.meshgrid(rad, azm)
+	focus_point = (r, th)
+	
+	# coordinates of each receiver, shaped to broadcast against the polar grid
+	reciever_r = np.array([coord[0] for coord in reciever_coords])[:, None, None]
+	reciever_th = np.array([coord[1] for coord in reciever_coords])[:, None, None]
+	
+	# distance between transmitter, focus point, and receiver	
+	two_way_dist = calc_dist_polar(transmit_coord, focus_point) + calc_dist_polar(focus_point, (reciever_r, reciever_th))
+	
+	# convert distance to time delay
+	two_way_td = two_way_dist / c 
+	
+	# find index in range profile corresponding to time delay two_way_td
+	index = np.round(two_way_td / Δt).astype(int)
+	
+	# phase compensation combined with aperture taper
+	steering = np.exp(2*1j*np.pi*fc*two_way_td) * np.asarray(appature_window)[:, None, None]
+	
+	return index, steering
+
+
+def beamforming_geometry(ctx=None):
+	"""Returns the delay index and phase steering term used in coherent summing for the 
+	current scene geometry and sample rate.
+	
+	The geometry tables are looked up in the in-memory cache using a key built from all
+	the parameters they depend on (see params_key). If not found in memory, they are 
+	loaded from GEOMETRY_CACHE_DIR (if set), or else calculated and saved. At most 
+	GEOMETRY_CACHE_SIZE tables are kept in memory, evicting the least recently used.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		index into each range profile, with shape (receiver, angle, range)
+	numpy.ndarray
+		complex phase compensation and aperture taper, with shape (receiver, angle, range)
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	params = (ctx.rad, ctx.azm, ctx.reciever_coords, ctx.transmit_coord, ctx.c, ctx.fc, ctx.profile_Δt, ctx.appature_window)
+	key = params_key(*params)
+	
+	def load_beamforming_geometry():
+		
+		if(GEOMETRY_CACHE_DIR is None):
+			return calc_beamforming_geometry(*params)
+		
+		from os import makedirs,path
+		
+		filepath = "{}/geometry_{}.npz".format(GEOMETRY_CACHE_DIR, key)
+		
+		if(path.isfile(filepath)):
+			with np.load(filepath) as tables:
+				return tables["index"], tables["steering"]
+		
+		index, steering = calc_beamforming_geometry(*params)
+		
+		makedirs(GEOMETRY_CACHE_DIR, exist_ok=True)
+		np.savez(filepath, index=index, steering=steering)
+		
+		return index, steering
+	
+	return lru_cache_lookup(geometry_cache, key, GEOMETRY_CACHE_SIZE, load_beamforming_geometry)
+
+
+def params_key(*params):
+	"""Returns a hex digest that uniquely identifies a set of parameters.
+	
+	Each parameter is converted to a numpy array, and its data type, shape and bytes are
+	hashed.
+	
+	Parameters
+	----------
+	*params
+		the parameters to identify, e.g. those passed to calc_beamforming_geometry
+	"""
+	
+	sha = hashlib.sha1()
+	for param in params:
+		arr = np.asarray(param)
+		sha.update("{}{}".format(arr.dtype.str, arr.shape).encode())
+		sha.update(arr.tobytes())
+	
+	return sha.hexdigest()
+
+
+def lru_cache_lookup(cache, key, max_size, calc):
+	"""Looks up a value in a least recently used (LRU) cache, calculating it if missing.
+	
+	The cache is only locked (using cache_lock) while it is read or updated, and not while
+	the value is calculated, so threads never wait for each other's calculations. Two 
+	threads may therefore calculate the same missing value at once, in which case the
+	value calculated last is kept.
+	
+	Parameters
+	----------
+	cache: collections.OrderedDict
+		the cache, ordered from least to most recently used
+	key: str
+		the key of the value to look up
+	max_size: int
+		maximum number of values kept in the cache
+	calc: function
+		called without arguments to calculate the value if it is not in the cache
+	
+	Returns
+	-------
+	object
+		the cached value
+	"""
+	
+	with cache_lock:
+		if(key in cache):
+			cache.move_to_end(key)
+			return cache[key]
+	
+	value = calc()
+	
+	with cache_lock:
+		cache[key] = value
+		
+		# evict least recently used values
+		while(len(cache) > max_size):
+			cache.popitem(last=False)
+	
+	return value
+
+
+def clear_geometry_cache():
+	"""Removes all geometry tables from the in-memory cache. Files saved to 
+	GEOMETRY_CACHE_DIR are not deleted."""
+	
+	with cache_lock:
+		geometry_cache.clear()
+
+
+def plot_2D_image(z, ctx=None):
+	"""Plots polar 2D sonar image.
+	
+	Real data refers to data that is captured from a scene using an actual sonar, as 
+	opposed to using simulated data. This function only produces the range profile and is 
+	not responsible for aquiring sonar data. 
+	
+	Parameters
+	----------
+	z: numpy.ndarray
+		2D array of values to plot. Must be in polar coordinates.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	matplotlib.figure.Figure
+		2D sonar image
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	# the figure is created without pyplot, and drawn on directly rather than through the
+	# current pyplot figure, so that images can be plotted by multiple threads at once
+	fig = Figure(figsize=(12,8))
+	r, th = np.meshgrid(ctx.rad, ctx.azm)
+	ax = fig.add_subplot(projection="polar")
+	
+	# the plot covers the polar grid of the context, i.e. the field of view or a region of
+	# interest (see ProcessingContext.with_region)
+	ax.set_thetamin(np.degrees(ctx.azm[-1])) # in degrees
+	ax.set_thetamax(np.degrees(ctx.azm[0])) # in degrees
+	ax.set_rorigin(0)
+	ax.set_rlim(ctx.rad[0], ctx.rad[-1])
+	#ax.set_theta_offset(np.pi/2)
+	
+	ax.tick_params(axis='y', colors='black', direction="inout", pad=-20)
+	ax.yaxis.set_major_formatter(FormatStrFormatter('%gm'))
+	
+	mesh = ax.pcolormesh(th, r, abs(z), cmap="inferno")
+	ax.plot(ctx.azm, r, color='k', ls='none') 
+	fig.colorbar(mesh)
+	#plt.colorbar(orientation='horizontal')
+	#plt.grid()
+	fig.subplots_adjust(left=0.0, right=1.0, top=0.95, bottom=0.05)
+	
+		
+	return fig
+	
+	
+
+def generate_2D_image_sim(ctx=None, region=None, density=1, integrator=None):
+	"""Generates complete 2D sonar image using simulated data.
+	
+	This function is called when in simulation mode.  This function first generates the
+	simulation data for each reciever, then uses this data to obtain processed range 
+	profiles for each reciever, before finally using these range profiles to build a 2D 
+	sonar image using a technique called coherrent summing.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	region : tuple, optional
+		region of interest (min_range, max_range, min_angle, max_angle) to image, in 
+		meters and degrees. Defaults to the full polar grid of the context.
+	density : float, optional
+		density of the grid within the region of interest, relative to the grid of the 
+		context (see ProcessingContext.with_region). Only used if a region is given.
+	integrator : integration.PingIntegrator, optional
+		if given, this ping is integrated with the previous pings given to the same 
+		integrator (see integrated_coherent_summing)
+	
+	Returns
+	-------
+	matplotlib.figure.Figure
+		2D sonar image
+	
+	Raises
+	------
+	ValueError
+		If the region of interest or density is not valid
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	if(region is not None):
+		ctx = ctx.with_region(*region, density=density)
+	
+	# produce range profiles for all receivers at once from simulated data
+	range_profiles = simulate_2D_range_profiles(ctx)
+	
+	# form 2D array from range_profiles for 2D image
+	z = integrated_coherent_summing(range_profiles, integrator, ctx)
+	
+	# return the 2D sonar image
+	return plot_2D_image(z, ctx)
+
+
+def generate_2D_image(ctx=None, region=None, density=1, integrator=None, source=None):
+	"""Generates complete 2D sonar image using actual sonar data.
+	
+	This function is used when recieving actual sonar data, as opposed to using simulated
+	data. This function first obtains the sonar data for each reciever using the 
+	teensy_interface, then uses this data to obtain processed range profiles for each 
+	reciever, before finally using these range profiles to build a 2D sonar image using a 
+	technique called coherrent summing. The sampling rate is also obtained from the 
+	microcontroller in this function, and used to update the sampling rate of the context
+	used in signal processing.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	region : tuple, optional
+		region of interest (min_range, max_range, min_angle, max_angle) to image, in 
+		meters and degrees. Defaults to the full polar grid of the context.
+	density : float, optional
+		density of the grid within the region of interest, relative to the grid of the 
+		context (see ProcessingContext.with_region). Only used if a region is given.
+	integrator : integration.PingIntegrator, optional
+		if given, this ping is integrated with the previous pings given to the same 
+		integrator (see integrated_coherent_summing)
+	source : optional
+		source of sonar data used in place of the microcontroller (see 
+		request_sonar_data)
 	
+	Returns
+	-------
+	matplotlib.figure.Figure
+		2D sonar image
 	
-
+	Raises
+	------
+	ValueError
+		If the region of interest or density is not valid
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	if(region is not None):
+		ctx = ctx.with_region(*region, density=density)
 	
+	# request sonar data from the microcontroller and produce range profiles for all 
+	# receivers at once. The context is updated to the sample rate of the sonar data
+	range_profiles, ctx = capture_2D_range_profiles(ctx, source)
 	
 	# form 2D array from range_profiles for 2D image
-	z = coherent_summing(range_profiles)
+	z = integrated_coherent_summing(range_profiles, integrator, ctx)
 	
 	# return the 2D sonar image
-	return plot_2D_image(z)
+	return plot_2D_image(z, ctx)
 
 
-def generate_2D_image():
-	"""Generates complete 2D sonar image using actual sonar data.
+def generate_2D_image_progressive(ctx=None, sim_mode=False, region=None, density=1, source=None):
+	"""Generates a 2D sonar image progressively, from a coarse grid to the full grid.
 	
-	This function is used when recieving actual sonar data, as opposed to using simulated
-	data. This function first obtains the sonar data for each reciever using the 
-	teensy_interface, then uses this data to obtain processed range profiles for each 
-	reciever, before finally using these range profiles to build a 2D sonar image using a 
-	technique called coherrent summing. The sampling rate is also obtained from the 
-	microcontroller in this function, and used to update the sampling rate used in signal 
-	processing.
+	The range profiles are produced as in generate_2D_image_sim (if sim_mode is true) or
+	generate_2D_image, and a figure is then yielded for each level of 
+	progressive_coherent_summing. The first (coarse) image is therefore available after 
+	a fraction of the time taken to beamform the full grid, and each later image refines 
+	only the cells that contain echoes. On small grids, the coarse image is followed by 
+	the dense image (see progressive_coherent_summing). NB no data is captured until the 
+	first image is requested from the generator.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	sim_mode : bool, optional
+		if true, simulated data is used, else data is captured from the microcontroller
+	region : tuple, optional
+		region of interest (min_range, max_range, min_angle, max_angle) to image - see 
+		generate_2D_image
+	density : float, optional
+		density of the grid within the region of interest - see generate_2D_image
+	source : optional
+		source of sonar data used in place of the microcontroller (see 
+		request_sonar_data). Not used if sim_mode is true.
+	
+	Yields
+	------
+	matplotlib.figure.Figure
+		2D sonar image at each level, from coarsest to finest
+	
+	Raises
+	------
+	ValueError
+		If the region of interest or density is not valid
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	if(region is not None):
+		ctx = ctx.with_region(*region, density=density)
+	
+	if(sim_mode):
+		range_profiles = simulate_2D_range_profiles(ctx)
+	else:
+		range_profiles, ctx = capture_2D_range_profiles(ctx, source)
+	
+	for z in progressive_coherent_summing(range_profiles, ctx):
+		yield plot_2D_image(z, ctx)
+
+
+def simulate_2D_range_profiles(ctx=None):
+	"""Produces a range profile for each receiver from simulated echoes off the targets in
+	target_coords.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
 	
 	Returns
 	-------
-	matplotlib.figure.Figure
-		2D sonar image
+	numpy.ndarray
+		2D array containing range profile y(t) for each receiver
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	# produce range profiles for all receivers at once
+	return produce_range_profiles_batch_sim(simulate_target_delays(ctx), ctx)
+
+
+def simulate_target_delays(ctx=None):
+	"""Returns the two-way delay to each of the targets in target_coords for each receiver.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	list
+		2D array containing the time delay to each target (columns) for each receiver 
+		(rows)
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	# holds time delays to each target for each reciever
+	two_way_delays = [] 
+	
+	# generate simulation data for each receiver
+	for reciever in ctx.reciever_coords:
+		two_way_delay_to_targets = []
+		for target in target_coords:
+			two_way_dist = calc_dist_polar(ctx.transmit_coord, target) + calc_dist_polar(target, reciever)
+			two_way_delay = two_way_dist/ctx.c
+			two_way_delay_to_targets.append(two_way_delay)
+		
+		two_way_delays.append(two_way_delay_to_targets)
+	
+	return two_way_delays
+
+
+def capture_2D_range_profiles(ctx=None, source=None):
+	"""Requests sonar data for every receiver from the microcontroller, and produces a 
+	range profile for each receiver.
+	
+	The sampling rate is also obtained from the microcontroller, and used to update the
+	sampling rate of the context.
+	
+	Parameters
+	----------
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	source : optional
+		source of sonar data used in place of the microcontroller (see 
+		request_sonar_data)
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array containing range profile y(t) for each receiver
+	ProcessingContext
+		the context with the sample rate of the sonar data
+	
+	Raises
+	------
+	teensy_interface.TeensyError
+		If there is a problem with the microcontroller
 	"""
 	
-	# this variable keeps track of the current receiver being processed, and is used to
-	# label some of the intermediate plots generated by debug mode
-	global DEBUG_ACTIVE_RECIEVER; DEBUG_ACTIVE_RECIEVER =0
+	if(ctx is None):
+		ctx = global_context()
 	
 	# dictionary stores all sonar data - use short_timeout=False for 2D sonar
-	dict = teensy_interface.request_sonar_data(short_timeout=False)
+	dict = request_sonar_data(source, short_timeout=False)
 	
 	# could not connect to teensy - return empty figure
 	if(len(dict)==0):
 		raise teensy_interface.SerialFormatError("","error from microcontroller")
 	
+	return sonar_data_range_profiles(dict, ctx)
+
+
+def request_sonar_data(source=None, short_timeout=False):
+	"""Requests sonar data from the microcontroller, or from another source of sonar data.
 	
-	# the sample rate is also included in the sonar data, and must be removes from the
-	# dict before signal processing. The sample rate used is this script is updated to
-	# the sample rate from the sonar data
-	change_sample_rate(dict.pop("sample_rate"),len(dict["buffer0"])) #NB must pop sample rate
+	A source is any object with a request_sonar_data method that returns sonar data in 
+	the same format as teensy_interface.request_sonar_data, such as 
+	capture_archive.ReplaySource. If ARCHIVE_FILEPATH is set, sonar data from the 
+	microcontroller (but not from any other source) is appended to the capture archive.
 	
+	Parameters
+	----------
+	source : optional
+		source of sonar data. Defaults to the microcontroller (i.e. teensy_interface).
+	short_timeout : bool, optional
+		see teensy_interface.request_sonar_data
 	
-	# holds processed range profiles from each reciever
-	range_profiles = []
+	Returns
+	-------
+	dict
+		the sample rate, maximum adc code, and the recieve signal buffer of each receiver
 	
-	# generate range profile for each receiver using sonar data
-	for reciever in dict:
-		range_profiles.append(produce_range_profile(dict[reciever]))
-		
-		# increment after each receiver has been processed
-		DEBUG_ACTIVE_RECIEVER+=1
+	Raises
+	------
+	teensy_interface.TeensyError
+		If there is a problem with the microcontroller, or the source has no more data
+	"""
 	
-	# form 2D array from range_profiles for 2D image
-	z = coherent_summing(range_profiles)
+	if(source is None):
+		source = teensy_interface
 	
-	# return the 2D sonar image
-	return plot_2D_image(z)
+	sonar_data = source.request_sonar_data(short_timeout=short_timeout)
+	
+	if(ARCHIVE_FILEPATH is not None and source is teensy_interface and len(sonar_data) > 0):
+		capture_archive.archive_sonar_data(ARCHIVE_FILEPATH, sonar_data)
+	
+	return sonar_data
+
+
+def sonar_data_range_profiles(sonar_data, ctx=None):
+	"""Produces a range profile for each receiver from sonar data already retrieved from 
+	the microcontroller (see teensy_interface.request_sonar_data).
+	
+	Parameters
+	----------
+	sonar_data : dict
+		the sample rate, and the recieve signal buffer of each receiver. NB the dictionary 
+		is not modified.
+	ctx : ProcessingContext, optional
+		parameters used for processing. Defaults to a snapshot of the global variables.
+	
+	Returns
+	-------
+	numpy.ndarray
+		2D array containing range profile y(t) for each receiver
+	ProcessingContext
+		the context with the sample rate of the sonar data
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	# the sample rate and maximum adc code are also included in the sonar data, and must 
+	# be excluded from the buffers before signal processing. The sample rate of the 
+	# context is updated to the sample rate from the sonar data
+	buffers = [sonar_data[reciever] for reciever in sonar_data if reciever.startswith("buffer")]
+	ctx = ctx.with_sample_rate(sonar_data["sample_rate"], len(sonar_data["buffer0"]))
+	
+	# generate range profile for each receiver using sonar data - all receivers are 
+	# processed at once as rows of a 2D array
+	range_profiles = produce_range_profiles_batch(buffers, ctx)
+	
+	return range_profiles, ctx
 
 
 # -------------------------------------------------------------------------------------- #
@@ -1156,16 +2998,176 @@ def rect(t):
 	return abs(t) < 0.5  * 1.0
 	
 
-def generate_noise():
+def full_spectrum(Xw, n):
+	"""Returns the full spectrum of a real signal from its +'ve frequency components.
+	
+	The FFT of a real signal is conjugate symmetric, so the components above n/2 are the
+	complex conjugates of those below. This allows the full spectrum of a real signal to
+	be obtained from a real FFT (e.g. fftw_plans.rfft), which is cheaper to compute than a
+	complex FFT.
+	
+	Parameters
+	----------
+	Xw: numpy.ndarray
+		the first n//2 + 1 components of the FFT of a real signal, along the last axis
+	n: int
+		number of samples in the real signal
+	
+	Returns
+	-------
+	numpy.ndarray
+		all n components of the FFT of the real signal
+	"""
+	
+	return np.concatenate((Xw, np.conj(Xw[..., 1:n - n//2][..., ::-1])), axis=-1)
+
+
+def analytic_spectrum(Xw, n):
+	"""Returns the full spectrum of an analytic signal from its +'ve frequency components.
+	
+	The components above n/2 (i.e. the -'ve frequencies) of an analytic signal are zero 
+	(see to_analytic_signal). This is only used to plot the spectrum.
+	
+	Parameters
+	----------
+	Xw: numpy.ndarray
+		the first n//2 + 1 components of the analytic signal, along the last axis
+	n: int
+		number of samples in the analytic signal
+	
+	Returns
+	-------
+	numpy.ndarray
+		all n components of the analytic signal
+	"""
+	
+	Yw = np.zeros(np.shape(Xw)[:-1] + (n,), dtype=complex)
+	Yw[..., :np.shape(Xw)[-1]] = Xw
+	
+	return Yw
+
+
+def bandpass_window(ctx=None):
+	"""Defines a BPF over the bandwidth of the sonar, centered on fc.
+	
+	Both the +'ve and -'ve frequencies are included in the pass band.
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	window = rect((ctx.f -ctx.fc % (ctx.N * ctx.Δf))/ctx.B)
+	
+	return window + window[::-1] # to account for the +'ve and -'ve freq
+	
+
+def blackman_window(ctx=None):
+	"""Defines a Blackman window over the bandwidth of the sonar, centered on fc."""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	f, fc, B = ctx.f, ctx.fc, ctx.B
+	
+	#co-efficients for Blackman window 
+	a0 = 0.42
+	a1 = 0.5
+	a2 = 0.08
+	
+	# if the desired bandwidth of the window function is different to the bandwidth of the
+	# chirp signal, then change the 1 in the following expression
+	B_window = B * 1
+	
+	# define window transfer function
+	Hw = a0 - a1*np.cos((2 * np.pi * (f+fc+B/2))/(B_window)) + a2*np.cos((4 * np.pi * (f+fc+B/2))/(B_window))
+	Hw = Hw * rect((f-fc)/B)
+	
+	return Hw
+
+
+def decimation_filter(num_samples, factor):
+	"""Returns the frequency response of the anti-alias filter used by decimate.
+	
+	The filter is a sinc with cut-off at 1/(2*factor) of the sample rate, tapered by a 
+	Blackman window spanning DECIMATION_FILTER_SPAN decimated samples on either side of 
+	its center, and normalised to unity gain at 0 Hz. The center of the filter is placed 
+	at the first sample (wrapping around) so that the filter does not delay the signal.
+	The frequency response is cached, keyed by the number of samples and factor.
+	
+	Parameters
+	----------
+	num_samples: int
+		number of samples in the (zero-padded) signal to filter
+	factor: int
+		the decimation factor
+	
+	Returns
+	-------
+	numpy.ndarray
+		frequency response of the filter, with num_samples components
+	"""
+	
+	def calc_decimation_filter():
+		
+		span = DECIMATION_FILTER_SPAN * factor
+		n = np.arange(-span, span + 1)
+		
+		# co-efficients for Blackman window
+		a0 = 0.42
+		a1 = 0.5
+		a2 = 0.08
+		
+		window = a0 + a1*np.cos(np.pi*n/span) + a2*np.cos(2*np.pi*n/span)
+		
+		h = np.sinc(n/factor) * window
+		h = h / np.sum(h)
+		
+		ht = np.zeros(num_samples)
+		ht[n % num_samples] = h
+		
+		return fftw_plans.fft(ht)
+	
+	key = (num_samples, factor, DECIMATION_FILTER_SPAN)
+	
+	return lru_cache_lookup(decimation_cache, key, DECIMATION_CACHE_SIZE, calc_decimation_filter)
+
+
+def record_recieve_signal(vt, ctx=None):
+	"""Appends the recieved signal to RX_SAVE_FILEPATH if record_rx is true for the context.
+	
+	The signal is handed to a background writer thread (see rx_recorder), so recording 
+	does not delay processing. If samples from multiple receivers are provided, the signal 
+	of every receiver is recorded, tagged with its receiver number.
+	"""
+	
+	if(ctx is None):
+		ctx = global_context()
+	
+	if(ctx.record_rx):
+		rx_recorder.record(RX_SAVE_FILEPATH, vt, ctx.fs, np.atleast_1d(ctx.reciever))
+	
+
+def generate_noise(ctx=None):
 	"""Generates noise with fixed mean μ and standard deviation σ."""
 	
-	noise = np.random.normal(size=N)
+	if(ctx is None):
+		ctx = global_context()
+	
+	noise = np.random.normal(size=ctx.N)
 	μ = 0.0 
 	σ = 0.01
 	noise = noise * σ + μ
 	return noise
 
 
+def read_only(a):
+	"""Returns a read-only copy of an array."""
+	
+	a = np.array(a)
+	a.flags.writeable = False
+	return a
+
+
 def calc_dist_rect(c1, c2):
 	"""Calculates distance between two points given in rectangular coordinates (x,y)."""
 	
@@ -1174,9 +3176,13 @@ def calc_dist_rect(c1, c2):
 	
 
 def calc_dist_polar(c1, c2):
-	"""Calculates distance between two points given in polar coordinates (r,theta)."""
+	"""Calculates distance between two points given in polar coordinates (r,theta).
 	
-	return math.sqrt(c1[0]**2 + c2[0]**2 - 2*c1[0]*c2[0]*np.cos(c1[1] -  c2[1]))
+	The radius and angle of each point can also be numpy arrays, in which case the 
+	distances are calculated element-wise following the numpy broadcasting rules.
+	"""
+	
+	return np.sqrt(c1[0]**2 + c2[0]**2 - 2*c1[0]*c2[0]*np.cos(c1[1] -  c2[1]))
 	
 
 def change_sample_rate(new_sample_rate, num_samples):
@@ -1184,6 +3190,13 @@ def change_sample_rate(new_sample_rate, num_samples):
 	
 	It is extremely important to call this function if the sample rate of the 
 	microcontroller changes, else the signal processing will produce erroneous results.
+	Note that the beamforming geometry cache is keyed by the sample spacing Δt, so the 
+	matching geometry tables are selected automatically after the sample rate changes.
+	
+	Only the global variables are changed, which are used when a signal processing step
+	is called without a context. To process a ping at a different sample rate without 
+	affecting pings being processed by other threads, use 
+	ProcessingContext.with_sample_rate instead.
 	
 	Parameters
 	----------
@@ -1195,26 +3208,23 @@ def change_sample_rate(new_sample_rate, num_samples):
 		
 	"""
 	
+	axes = calc_axes(new_sample_rate, num_samples, c)
+	
 	global fs; fs = new_sample_rate				# sample rate [Hz]
 	global N; N = num_samples
 	
-	global Δt; Δt = 1/fs						# sample spacing in time domain [seconds]
-	global t_max;t_max = N*Δt   				# max range [seconds]
-	global t; t = np.linspace(0, t_max,N)		# time axis
+	global Δt; Δt = axes["Δt"]					# sample spacing in time domain [seconds]
+	global t_max;t_max = axes["t_max"]			# max range [seconds]
+	global t; t = axes["t"]						# time axis
 
-	global s; s = 0.5 * t * c  					# distance axis
-	global s_max; s_max = 0.5 * t_max * c		# max range [meters]	
+	global s; s = axes["s"]						# distance axis
+	global s_max; s_max = axes["s_max"]			# max range [meters]	
 
-	global Δω; Δω = 2*np.pi/(N*Δt) 				# sample spacing in freq domain [rad]
-	global Δf; Δf = Δω/(2*np.pi)				# sample spacing in freq domain [Hz]
-	global ω; ω = np.linspace(0, (N-1)*Δω, N)  	# freq axis [rad]
-	global f; f = ω/(2*np.pi)					# freq axis [Hz]
-	global f_axis;								# alt freq axis, first element maps to 0 Hz
-	
-	if N%2==0:    # case N even
-		f_axis =  np.linspace(-N/2, N/2-1, N)*Δf;
-	else:   # case N odd
-		f_axis = np.linspace(-(N-1)/2, (N-1)/2, N)*Δf;  
+	global Δω; Δω = axes["Δω"]					# sample spacing in freq domain [rad]
+	global Δf; Δf = axes["Δf"]					# sample spacing in freq domain [Hz]
+	global ω; ω = axes["ω"]						# freq axis [rad]
+	global f; f = axes["f"]						# freq axis [Hz]
+	global f_axis; f_axis = axes["f_axis"]		# alt freq axis, first element maps to 0 Hz
 
 
 
@@ -1223,7 +3233,8 @@ def set_debug_mode(value):
 	
 	The sets the global variable DEBUG_MODE_ACTIVE. Debug mode is used to temporarily 
 	store the intermediate plots generated by each of the signal processing steps. These 
-	can be shown to the user to aid debugging. 
+	can be shown to the user to aid debugging. To enable debug mode for a single request
+	only, use ProcessingContext.with_options(debug=True) instead.
 	
 	Parameters
 	----------
@@ -1236,6 +3247,182 @@ def set_debug_mode(value):
 
 
 
+def capture_debug_plot(filename, plot, *args, **kwargs):
+	"""Captures the arrays of an intermediate figure, so that it can be rendered later.
+	
+	Rendering a figure takes far longer than the signal processing step it shows, so in 
+	debug mode only the arguments of the plot function are stored (array arguments are 
+	copied). The figure is rendered when it is requested (see debug_plot_png). Any 
+	previous capture, and rendered png, of the same figure is replaced.
+	
+	Parameters
+	----------
+	filename : string
+		The filename of the figure (e.g. '0_1_receive.png'), as requested by the web server
+	plot : function
+		returns the matplotlib figure, when called with args and kwargs
+	"""
+	
+	def copy_arrays(value):
+		if(isinstance(value, np.ndarray)):
+			return value.copy()
+		if(isinstance(value, (list, tuple))):
+			return type(value)(copy_arrays(item) for item in value)
+		return value
+	
+	capture = (plot, copy_arrays(args), copy_arrays(kwargs))
+	
+	with debug_lock:
+		debug_captures[filename] = capture
+		debug_pngs.pop(filename, None)
+
+
+def capture_debug_range_profile(reciever, s, yt):
+	"""Captures the range profile of a receiver, and the figures that show the range 
+	profiles of all receivers together (magnitude and phase).
+	
+	Parameters
+	----------
+	reciever : int
+		the receiver the range profile belongs to
+	s : numpy.ndarray
+		distance axis of the range profile
+	yt : numpy.ndarray
+		range profile
+	"""
+	
+	with debug_lock:
+		debug_range_profiles[reciever] = (s.copy(), yt.copy())
+		profiles = [debug_range_profiles[n] for n in sorted(debug_range_profiles)]
+	
+	capture_debug_plot("all_profile_mags.png", plot_debug_range_profiles, profiles, "magnitude")
+	capture_debug_plot("all_profile_phases.png", plot_debug_range_profiles, profiles, "phase")
+
+
+def debug_plot_png(filename):
+	"""Returns a captured intermediate figure as a png, rendering it if needed.
+	
+	The png is kept until the figure is captured again, so repeated requests for the same
+	figure are only rendered once.
+	
+	Parameters
+	----------
+	filename : string
+		The filename of the figure (see capture_debug_plot)
+	
+	Returns
+	-------
+	bytes
+		the png image, or None if the figure has not been captured
+	"""
+	
+	import io
+	
+	with debug_lock:
+		if(filename in debug_pngs):
+			return debug_pngs[filename]
+		
+		capture = debug_captures.get(filename)
+	
+	if(capture is None):
+		return None
+	
+	plot, args, kwargs = capture
+	
+	fig = plot(*args, **kwargs)
+	output = io.BytesIO()
+	fig.savefig(output, format="png", dpi=150, bbox_inches="tight")
+	
+	png = output.getvalue()
+	
+	with debug_lock:
+		# only keep the png if the figure has not been captured again while rendering
+		if(debug_captures.get(filename) is capture):
+			debug_pngs[filename] = png
+	
+	return png
+
+
+def save_debug_plots():
+	"""Renders every captured intermediate figure and saves it to DEBUG_DIR (see 
+	save_figure). Used when running this script from the terminal. """
+	
+	with debug_lock:
+		captures = list(debug_captures.items())
+	
+	for filename, (plot, args, kwargs) in captures:
+		fig = plot(*args, **kwargs)
+		save_figure(fig, filename)
+
+
+def plot_debug_panels(title, panels, hspace=0.4):
+	"""Plots an intermediate figure, with one signal in each row.
+	
+	The figure is created without pyplot, so it can be rendered from the webserver's 
+	threads.
+	
+	Parameters
+	----------
+	title : string
+		title of the figure
+	panels : list
+		(x, y, xlabel, ylabel) of each row
+	hspace : float, optional
+		vertical space between the rows
+	
+	Returns
+	-------
+	matplotlib.figure.Figure
+		the intermediate figure
+	"""
+	
+	fig = Figure(figsize=(8,6))
+	plots = fig.subplots(len(panels), 1, squeeze=False)[:,0]
+	fig.suptitle(title, y=0.94)
+	fig.subplots_adjust(top=0.89,hspace=hspace)
+	
+	for plot, (x, y, xlabel, ylabel) in zip(plots, panels):
+		plot.plot(x,y,linewidth=0.7, color="#2da6f7")
+		plot.set_xlabel(xlabel)
+		plot.set_ylabel(ylabel)
+	
+	return fig
+
+
+def plot_debug_range_profiles(profiles, part):
+	"""Plots the range profiles of all receivers super imposed on a single figure. Like 
+	plot_debug_panels, the figure is created without pyplot.
+	
+	Parameters
+	----------
+	profiles : list
+		(s, yt) of the range profile of each receiver
+	part : string
+		"magnitude" or "phase"
+	
+	Returns
+	-------
+	matplotlib.figure.Figure
+		the combined figure
+	"""
+	
+	fig = Figure()
+	ax = fig.subplots()
+	
+	for s, yt in profiles:
+		if(part == "magnitude"):
+			ax.plot(s,abs(yt),linewidth=0.7)
+		else:
+			ax.plot(s,np.angle(yt),linewidth=0.7)
+	
+	ax.legend(['r{}'.format(n) for n in range(len(profiles))])
+	ax.set_title("Combined Range Profiles - {}".format(part))
+	ax.set_xlabel("d [m]")
+	ax.set_ylabel("|y(t)|" if part == "magnitude" else "<y(t)")
+	
+	return fig
+
+
 def save_figure(fig, filename):
 	"""Save a pyplot figure using the filename provided.
 	
@@ -1276,7 +3463,7 @@ if __name__ == "__main__":
 	
 	# change filepath if run from terminal - assuming this script is run from signal_processing/
 	DEBUG_DIR = "debug"
-	RX_SAVE_FILEPATH = "receive_signal/recorded_RX_signal.txt"
+	RX_SAVE_FILEPATH = "receive_signal/recorded_RX_signal.bin"
 	RX_LOAD_FILEPATH = "receive_signal/formatted_RX_signal.txt"
 	
 	# set debug mode to active by default in order to view any plots
@@ -1297,6 +3484,9 @@ if __name__ == "__main__":
 	runtime = end_time_millis - start_time_millis
 	print("Runtime info: starttime={}, runtime={}s".format(start_time_fmt,round(runtime,2)))
 	
+	# render the captured intermediate figures for inspection
+	save_debug_plots()
+	
 	
 	"""
 	start_time_millis = time.time()
@@ -0,0 +1,471 @@
+""" Emulates the Teensy microcontroller on a pseudo-terminal, in place of the serial device.
+
+The emulator opens a pseudo-terminal (pty) and answers the commands written to it in the
+same way as teensy_sonar.ino, so that teensy_interface (and everything built on it) can be
+run, load tested and benchmarked without the hardware. Point teensy_interface at the
+emulator by setting teensy_interface.TEENSY_DEVICE to its device path, or use
+start_emulator, which does this for you. The following commands are answered:
+
+	i - status: "sample_rate" followed by the sample rate
+	f - sonar data from every channel, in the ASCII format (see
+	teensy_interface.request_sonar_data)
+	g - sonar data from channel 0 only, in the ASCII format
+	F - sonar data from every channel, as a binary frame (see
+	teensy_interface.decode_sonar_frame)
+	G - sonar data from channel 0 only, as a binary frame
+
+The samples sent are either simulated echoes off the targets in
+sonar_processing.target_coords (see sonar_processing.simulate_recieve_signal), quantised
+to ADC codes, or the pings of a capture archive. In either case the pings are sent one
+after the other, and repeated once every ping has been sent. Simulated pings are
+generated when the emulator starts, so that the time taken to simulate them is not added
+to the time taken to respond.
+
+To mimic the real device (or a faulty one), the emulator can be configured with:
+
+	* the number of channels and samples, the sample rate and the maximum ADC code
+	* latency - seconds between receiving a command and the start of the response. This
+	defaults to the time the Teensy takes to capture the samples.
+	* jitter - a random extra delay of up to this many seconds
+	* baud_rate - if given, the response is written no faster than this baud rate (10
+	bits per byte). The USB serial link of the Teensy is otherwise limited only by the
+	speed of the computer.
+	* faults - the probability of injecting each of the faults in FAULT_TYPES into a
+	response
+
+This script requires a POSIX system (for the pseudo-terminal), and that the following
+libraries be installed within the Python environment you are running this script in:
+
+	numpy, sonar_processing, capture_archive, teensy_interface
+
+Running this script directly starts an emulator with the default settings and prints its
+device path, which can then be used as TEENSY_DEVICE by another process.
+
+This file can also be imported as a module and contains the following functions:
+
+	* start_emulator - starts an emulator and points teensy_interface at it
+
+ """
+
+
+# ===================================== IMPORTS ======================================== #
+
+import os
+import time
+import select
+import threading
+import tty
+import numpy as np
+import sonar_processing as sp
+import capture_archive
+import teensy_interface
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# default number of channels (receivers) and samples per channel, sample rate [Hz], and
+# maximum ADC code (a 10 bit ADC, as configured in teensy_sonar.ino) of the emulator
+global EMULATOR_CHANNELS; EMULATOR_CHANNELS = 8
+global EMULATOR_SAMPLES; EMULATOR_SAMPLES = 6200
+global EMULATOR_SAMPLE_RATE; EMULATOR_SAMPLE_RATE = 105000.0
+global EMULATOR_MAX_ADC_CODE; EMULATOR_MAX_ADC_CODE = 1 << 10
+
+# gain applied to simulated receive signals before they are quantised, standing in for
+# the amplifier in front of the ADC. Simulated signals are centred on half the ADC
+# reference voltage.
+global EMULATOR_GAIN; EMULATOR_GAIN = 10
+
+# number of simulated pings (each with different noise) generated when the emulator starts
+global EMULATOR_PINGS; EMULATOR_PINGS = 4
+
+# faults that can be injected into a response:
+#	drop - the command is ignored and nothing is sent
+#	truncate - the response stops part way through, before "end_buffer_transfer"
+#	corrupt - one of the samples is replaced with characters that are not a number (or,
+#	in a binary frame, one of the bytes of the samples is changed)
+#	header - the "sample_rate" line (or the magic of a binary frame) is misspelt
+global FAULT_TYPES; FAULT_TYPES = ["drop", "truncate", "corrupt", "header"]
+
+# number of bytes written to the pseudo-terminal at once
+global WRITE_CHUNK_SIZE; WRITE_CHUNK_SIZE = 4096
+
+# seconds the emulator waits for a command (or for the pseudo-terminal to accept more
+# bytes) before checking if it should stop
+global POLL_INTERVAL; POLL_INTERVAL = 0.1
+
+
+# ================================= CLASS DEFINITIONS ================================== #
+
+
+class TeensyEmulator:
+	"""Answers Teensy commands written to a pseudo-terminal on a background thread.
+
+	Attributes
+	----------
+	device : str or None
+		device path of the pseudo-terminal (e.g. '/dev/pts/3'), once started
+	num_channels, num_samples, sample_rate, max_adc_code
+		shape and format of the simulated sonar data - see __init__
+	archive : capture_archive.CaptureArchive or None
+		if not None, pings are sent from this archive rather than simulated
+	"""
+	def __init__(self, num_channels=None, num_samples=None, sample_rate=None, max_adc_code=None, latency=None, jitter=0.0, baud_rate=None, faults=None, archive=None, ctx=None, seed=None):
+		"""
+		Parameters
+		----------
+		num_channels : int, optional
+			number of channels sent in response to 'f'. Defaults to EMULATOR_CHANNELS.
+		num_samples : int, optional
+			number of samples per channel. Defaults to EMULATOR_SAMPLES.
+		sample_rate : float, optional
+			sample rate sent with the samples [Hz]. Defaults to EMULATOR_SAMPLE_RATE.
+		max_adc_code : int, optional
+			maximum ADC code sent with the samples. Defaults to EMULATOR_MAX_ADC_CODE.
+		latency : float, optional
+			seconds between receiving a command and the start of the response. Defaults
+			to num_samples / sample_rate, the time taken to capture the samples.
+		jitter : float, optional
+			a random delay of between 0 and jitter seconds is added to the latency
+		baud_rate : int, optional
+			if given, the response is written no faster than this baud rate
+		faults : dict, optional
+			probability (0 to 1) of injecting each fault in FAULT_TYPES into a response,
+			e.g. {"truncate": 0.1}. At most one fault is injected into each response.
+		archive : capture_archive.CaptureArchive or str, optional
+			if given, pings are sent from this archive (or the archive at this path)
+			rather than simulated. The shape, sample rate and maximum ADC code of each
+			ping are those stored in the archive.
+		ctx : sp.ProcessingContext, optional
+			parameters used to simulate the receive signals. Defaults to a snapshot of
+			the global variables.
+		seed : int, optional
+			seed of the random numbers used for jitter and faults
+
+		Raises
+		------
+		ValueError
+			If a fault type is not recognised
+		"""
+
+		faults = {} if faults is None else dict(faults)
+
+		unknown = set(faults) - set(FAULT_TYPES)
+		if(len(unknown) > 0):
+			raise ValueError("Unknown fault types: {}".format(", ".join(sorted(unknown))))
+
+		if(isinstance(archive, str)):
+			archive = capture_archive.CaptureArchive(archive)
+
+		self.num_channels = EMULATOR_CHANNELS if num_channels is None else num_channels
+		self.num_samples = EMULATOR_SAMPLES if num_samples is None else num_samples
+		self.sample_rate = EMULATOR_SAMPLE_RATE if sample_rate is None else sample_rate
+		self.max_adc_code = EMULATOR_MAX_ADC_CODE if max_adc_code is None else max_adc_code
+		self.latency = self.num_samples / self.sample_rate if latency is None else latency
+		self.jitter = jitter
+		self.baud_rate = baud_rate
+		self.faults = faults
+		self.archive = archive
+		self.ctx = (sp.global_context() if ctx is None else ctx).with_sample_rate(self.sample_rate, self.num_samples).with_options(debug=False, record_rx=False)
+		self.rng = np.random.RandomState(seed)
+
+		self.pings = []
+		self.device = None
+		self.master = None
+		self.slave = None
+		self.position = 0
+		self.stop_event = threading.Event()
+		self.thread = None
+
+		self.lock = threading.Lock()
+		self.counts = {"requests": 0, "bytes_sent": 0, "faults": {fault: 0 for fault in FAULT_TYPES}}
+
+
+	def __enter__(self):
+		""" starts the emulator (if not already started) when used as a context manager """
+
+		if(self.thread is None):
+			self.start()
+
+		return self
+
+
+	def __exit__(self, *exc):
+		""" stops the emulator when used as a context manager """
+
+		self.stop()
+
+
+	def start(self):
+		""" opens the pseudo-terminal and starts answering commands. Returns the emulator. """
+
+		if(self.archive is None and len(self.pings) == 0):
+			self.pings = [self.simulate_ping() for i in range(0, EMULATOR_PINGS)]
+
+		self.master, self.slave = os.openpty()
+
+		# the slave end is kept open (in raw mode, so that no characters are translated
+		# or echoed) so that the pseudo-terminal remains usable between serial
+		# connections
+		tty.setraw(self.slave)
+		self.device = os.ttyname(self.slave)
+
+		self.stop_event.clear()
+		self.thread = threading.Thread(target=self.serve, name="teensy-emulator", daemon=True)
+		self.thread.start()
+
+		return self
+
+
+	def stop(self):
+		""" stops answering commands and closes the pseudo-terminal """
+
+		self.stop_event.set()
+
+		if(self.thread is not None):
+			self.thread.join()
+			self.thread = None
+
+		# the serial connection kept open by teensy_interface would otherwise hold on to
+		# the closed pseudo-terminal
+		if(teensy_interface.connection is not None and teensy_interface.connection.device == self.device):
+			teensy_interface.close_connection()
+
+		for fd in [self.master, self.slave]:
+			if(fd is not None):
+				os.close(fd)
+
+		self.master, self.slave = None, None
+
+
+	def serve(self):
+		""" reads commands from the pseudo-terminal and answers them until stopped """
+
+		while(not self.stop_event.is_set()):
+			readable, writable, errors = select.select([self.master], [], [], POLL_INTERVAL)
+
+			if(len(readable) == 0):
+				continue
+
+			try:
+				commands = os.read(self.master, 1024).decode("ascii", errors="replace")
+			except OSError:
+				continue
+
+			for command in commands:
+				if(command in "ifgFG"):
+					self.respond(command)
+
+
+	def respond(self, command):
+		""" writes the response to a single command to the pseudo-terminal """
+
+		start_time = time.perf_counter()
+
+		with self.lock:
+			self.counts["requests"] += 1
+
+		fault = self.choose_fault()
+
+		if(fault == "drop"):
+			return
+
+		# the Teensy captures the samples before it responds with sonar data
+		if(command != "i"):
+			self.stop_event.wait(self.latency + self.jitter * self.rng.random_sample())
+
+		if(command in "FG"):
+			response = self.sonar_frame(short=(command == "G"), fault=fault)
+		else:
+			if(command == "i"):
+				lines = ["sample_rate", "{:.2f}".format(self.sample_rate)]
+			else:
+				lines = self.sonar_lines(short=(command == "g"))
+				lines.append("Runtime: {} us".format(int((time.perf_counter() - start_time) * 1e6)))
+
+			if(fault == "header"):
+				lines[0] = "sample_rte"
+
+			if(fault == "corrupt" and len(lines) > 8):
+				lines[self.rng.randint(7, len(lines) - 2)] = "1#3"
+
+			response = ("\r\n".join(lines) + "\r\n").encode("ascii")
+
+		if(fault == "truncate"):
+			response = response[:self.rng.randint(1, len(response))]
+
+		self.write(response)
+
+
+	def choose_fault(self):
+		""" returns the fault to inject into the next response, or None """
+
+		for fault in FAULT_TYPES:
+			if(self.rng.random_sample() < self.faults.get(fault, 0)):
+				with self.lock:
+					self.counts["faults"][fault] += 1
+				return fault
+
+		return None
+
+
+	def sonar_lines(self, short=False):
+		""" returns the lines of the response to 'f' (or 'g' if short is true), without
+		line endings """
+
+		codes, sample_rate, max_adc_code = self.next_ping()
+
+		if(short):
+			codes = codes[:1]
+
+		lines = ["sample_rate", "{:.2f}".format(sample_rate), "max_adc_code", str(int(max_adc_code)), "start_buffer_transfer"]
+
+		for n in range(0, len(codes)):
+			lines.append("buffer{}".format(n))
+			lines.extend(map(str, codes[n].tolist()))
+
+		lines.append("end_buffer_transfer")
+
+		return lines
+
+
+	def sonar_frame(self, short=False, fault=None):
+		""" returns the binary frame sent in response to 'F' (or 'G' if short is true),
+		with the header or corrupt fault injected if given """
+
+		codes, sample_rate, max_adc_code = self.next_ping()
+
+		if(short):
+			codes = codes[:1]
+
+		codes = np.ascontiguousarray(codes, dtype=teensy_interface.FRAME_CODE_DTYPE)
+		checksum = int(codes.sum(dtype=np.uint64)) % 2**32
+
+		magic = b"SNR0" if fault == "header" else teensy_interface.FRAME_MAGIC
+		prefix = teensy_interface.FRAME_PREFIX.pack(magic, teensy_interface.FRAME_HEADER.size)
+		header = teensy_interface.FRAME_HEADER.pack(sample_rate, int(max_adc_code), codes.shape[0], codes.shape[1])
+
+		data = bytearray(codes.tobytes())
+
+		if(fault == "corrupt"):
+			data[self.rng.randint(0, len(data))] ^= 0x5a
+
+		return prefix + header + bytes(data) + teensy_interface.FRAME_CHECKSUM.pack(checksum)
+
+
+	def next_ping(self):
+		"""Returns the ADC codes of the next ping, with its sample rate and maximum ADC code.
+
+		Returns
+		-------
+		numpy.ndarray
+			2D array containing the ADC codes of each channel in its rows
+		float
+			sample rate [Hz]
+		int
+			maximum ADC code
+		"""
+
+		if(self.archive is not None):
+			i = self.position % len(self.archive)
+			self.position += 1
+
+			entry = self.archive.index[i]
+			return np.asarray(self.archive.ping(i)), float(entry["sample_rate"]), int(entry["max_adc_code"])
+
+		i = self.position % len(self.pings)
+		self.position += 1
+
+		return self.pings[i], self.sample_rate, self.max_adc_code
+
+
+	def simulate_ping(self):
+		""" returns the ADC codes of each channel for a simulated ping - see next_ping """
+
+		# the simulated receivers are repeated if more channels than receivers are emulated
+		delays = sp.simulate_target_delays(self.ctx)
+		delays = [delays[n % len(delays)] for n in range(0, self.num_channels)]
+
+		vt, Vw = sp.simulate_recieve_signal(delays, self.ctx)
+
+		reference_voltage = teensy_interface.ADC_REFERENCE_VOLTAGE
+		codes = np.rint((EMULATOR_GAIN * vt + reference_voltage / 2) * (self.max_adc_code - 1) / reference_voltage)
+
+		return np.clip(codes, 0, self.max_adc_code - 1).astype(int)
+
+
+	def write(self, response):
+		""" writes bytes to the pseudo-terminal, no faster than the baud rate (if given) """
+
+		start_time = time.perf_counter()
+		sent = 0
+
+		while(sent < len(response) and not self.stop_event.is_set()):
+			if(self.baud_rate is not None):
+				# bytes are sent at baud_rate / 10 bytes per second (8 data bits, plus a
+				# start and stop bit)
+				self.stop_event.wait(max(0, sent * 10 / self.baud_rate - (time.perf_counter() - start_time)))
+
+			readable, writable, errors = select.select([], [self.master], [], POLL_INTERVAL)
+
+			if(len(writable) == 0):
+				continue
+
+			sent += os.write(self.master, response[sent:sent + WRITE_CHUNK_SIZE])
+
+		with self.lock:
+			self.counts["bytes_sent"] += sent
+
+
+	def stats(self):
+		""" returns the number of requests answered, bytes sent and faults injected as a
+		dictionary """
+
+		with self.lock:
+			return {"requests"  : self.counts["requests"],
+					"bytes_sent": self.counts["bytes_sent"],
+					"faults"    : dict(self.counts["faults"])}
+
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+def start_emulator(**settings):
+	"""Starts an emulator, and sets teensy_interface.TEENSY_DEVICE to its device path.
+
+	Parameters
+	----------
+	**settings
+		settings of the emulator - see TeensyEmulator
+
+	Returns
+	-------
+	TeensyEmulator
+		the running emulator. NB teensy_interface.TEENSY_DEVICE is not restored when the
+		emulator is stopped.
+	"""
+
+	emulator = TeensyEmulator(**settings).start()
+	teensy_interface.TEENSY_DEVICE = emulator.device
+
+	return emulator
+
+
+# ====================================== MAIN ========================================== #
+
+if __name__ == "__main__":
+
+	# starts an emulator with the default settings, and answers commands until interrupted
+
+	emulator = TeensyEmulator().start()
+	print("Teensy emulator listening on {}".format(emulator.device))
+
+	try:
+		while(True):
+			time.sleep(1)
+	except KeyboardInterrupt:
+		print(emulator.stats())
+		emulator.stop()
+
+
+
+# ====================================== END =========================================== #
@@ -12,16 +12,27 @@ port. Two types of requests can be made:
 	captured by the Teensy. The sampling rate of the ADC is also included. This is vital 
 	important for any subsequent signal processing, as the sampling rate is not fixed. 
 
-This script requires that 'serial' be installed within the Python environment you are 
-running this script in.
+Both requests are made over a single serial connection (see SerialConnection) that is
+kept open between requests and shared by every thread, so that requests do not collide
+on the serial port.
+
+This script requires that 'serial' and 'numpy' be installed within the Python environment
+you are running this script in.
 
 This file can also be imported as a module and contains the following
 functions:
 
     * list_serial_devices - prints all the available serial ports to the console
+    * get_connection - returns the serial connection to the Teensy
+    * close_connection - closes the serial connection to the Teensy
     * request_status - retrieves the current status of the Teensy.
     * request_sonar_data - sends transmit command to Teensy and retrieves the captured 
       recieve signals. 
+    * read_until_terminator - reads from the serial port until a terminator is received
+    * read_exactly - reads a given number of bytes from the serial port
+    * read_sonar_frame - reads a binary frame of sonar data from the serial port
+    * decode_sonar_frame - decodes a binary frame of sonar data
+    * parse_sonar_text - parses sonar data in the ASCII format
 
 
 Note that some attributes used in this script are set be default and cannot be provided 
@@ -31,8 +42,12 @@ from outside this script, including TEENSY_DEVICE, BAUD_RATE, and SERIAL_TIMEOUT
 
 # ===================================== IMPORTS ======================================== #
 
+import copy
 import serial
 import time
+import struct
+import threading
+import numpy as np
 from serial.tools import list_ports
 
 
@@ -44,13 +59,49 @@ global TEENSY_DEVICE; TEENSY_DEVICE = '/dev/cu.usbmodem58714801'
 # baud rate of the serial coms -> may be overwritten if using USB to default USB baud rate 
 global BAUD_RATE; BAUD_RATE = 9600;
 
-# Seconds that serial port waits after last byte before closing connection. Two different
-# timeout values are defined: Use SERIAL_TIMEOUT_SHORT when receiving sonar data from
-# a single receiver (1D mode), and SERIAL_TIMEOUT_LONG when receiving sonar data 
-# from multiple receivers. 
+# Seconds that serial port waits for the next byte before giving up on a transfer. Each
+# transfer ends as soon as its last byte arrives (see read_until_terminator), so these
+# only limit how long it takes to detect a transfer that has failed or stalled. Two 
+# different timeout values are defined: Use SERIAL_TIMEOUT_SHORT when receiving sonar 
+# data from a single receiver (1D mode), and SERIAL_TIMEOUT_LONG when receiving sonar 
+# data from multiple receivers. 
 global SERIAL_TIMEOUT_LONG; SERIAL_TIMEOUT_LONG = 0.8; 
 global SERIAL_TIMEOUT_SHORT; SERIAL_TIMEOUT_SHORT = 0.2; 
 
+# seconds to wait before reconnecting after the serial port could not be opened. The 
+# wait doubles after each consecutive failure, up to RECONNECT_BACKOFF_MAX seconds.
+global RECONNECT_BACKOFF; RECONNECT_BACKOFF = 0.5
+global RECONNECT_BACKOFF_MAX; RECONNECT_BACKOFF_MAX = 8.0
+
+# maximum number of bytes read from the serial port in a single transfer
+global MAX_TRANSFER_BYTES; MAX_TRANSFER_BYTES = 10000000
+
+# last line of a transfer of sonar data in the ASCII format, and the number of lines that
+# end after it as part of the same response - the end of the 'end_buffer_transfer' line, 
+# and the runtime printed by the Teensy ("Runtime: <microseconds> us")
+global END_OF_TRANSFER; END_OF_TRANSFER = b"end_buffer_transfer"
+global END_OF_TRANSFER_LINES; END_OF_TRANSFER_LINES = 2
+
+# reference voltage of the Teensy ADC, used to convert each adc code into a voltage
+global ADC_REFERENCE_VOLTAGE; ADC_REFERENCE_VOLTAGE = 3.3
+
+# if true, sonar data is requested in the binary format rather than the ASCII format (see
+# request_sonar_data), and if false in the ASCII format. If None, the binary format is 
+# tried first, and if the Teensy does not respond to it (i.e. its firmware does not 
+# support binary transfers), the ASCII format is used from then on.
+global BINARY_TRANSFER; BINARY_TRANSFER = None
+
+# fields of a binary frame of sonar data - see decode_sonar_frame
+global FRAME_MAGIC; FRAME_MAGIC = b"SNR1"
+global FRAME_PREFIX; FRAME_PREFIX = struct.Struct("<4sH")
+global FRAME_HEADER; FRAME_HEADER = struct.Struct("<dIHI")
+global FRAME_CHECKSUM; FRAME_CHECKSUM = struct.Struct("<I")
+global FRAME_CODE_DTYPE; FRAME_CODE_DTYPE = np.dtype("<u2")
+
+# serial connection shared by every request (see get_connection) - created when first used
+global connection; connection = None
+global connection_lock; connection_lock = threading.Lock()
+
 
 
 # ================================= CLASS DEFINITIONS ================================== #
@@ -86,6 +137,247 @@ class TeensyError(Exception):
 
 
 
+class NoResponseError(TeensyError):
+	"""Exception raised if the Teensy does not respond to a command at all, e.g. because
+	its firmware does not support the command."""
+
+
+
+class SerialConnection:
+	"""Serial connection to the Teensy that is kept open and shared between threads.
+	
+	Opening the serial port for every request takes time, and requests made at the same 
+	time from different threads (e.g. a status request from the web page during a 2D 
+	acquisition) would write to and read from the port at the same time. Instead, the port
+	is opened once and commands are sent one at a time, each followed by reading its 
+	response, while holding a lock.
+	
+	If a request is made while an identical request (i.e. the same command) is already 
+	waiting for or receiving its response, it is not sent again: both requests are given
+	their own (deep) copy of the same response, or the same error.
+	
+	If the port cannot be opened, it is not opened again until RECONNECT_BACKOFF seconds 
+	have passed, doubling after each consecutive failure. Requests made before then fail 
+	immediately. After any failed transfer, the port is closed and reopened by the next 
+	request, so that no bytes from the failed transfer are read as part of the next one.
+	
+	Attributes
+	----------
+	device : str
+		device name of the serial port
+	baud_rate : int
+		baud rate of the serial port
+	port : serial.Serial
+		the open serial port, or None if it is closed
+	lock : threading.Lock
+		held while a command is sent and its response read
+	flights : dict
+		maps each command waiting for its response to the state of that request
+	flights_lock : threading.Lock
+		held while flights or counts are read or modified
+	failures : int
+		number of consecutive failures to open the port
+	retry_time : float
+		time (see time.monotonic) before which the port will not be opened again
+	counts : dict
+		number of times the port has been opened, requests sent and requests coalesced
+	binary_transfer : bool
+		whether the Teensy supports binary transfers of sonar data, or None if not yet 
+		known since the port was last closed (see request_sonar_data)
+	"""
+
+	def __init__(self, device, baud_rate):
+		"""
+		Parameters
+		----------
+		device : str
+			device name of the serial port
+		baud_rate : int
+			baud rate of the serial port
+		"""
+		
+		self.device = device
+		self.baud_rate = baud_rate
+		
+		self.port = None
+		self.lock = threading.Lock()
+		
+		self.flights = {}
+		self.flights_lock = threading.Lock()
+		
+		self.failures = 0
+		self.retry_time = 0.0
+		
+		self.counts = {"opened": 0, "sent": 0, "coalesced": 0}
+		
+		self.binary_transfer = None
+
+
+	def request(self, command, read, timeout):
+		"""Sends a command to the Teensy and reads its response, unless an identical request
+		is already in progress, in which case its response is returned instead.
+		
+		Parameters
+		----------
+		command : str
+			command written to the serial port
+		read : function
+			reads the response from the open serial port, which is passed as its only 
+			argument, and returns it
+		timeout : float
+			serial timeout while reading the response [seconds]
+		
+		Returns
+		-------
+		the value returned by read. If requests were coalesced, each is given a deep copy,
+		so that each can modify its own copy (e.g. remove keys from a dictionary, or 
+		filter the sonar data buffers in place)
+		
+		Raises
+		------
+		serial.serialutil.SerialException
+			If the serial port cannot be opened, or an error occurs while using it
+		TeensyError
+			If read raises a TeensyError
+		"""
+		
+		with self.flights_lock:
+			flight = self.flights.get(command)
+			leader = flight is None
+			
+			if(leader):
+				flight = {"done": threading.Event(), "response": None, "error": None, "shared": False}
+				self.flights[command] = flight
+			else:
+				flight["shared"] = True
+				self.counts["coalesced"] += 1
+		
+		# wait for the identical request in progress to finish, and share its response
+		if(not leader):
+			flight["done"].wait()
+			
+			if(flight["error"] is not None):
+				raise flight["error"]
+			
+			return copy.deepcopy(flight["response"])
+		
+		try:
+			flight["response"] = self.send(command, read, timeout)
+		
+		except Exception as e:
+			flight["error"] = e
+			raise
+		
+		finally:
+			with self.flights_lock:
+				del self.flights[command]
+			
+			flight["done"].set()
+		
+		# no more requests can join once the flight is removed - if none did, the response
+		# is not shared, so does not need to be copied
+		if(not flight["shared"]):
+			return flight["response"]
+		
+		return copy.deepcopy(flight["response"])
+
+
+	def send(self, command, read, timeout):
+		"""Sends a command to the Teensy and reads its response, once no other command is
+		being sent. See request for the parameters, return value and errors."""
+		
+		with self.lock:
+			teensy = self.open()
+			
+			try:
+				if(teensy.timeout != timeout):
+					teensy.timeout = timeout
+				
+				# discard anything left over from previous responses - each response is 
+				# read in full, so this only discards bytes the Teensy sent unprompted
+				teensy.reset_input_buffer()
+				teensy.write(str(command).encode())
+				
+				with self.flights_lock:
+					self.counts["sent"] += 1
+				
+				return read(teensy)
+			
+			except Exception:
+				self.close_port()
+				raise
+
+
+	def open(self):
+		"""Returns the open serial port, opening it if it is closed. Must be called while 
+		holding lock.
+		
+		Raises
+		------
+		serial.serialutil.SerialException
+			If the port cannot be opened, or the last attempt to open it failed less than 
+			the backoff period ago
+		"""
+		
+		if(self.port is not None):
+			return self.port
+		
+		now = time.monotonic()
+		
+		if(now < self.retry_time):
+			raise serial.serialutil.SerialException("Not reconnecting to {} for another {:.1f}s".format(self.device, self.retry_time - now))
+		
+		try:
+			self.port = serial.Serial(self.device, self.baud_rate)
+		
+		except serial.serialutil.SerialException:
+			self.failures = self.failures + 1
+			self.retry_time = now + min(RECONNECT_BACKOFF * 2**(self.failures - 1), RECONNECT_BACKOFF_MAX)
+			raise
+		
+		self.failures = 0
+		
+		with self.flights_lock:
+			self.counts["opened"] += 1
+		
+		return self.port
+
+
+	def close_port(self):
+		""" closes the serial port, if it is open. Must be called while holding lock. """
+		
+		if(self.port is not None):
+			try:
+				self.port.close()
+			except (serial.serialutil.SerialException, OSError):
+				pass
+			
+			self.port = None
+		
+		# the firmware may be replaced before the port is opened again
+		self.binary_transfer = None
+
+
+	def close(self):
+		""" closes the serial port once no command is being sent """
+		
+		with self.lock:
+			self.close_port()
+
+
+	def stats(self):
+		""" returns the number of times the port has been opened, commands sent and 
+		requests coalesced, and whether the port is open, as a dictionary """
+		
+		with self.flights_lock:
+			stats = dict(self.counts)
+		
+		stats["connected"] = self.port is not None
+		
+		return stats
+
+
+
 # =============================== FUNCTION DEFINITIONS ================================= #
 
 def list_serial_devices():
@@ -97,6 +389,38 @@ def list_serial_devices():
 		print("\t",p.device)
 	
 
+def get_connection():
+	"""Returns the serial connection to the Teensy, creating it if it does not exist.
+	
+	If TEENSY_DEVICE or BAUD_RATE has changed since the connection was created, the old 
+	connection is closed and a new one is created.
+	
+	Returns
+	-------
+	SerialConnection
+		the serial connection shared by every request
+	"""
+	
+	global connection
+	
+	with connection_lock:
+		if(connection is None or connection.device != TEENSY_DEVICE or connection.baud_rate != BAUD_RATE):
+			if(connection is not None):
+				connection.close()
+			
+			connection = SerialConnection(TEENSY_DEVICE, BAUD_RATE)
+		
+		return connection
+
+
+def close_connection():
+	"""Closes the serial connection to the Teensy. It is reopened by the next request."""
+	
+	with connection_lock:
+		if(connection is not None):
+			connection.close()
+
+
 def request_status():
 	""" Retrieves the current status of the Teensy and returns it as a dictionary.
 	
@@ -114,9 +438,10 @@ def request_status():
 	"sample_rate"
 	<sample_rate_in_Hz>
 	
-	Note that a maximum of 100 bytes are read from the serial port. If less than 100 bytes
-	are written by the Teensy, then the serial port will automatically close after timeout 
-	period (SERIAL_TIMEOUT_SHORT is used by default).
+	Note that this function returns as soon as both lines have been received. If the 
+	Teensy does not respond, the request fails after the timeout period 
+	(SERIAL_TIMEOUT_SHORT is used by default). Status requests made at the same time 
+	share a single response (see SerialConnection).
 	
 	Returns
 	-------
@@ -139,24 +464,24 @@ def request_status():
 	
 	dict = {}
 	
-	try:
-		# establish serial connection with teensy 
-		teensy = serial.Serial(TEENSY_DEVICE, BAUD_RATE, timeout = SERIAL_TIMEOUT_SHORT)
-		
-		# send command to teensy to return status data
-		teensy.write(str("i").encode())
-		
+	def read_status(teensy):
 		# retrieve data from Teensy
-		info = teensy.read(100).decode('ascii').split("\n") # new line means new value
+		info = read_until_terminator(teensy, b"\n", count=2, max_bytes=100).decode('ascii').split("\n") # new line means new value
 	
 		if("sample_rate" not in info[0]):
 			raise TeensyError("Format from Teensy not recognised: input does not contain string 'sample_rate' at index 0")
 		
+		return float(info[1].replace("\r",""))
+	
+	try:
+		# send command to teensy to return status data
+		sample_rate = get_connection().request("i", read_status, SERIAL_TIMEOUT_SHORT)
+		
 		# if no error has been thrown by this point, it means that the Teensy is connected
 		dict["connection"] = "Connected"
 		
 		# provided sample rate in kHz rounded to 2 decimal places
-		dict["sample_rate"] = "{} kHz".format(round(float(info[1].replace("\r",""))/1000.0,2))
+		dict["sample_rate"] = "{} kHz".format(round(sample_rate/1000.0,2))
 		
 	except (serial.serialutil.SerialException) as e1:
 		print("\tCould not connect to Teensy")
@@ -172,7 +497,7 @@ def request_status():
 	return dict
 
 
-def request_sonar_data(short_timeout=False):
+def request_sonar_data(short_timeout=False, binary=None):
 	"""Sends transmit command to Teensy and retrieves the captured recieve signals.
 	
 	The sonar data includes the recieve signal captured from each of the channels on the
@@ -181,8 +506,352 @@ def request_sonar_data(short_timeout=False):
 	ADC code is provided. This is determined by the resolution of the ADC and is required
 	to convert each adc code into avoltage
 	
-	To request sonar data from the Teensy, the Teensy expects the char 'f' to be written 
-	to the serial port.
+	The sonar data can be transferred in one of two formats, selected by the command 
+	written to the serial port:
+	
+		1) binary - the Teensy expects the char 'F' (or 'G' for receiver 0 only) to be 
+		written to the serial port, and returns the ADC codes as a single binary frame 
+		(see decode_sonar_frame). This is about a third of the size of the ASCII format,
+		and is read exactly, so no time is spent waiting for the serial timeout.
+		
+		2) ASCII - the Teensy expects the char 'f' (or 'g' for receiver 0 only) to be 
+		written to the serial port, and returns each ADC code on its own line (see 
+		parse_sonar_text). The transfer is read until the runtime printed after its
+		'end_buffer_transfer' line arrives. This format is kept for firmware that does 
+		not support the binary format.
+	
+	Firmware that does not support the binary format ignores the 'F' and 'G' commands. By
+	default, the binary format is therefore requested first, and if there is no response
+	within the serial timeout, the ASCII command is sent instead. The format that worked
+	is then used for every later request over the same connection.
+	
+	Parameters
+	----------
+	short_timeout : bool, optional
+		if true sets serial timeout to SERIAL_TIMEOUT_SHORT, if false sets serial timeout 
+		to SERIAL_TIMEOUT_LONG. Use SERIAL_TIMEOUT_SHORT when receiving sonar data from
+		a single receiver (1D mode), and SERIAL_TIMEOUT_LONG when receiving sonar data 
+		from multiple receivers. If true, only receiver 0 is requested. The timeout only 
+		ends a transfer that has stalled.
+	binary : bool, optional
+		if true the binary format is used, if false the ASCII format is used, and if None
+		the format is detected as above. Defaults to BINARY_TRANSFER.
+		
+	Returns
+	-------
+	A dictionary containing the recived signal buffer for each sonar channel, as well as 
+	the sample rate and maximum adc code. The dictionary might look as follows:
+	
+		{"sample_rate"  : 104120.0,
+		 "max_adc_code" : 4096.0,
+		 "buffer0"      : numpy.ndarray([1.2, 1.1, 1.1,...]),    
+		 "buffer1"      : numpy.ndarray([...]),
+		 	...
+		 "buffer<n>"    : numpy.ndarray([...])}
+	
+	Note that each sample has been converted from its adc code to the voltage it 
+	represents. Identical requests made at the same time (e.g. by different threads)
+	share a single transfer, and are each given their own copy of the dictionary and its
+	buffers (see SerialConnection).
+		
+	Raises
+	------
+	Teensy Error
+		If any errors occure during Teensy comms, including no Teensy connection or 
+		invalid format 
+	"""
+	
+	connection = get_connection()
+	
+	if(binary is None):
+		binary = BINARY_TRANSFER
+	
+	# detect the format supported by the firmware, unless it is already known
+	detect = binary is None and connection.binary_transfer is None
+	
+	if(binary is None):
+		binary = connection.binary_transfer is not False
+	
+	# command 'f' (or 'F' if binary) is sent for all receivers, and 'g' (or 'G') for
+	# receiver 0 only
+	command = "g" if short_timeout else "f"
+	
+	if(binary):
+		command = command.upper()
+	
+	def read_text(teensy):
+		return parse_sonar_text(read_until_terminator(teensy, END_OF_TRANSFER, lines_after=END_OF_TRANSFER_LINES))
+	
+	def read_frame_or_text(teensy):
+		try:
+			dict = read_sonar_frame(teensy)
+		
+		except NoResponseError:
+			# the firmware ignored the binary command - send the ASCII command instead
+			connection.binary_transfer = False
+			teensy.write(str(command.lower()).encode())
+			
+			return read_text(teensy)
+		
+		connection.binary_transfer = True
+		
+		return dict
+	
+	try:
+		
+		# send command to teensy to transmit chirp and return sampled echos, and retrieve
+		# data from Teensy
+		timeout = SERIAL_TIMEOUT_SHORT if short_timeout else SERIAL_TIMEOUT_LONG
+		
+		if(detect):
+			read = read_frame_or_text
+		elif(binary):
+			read = read_sonar_frame
+		else:
+			read = read_text
+		
+		dict = connection.request(command, read, timeout)
+		
+
+	except (serial.serialutil.SerialException) as e1:
+		print("\tCould not connect to Teensy")
+		
+		# re-raise as TeensyError so it can be handled correctly above
+		raise TeensyError("Could not connect to Teensy")
+	
+	except TeensyError as e2:
+		print("\t",e2)
+		
+		# re-raise as TeensyError so it can be handled correctly above
+		raise TeensyError(e2.message)
+
+	
+	return dict
+
+
+def read_until_terminator(teensy, terminator, count=1, max_bytes=None, lines_after=0):
+	"""Reads from the serial port until a terminator has been received, followed by a 
+	given number of line endings.
+	
+	Bytes are read in chunks as they arrive, and each chunk is searched for the terminator
+	as soon as it is received (bytes that have already been searched are not searched
+	again), so this function returns as soon as the terminator arrives rather than 
+	waiting for the serial timeout. The serial timeout only ends the read if no bytes 
+	arrive within it, e.g. if the transfer stalls or the terminator is lost.
+	
+	The lines that follow the terminator can be read as well, so that the whole of a 
+	response is read, rather than leaving its last bytes to be read as the start of the 
+	next response.
+	
+	Parameters
+	----------
+	teensy : serial.Serial
+		serial connection to the Teensy
+	terminator : bytes
+		bytes that end the transfer
+	count : int, optional
+		number of times the terminator must be received, e.g. 2 to read two lines
+	max_bytes : int, optional
+		maximum number of bytes to read. Defaults to MAX_TRANSFER_BYTES.
+	lines_after : int, optional
+		number of line endings ("\n") that must be received after the last terminator, 
+		e.g. 1 to read to the end of the line the terminator is on
+	
+	Returns
+	-------
+	bytes
+		the bytes received, up to and including the terminator (and the lines after it). 
+		If the read timed out, these are the bytes received before the timeout.
+	"""
+	
+	if(max_bytes is None):
+		max_bytes = MAX_TRANSFER_BYTES
+	
+	# every terminator that must be received, in order
+	terminators = [terminator] * count + [b"\n"] * lines_after
+	
+	received = bytearray()
+	search_start = 0
+	found = 0
+	
+	while(len(received) < max_bytes):
+		
+		# wait (for at most the serial timeout) for the next byte, then take every byte 
+		# that has arrived
+		chunk = teensy.read(max(1, min(teensy.in_waiting, max_bytes - len(received))))
+		
+		if(len(chunk) == 0):
+			break
+		
+		received += chunk
+		
+		while(True):
+			index = received.find(terminators[found], search_start)
+			
+			if(index < 0):
+				# a terminator may be split across chunks
+				search_start = max(search_start, len(received) - len(terminators[found]) + 1)
+				break
+			
+			search_start = index + len(terminators[found])
+			found = found + 1
+			
+			if(found >= len(terminators)):
+				return bytes(received[:search_start])
+	
+	return bytes(received)
+
+
+def read_exactly(teensy, size):
+	"""Reads a given number of bytes from the serial port.
+	
+	Unlike serial.Serial.read, the serial timeout is applied to each chunk of bytes rather
+	than to the whole read, so a long transfer is not cut short while bytes are still 
+	arriving.
+	
+	Parameters
+	----------
+	teensy : serial.Serial
+		serial connection to the Teensy
+	size : int
+		number of bytes to read
+	
+	Returns
+	-------
+	bytes
+		the bytes received. Fewer than size bytes are returned if the read timed out.
+	"""
+	
+	received = bytearray()
+	
+	while(len(received) < size):
+		chunk = teensy.read(max(1, min(teensy.in_waiting, size - len(received))))
+		
+		if(len(chunk) == 0):
+			break
+		
+		received += chunk
+	
+	return bytes(received)
+
+
+def read_sonar_frame(teensy):
+	"""Reads a binary frame of sonar data from the serial port, and decodes it.
+	
+	The length of the frame is given in its header, so exactly as many bytes as are in 
+	the frame are read (see read_exactly), and this function returns as soon as the last 
+	byte arrives.
+	
+	Parameters
+	----------
+	teensy : serial.Serial
+		serial connection to the Teensy, after the 'F' or 'G' command has been written
+	
+	Returns
+	-------
+	dict
+		the sonar data - see decode_sonar_frame
+	
+	Raises
+	------
+	NoResponseError
+		If no bytes are received, e.g. because the firmware does not support binary 
+		transfers
+	TeensyError
+		If the frame is incomplete or not in the expected format
+	"""
+	
+	frame = bytearray(read_exactly(teensy, FRAME_PREFIX.size))
+	
+	if(len(frame) == 0):
+		raise NoResponseError("No response from Teensy: the firmware may not support binary transfers (set BINARY_TRANSFER = None or False)")
+	
+	if(len(frame) < FRAME_PREFIX.size):
+		raise TeensyError("Format from Teensy not recognised: incomplete binary frame")
+	
+	magic, header_length = FRAME_PREFIX.unpack_from(frame)
+	frame += read_exactly(teensy, header_length)
+	
+	if(len(frame) >= FRAME_PREFIX.size + FRAME_HEADER.size):
+		sample_rate, max_adc_code, num_channels, num_samples = FRAME_HEADER.unpack_from(frame, FRAME_PREFIX.size)
+		frame += read_exactly(teensy, num_channels * num_samples * FRAME_CODE_DTYPE.itemsize + FRAME_CHECKSUM.size)
+	
+	return decode_sonar_frame(frame)
+
+
+def decode_sonar_frame(frame):
+	"""Decodes a binary frame of sonar data.
+	
+	The frame is made up of the following fields, all of which are little-endian:
+	
+		magic            4 bytes     FRAME_MAGIC
+		header_length    uint16      number of bytes in the header that follows
+		header:
+			sample_rate  float64     sample rate of the ADC [Hz]
+			max_adc_code uint32      maximum adc code
+			num_channels uint16      number of receivers that follow
+			num_samples  uint32      number of samples from each receiver
+		codes            uint16      num_samples adc codes from receiver 0, followed by
+		                             receiver 1, and so on
+		checksum         uint32      sum of all the adc codes, modulo 2**32
+	
+	Fields added to the end of the header in future are skipped, as the length of the 
+	header is given. The adc codes are converted to voltages in a single operation, 
+	without copying the codes out of the frame.
+	
+	Parameters
+	----------
+	frame : bytes
+		the frame
+	
+	Returns
+	-------
+	dict
+		the sample rate, maximum adc code, and the recieve signal of each receiver (as a 
+		row of a single 2D array of voltages) - see request_sonar_data
+	
+	Raises
+	------
+	TeensyError
+		If the frame is incomplete, is not in the expected format, or its checksum does
+		not match
+	"""
+	
+	if(len(frame) < FRAME_PREFIX.size + FRAME_HEADER.size):
+		raise TeensyError("Format from Teensy not recognised: incomplete binary frame")
+	
+	magic, header_length = FRAME_PREFIX.unpack_from(frame)
+	
+	if(magic != FRAME_MAGIC or header_length < FRAME_HEADER.size):
+		raise TeensyError("Format from Teensy not recognised: binary frame does not start with {}".format(FRAME_MAGIC))
+	
+	sample_rate, max_adc_code, num_channels, num_samples = FRAME_HEADER.unpack_from(frame, FRAME_PREFIX.size)
+	
+	offset = FRAME_PREFIX.size + header_length
+	length = offset + num_channels * num_samples * FRAME_CODE_DTYPE.itemsize + FRAME_CHECKSUM.size
+	
+	if(len(frame) < length):
+		raise TeensyError("Format from Teensy not recognised: incomplete binary frame ({} of {} bytes received)".format(len(frame), length))
+	
+	codes = np.frombuffer(frame, dtype=FRAME_CODE_DTYPE, count=num_channels * num_samples, offset=offset).reshape(num_channels, num_samples)
+	checksum, = FRAME_CHECKSUM.unpack_from(frame, length - FRAME_CHECKSUM.size)
+	
+	if(int(codes.sum(dtype=np.uint64)) % 2**32 != checksum):
+		raise TeensyError("Format from Teensy not recognised: checksum of binary frame does not match")
+	
+	# convert adc codes into voltages - assumes teensy has 3.3V reference
+	voltages = codes * ADC_REFERENCE_VOLTAGE / (max_adc_code - 1)
+	
+	dict = {"sample_rate": sample_rate, "max_adc_code": float(max_adc_code)}
+	
+	for n in range(0, num_channels):
+		dict["buffer{}".format(n)] = voltages[n]
+	
+	return dict
+
+
+def parse_sonar_text(payload):
+	"""Parses sonar data in the ASCII format.
 	
 	The format of the sonar data returned from the Teensy is expected to be in the 
 	following format ('...' represents data that is not shown):
@@ -204,58 +873,35 @@ def request_sonar_data(short_timeout=False):
 	"end_buffer_transfer"
 	
 	Note that each of the sampled values is provided as an adc_code. These will be in the
-	range from 0 -> max_adc_code. A maximum of 1000000 bytes are read from the serial 
-	port. If less than 1000000 bytes are written by the Teensy, then the serial port will 
-	automatically close after timeout period.
+	range from 0 -> max_adc_code. 
+	
+	Rather than parsing each line in turn, the line that starts each buffer is located, 
+	and the adc codes that follow it are converted to numbers in a single operation, and
+	then to voltages in a single operation.
 	
 	Parameters
 	----------
-	short_timeout : bool, optional
-		if true sets serial timeout to SERIAL_TIMEOUT_SHORT, if false sets serial timeout 
-		to SERIAL_TIMEOUT_LONG. Use SERIAL_TIMEOUT_SHORT when receiving sonar data from
-		a single receiver (1D mode), and SERIAL_TIMEOUT_LONG when receiving sonar data 
-		from multiple receivers.
-		
+	payload : bytes
+		the bytes received from the Teensy
+	
 	Returns
 	-------
-	A dictionary containing the recived signal buffer for each sonar channel, as well as 
-	the sample rate. The dictionary might look as follows:
+	dict
+		the sample rate, maximum adc code, and the recieve signal of each receiver (as a 
+		numpy array of voltages) - see request_sonar_data
 	
-		{"sample_rate" : "104.12 kHz",
-		 "buffer0"     : [1.2, 1.1, 1.1,...],    
-		 "buffer1"     : [...],
-		 	...
-		 "buffer<n>"   : [...]}
-	
-	Note that each sample has been converted from its adc code to the voltage it 
-	represents. If Teensy is not connected, then an empty dictionary {} is returned.
-		
 	Raises
 	------
-	Teensy Error
-		If any errors occure during Teensy comms, including no Teensy connection or 
-		invalid format 
+	TeensyError
+		If the payload is not in the expected format
 	"""
-
+	
 	dict = {}
 	
 	try:
-		
-		# establish serial connection with teensy and send command to transmit chirp and 
-		# return sampled echos
-		if(short_timeout):
-			teensy = serial.Serial(TEENSY_DEVICE, BAUD_RATE, timeout = SERIAL_TIMEOUT_SHORT)
-			# command 'g' is send for short mode
-			teensy.write(str("g").encode())
-		else:
-			teensy = serial.Serial(TEENSY_DEVICE, BAUD_RATE, timeout = SERIAL_TIMEOUT_LONG)
-			# command 'f' is send for short mode
-			teensy.write(str("f").encode())
-		
-		
-		# retrieve data from Teensy
-		samples = teensy.read(10000000).decode('ascii').split("\n") # new line means new value
-		
+		# the first five lines are the header, and the remaining lines contain the buffers
+		lines = payload.split(b"\n", 5)
+		samples = [line.decode('ascii') for line in lines[:5]]
 		
 		if("sample_rate" not in samples[0]):
 			raise TeensyError("Format from Teensy not recognised: input does not contain string 'sample_rate' at index 0")
@@ -268,54 +914,57 @@ def request_sonar_data(short_timeout=False):
 		# maximum adc code - e.g. if 10bit ADC is used, max code is 2**10 = 1024. Used to 
 		# convert adc code into a voltage. 
 		max_adc_code = float(samples[3].replace("\r",""))
+		dict["max_adc_code"] = max_adc_code
 		
 		if("start_buffer_transfer" not in samples[4]):
 			raise TeensyError("Format from Teensy not recognised: input does not contain string 'start_buffer_transfer' at index 4")
 		
-		current_buffer = ""
-		counter = 5 # start iterations after 'start_buffer_transfer' at index 5
+		body = lines[5]
+		end = body.find(END_OF_TRANSFER)
+		
+		# if end is reached without receiving 'end_buffer_transfer' string, raise an error
+		if(end < 0):
+			raise TeensyError("Format from Teensy not recognised: input does not end with string 'end_buffer_transfer'")
 		
-		while(True):		
+		# keep only the lines before the 'end_buffer_transfer' line
+		body = body[:body.rfind(b"\n", 0, end) + 1]
+		
+		# locate the line that starts each buffer/channel, as (start of line, end of line, 
+		# key for dict)
+		markers = []
+		index = body.find(b"buffer")
+		
+		while(index >= 0):
+			line_start = body.rfind(b"\n", 0, index) + 1
+			line_end = body.find(b"\n", index) + 1
 			
+			markers.append((line_start, line_end, body[line_start:line_end].decode('ascii').strip()))
+			index = body.find(b"buffer", line_end)
+		
+		if(len(body) > 0 and (len(markers) == 0 or markers[0][0] > 0)):
+			raise TeensyError("Format from Teensy not recognised: adc codes received before string 'buffer0'")
+		
+		for n, (line_start, line_end, current_buffer) in enumerate(markers):
+			stop = markers[n + 1][0] if n + 1 < len(markers) else len(body)
+			block = body[line_end:stop]
 			
-			# if end is reached without receiving 'end_buffer_transfer' string, raise an error
-			if(counter>=len(samples)):
-				raise TeensyError("Format from Teensy not recognised: input does not end with string 'end_buffer_transfer'")
+			# every line of the block holds a single adc code. A value that is not a
+			# number (e.g. corrupted during transfer) raises a ValueError, and an empty 
+			# line, or a line holding more than one value, changes the number of codes.
+			adc_codes = block.split()
 			
-			# indicates end of sonar data	
-			elif("end_buffer_transfer" in samples[counter]):
-				break
+			if(len(adc_codes) != block.count(b"\n")):
+				raise TeensyError("Format from Teensy not recognised: {} does not contain one adc code per line".format(current_buffer))
 			
-			# indicates start of new buffer/channel 
-			elif("buffer" in samples[counter]):
-				# create key for current buffer for dict
-				current_buffer = samples[counter].replace("\r","") # remove \r
-				
-				dict[current_buffer] = []
-			else:
-				adc_code = int(samples[counter].replace("\r","")) # remove \r
-				
-				# convert adc code into voltage - assumes teensy has 3.3V reference
-				voltage = adc_code * 3.3 / (max_adc_code - 1)
-				
-				# append next sample to appropriate key in dict
-				dict[current_buffer].append(voltage) 
+			adc_codes = np.array(adc_codes, dtype=np.int64)
 			
-			counter=counter+1
-		
-
-	except (serial.serialutil.SerialException) as e1:
-		print("\tCould not connect to Teensy")
-		
-		# re-raise as TeensyError so it can be handled correctly above
-		raise TeensyError("Could not connect to Teensy")
+			# convert adc codes into voltages - assumes teensy has 3.3V reference
+			dict[current_buffer] = adc_codes * ADC_REFERENCE_VOLTAGE / (max_adc_code - 1)
 	
-	except TeensyError as e2:
-		print("\t",e2)
-		
-		# re-raise as TeensyError so it can be handled correctly above
-		raise TeensyError(e2.message)
-
+	except (ValueError, IndexError) as e:
+		# a value that is not a number (e.g. corrupted during transfer), or a transfer
+		# that stops before the header is complete
+		raise TeensyError("Format from Teensy not recognised: {}".format(e))
 	
 	return dict
 
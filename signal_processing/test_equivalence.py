@@ -0,0 +1,170 @@
+""" Checks that the optimised signal processing steps produce the same output as the
+implementations they replace.
+
+benchmark.py compares the same implementations, but also times them on large grids and
+takes minutes to run. These checks only compare the outputs, using the default grid, and
+are collected by pytest - run 'python3 -m pytest' from the repository root or from inside
+the signal_processing/ directory. Simulated data and the recorded receive signal are used,
+so no microcontroller needs to be connected.
+
+This script requires that the following libraries be installed within the Python
+environment you are running this script in:
+
+	numpy, pytest, sonar_processing, numba_kernels, benchmark
+
+This file contains the following functions:
+
+	* configure_sonar_processing - points sonar_processing at the recorded receive signal
+	and stops it recording, for every test
+	* recorded_samples - returns samples for each receiver and a matching context
+	* assert_equivalent - asserts that two outputs only differ by rounding error
+	* test_fused_processing - fused and stage-by-stage range profiles must match
+	* test_numba_kernels - each kernel must match the NumPy expression it replaces
+	* test_numba_backend - range profiles and images must not depend on USE_NUMBA
+
+"""
+
+# ===================================== IMPORTS ======================================== #
+
+import os
+import numpy as np
+import pytest
+import sonar_processing as sp
+import numba_kernels
+import benchmark
+
+
+# ================================= GLOBAL VARIABLES =================================== #
+
+# directory containing this script, so the recorded receive signal is found whichever
+# directory the tests are run from
+global DIRECTORY; DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# options of the ProcessingContext that the fused and stage-by-stage range profiles are
+# compared with
+global FUSED_OPTIONS; FUSED_OPTIONS = [{}, {"decimation": 10}, {"upsampling": 4}]
+
+# region of interest (min range, max range, min angle, max angle) that images are formed 
+# over when comparing the numba and numpy backends. The kernels run as Python functions 
+# if numba is not installed, so the region is kept small.
+global NUMBA_REGION; NUMBA_REGION = (2, 4, -10, 10)
+
+
+# =============================== FUNCTION DEFINITIONS ================================= #
+
+@pytest.fixture(autouse=True)
+def configure_sonar_processing(monkeypatch):
+	"""Points sonar_processing at the recorded receive signal in this directory, and stops
+	the receive signal of each ping being recorded. The global variables are restored
+	after each test.
+	"""
+
+	monkeypatch.setattr(sp, "RX_LOAD_FILEPATH", os.path.join(DIRECTORY, "receive_signal", "formatted_RX_signal.txt"))
+	monkeypatch.setattr(sp, "RECORD_RX", False)
+	monkeypatch.setattr(sp, "DEBUG_MODE_ACTIVE", False)
+
+
+def recorded_samples():
+	"""Returns samples for each receiver based on the recorded receive signal.
+
+	The same samples as benchmark.recorded_samples are returned, but the sample rate is
+	only changed in the returned context rather than in the global variables.
+
+	Returns
+	-------
+	numpy.ndarray
+		2D array containing the samples for each receiver
+	ProcessingContext
+		the global parameters, with the number of samples of the recorded receive signal
+	"""
+
+	recorded = np.loadtxt(sp.RX_LOAD_FILEPATH)
+
+	rng = np.random.RandomState(0)
+	samples = np.asarray([recorded + rng.normal(scale=0.01, size=len(recorded)) for reciever in sp.reciever_coords])
+
+	return samples, sp.global_context().with_sample_rate(sp.fs, len(recorded))
+
+
+def assert_equivalent(actual, expected, name):
+	"""Asserts that two outputs differ by no more than benchmark.EQUIVALENCE_TOLERANCE,
+	relative to the peak of the expected output.
+	"""
+
+	np.testing.assert_allclose(actual, expected, rtol=0, atol=benchmark.EQUIVALENCE_TOLERANCE * np.max(abs(expected)), err_msg="{} differ".format(name))
+
+
+@pytest.mark.parametrize("simulated", [True, False], ids=["simulated", "recorded"])
+@pytest.mark.parametrize("options", FUSED_OPTIONS, ids=lambda options: ",".join("{}={}".format(*item) for item in options.items()) or "default")
+def test_fused_processing(simulated, options):
+	"""Fused range profile processing must produce the same range profiles as applying each
+	step in turn (see benchmark.benchmark_fused_processing).
+	"""
+
+	if(simulated):
+		two_way_delays = benchmark.simulate_delays()
+		ctx = sp.global_context()
+	else:
+		samples, ctx = recorded_samples()
+
+	range_profiles = []
+
+	for fused in [False, True]:
+		fused_ctx = ctx.with_options(fused=fused, **options)
+
+		# the same noise is used for both methods
+		np.random.seed(0)
+
+		if(simulated):
+			range_profiles.append(sp.produce_range_profiles_batch_sim(two_way_delays, fused_ctx))
+		else:
+			range_profiles.append(sp.produce_range_profiles_batch(samples, fused_ctx))
+
+	assert_equivalent(range_profiles[1], range_profiles[0], "fused and stage-by-stage range profiles")
+
+
+def test_numba_kernels():
+	"""Each kernel in numba_kernels must produce the same output as the NumPy expression
+	given in its docstring.
+	"""
+
+	rng = np.random.RandomState(0)
+
+	num_recievers, num_samples, num_angles, num_ranges = 8, 64, 5, 7
+
+	xt = rng.normal(size=(num_recievers, num_samples)) + 1j*rng.normal(size=(num_recievers, num_samples))
+	index = rng.randint(0, num_samples, size=(num_recievers, num_angles, num_ranges)).astype(np.int64)
+	steering = np.exp(1j*rng.uniform(0, 2*np.pi, size=index.shape))
+
+	z = np.sum(xt[np.arange(num_recievers)[:, None, None], index] * steering, axis=0)
+	assert_equivalent(numba_kernels.coherent_sum(xt, index, steering, num_ranges - 2), z[:, :num_ranges - 2], "coherent_sum and numpy sums")
+
+	factors = np.exp(1j*rng.uniform(0, 2*np.pi, size=num_recievers)) * rng.uniform(0.5, 2, size=num_recievers)
+	assert_equivalent(numba_kernels.compensate(xt, 11, factors), np.roll(xt, 11, axis=-1) * factors[:, None], "compensate and numpy compensation")
+
+	factors = rng.uniform(0, 4, size=num_samples)
+	assert_equivalent(numba_kernels.scale_columns(xt, factors), xt * factors, "scale_columns and numpy scaling")
+
+
+def test_numba_backend(monkeypatch):
+	"""The range profiles and image formed from the recorded receive signal must be the 
+	same whether or not the kernels are used (see benchmark.benchmark_numba_backend).
+	"""
+
+	samples, ctx = recorded_samples()
+	ctx = ctx.with_options(fused=False).with_region(*NUMBA_REGION)
+
+	results = []
+
+	for numba in [False, True]:
+		monkeypatch.setattr(sp, "USE_NUMBA", numba)
+
+		range_profiles = sp.produce_range_profiles_batch(samples, ctx)
+		results.append((range_profiles, sp.coherent_summing(range_profiles, ctx)))
+
+	assert_equivalent(results[1][0], results[0][0], "numba and numpy range profiles")
+	assert_equivalent(results[1][1], results[0][1], "numba and numpy images")
+
+
+
+# ====================================== END =========================================== #
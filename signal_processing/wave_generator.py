@@ -8,7 +8,7 @@ directory.
 This script requires that the following libraries be installed within the Python 
 environment you are running this script in:
 
-	matplotlib, numpy, pyfftw
+	matplotlib, numpy, pyfftw, fftw_plans
 
 This file can also be imported to provide the following functions
 
@@ -23,7 +23,7 @@ import matplotlib;
 import random
 import matplotlib.pyplot as plt
 import numpy as np
-import pyfftw
+import fftw_plans
 import math
 import time
 
@@ -77,8 +77,7 @@ def make_chirp():
 	# convert to binary signal (0 or 1) by comparing cos to threshold signal
 	xt = np.less(ft,ct) 
 	
-	fft = pyfftw.builders.fft(xt) # compute fft
-	Xw = fft() 
+	Xw = fftw_plans.fft(xt) # compute fft
 	
 	# uncomment to show plot
 	#fig, (tplot, fplot) = plt.subplots(2, 1)
@@ -12,6 +12,7 @@
 *       void    readAllPinsOnce()
 *       void    sendAllBuffers()
 *       void    sendBuffer0()
+*       void    sendBuffersBinary(numChannels, sampleRate)
 *       void    clearBuffers()
 *       void    startDACtimer(microSecDelay)
 *       void    DAC_timerInterupt()
@@ -74,6 +75,11 @@ uint16_t              PIN7_BUFFER[10000];
 uint32_t              ARR_COUNTER        = 0; //counter to store the current number of samples in each buffer
 uint32_t              BUFFER_LIMIT       = 6200; //number of samples to read into buffers each time
 
+/* ---------------------------------- BINARY TRANSFER ------------------------------------- */
+
+const uint8_t         FRAME_MAGIC[4]     = {'S', 'N', 'R', '1'}; //marks the start of each binary frame
+const uint16_t        FRAME_HEADER_LENGTH = 18; //number of bytes in the header of each binary frame
+
 /* ----------------------------------- D/A CONVERTER -------------------------------------- */
 
 IntervalTimer         MY_TIMER; 
@@ -147,6 +153,8 @@ void setup(){
  * i - info mode: confirm micro is connected and send ADC sample rate on Serial
  * f - full op mode: transmit chirp, sample return on 8 channels, send ADC speed and 8 buffers on Serial
  * g - short op mode: transmit chirp, sample return on 8 channels, but only send ADC speed and buffer0 on Serial
+ * F - full op mode (binary): as for f, but send ADC speed and 8 buffers as a single binary frame on Serial
+ * G - short op mode (binary): as for g, but send ADC speed and buffer0 as a single binary frame on Serial
  * s - speed ADC: print ADC sample speed to Serial
  * t - speed DAC: print DAC sample speed to Serial
  * a <true value in mV> - accuracy ADC: print ADC accuracy measure to Serial. Enter as 'a <space> <voltage in mV>'
@@ -201,6 +209,18 @@ void loop() {
             Serial.print(micros()-starttime);
             Serial.println(" us");
             
+        } else if (c=='F' || c=='G'){
+            double sampleRate = ADC_speedTest();
+            clearBuffers();
+            
+            OUTPUT_COUNTER = 0;
+            startDACtimer(TIMER_DELAY);
+            
+            readAllPinsContinuous();
+            sendBuffersBinary(c=='F' ? 8 : 1, sampleRate);
+            
+            clearBuffers();
+            
         } else if(c=='s') { 
             Serial.println("ADC Speed test:");
             Serial.print(ADC_speedTest()/1000.0);
@@ -370,6 +390,55 @@ void sendBuffer0(){
 
 
 
+/*
+ * Function:  sendBuffersBinary 
+ * ---------------------------
+ * Sends the contents of the first numChannels buffers to Serial as a single binary frame. All fields are 
+ * little-endian (the native byte order of the Teensy). The format used is as follows:
+ * 
+ * magic          4 bytes   "SNR1"
+ * header_length  uint16    number of bytes in the header that follows (18)
+ * sample_rate    double    sample rate of the ADC in Hz
+ * max_adc_code   uint32    maximum ADC code
+ * num_channels   uint16    number of buffers that follow
+ * num_samples    uint32    number of samples in each buffer
+ * codes          uint16    num_samples ADC codes from buffer0, followed by buffer1, and so on
+ * checksum       uint32    sum of all the ADC codes, modulo 2^32
+ * 
+ * This is about a third of the size of the ASCII format, and each buffer is written directly from memory.
+ * 
+ * numChannels: number of buffers to send (1 to 8)
+ * sampleRate: sample rate of the ADC in Hz
+ */
+void sendBuffersBinary(uint16_t numChannels, double sampleRate){
+
+  uint16_t *buffers[8] = {PIN0_BUFFER, PIN1_BUFFER, PIN2_BUFFER, PIN3_BUFFER, 
+                          PIN4_BUFFER, PIN5_BUFFER, PIN6_BUFFER, PIN7_BUFFER};
+  uint16_t headerLength = FRAME_HEADER_LENGTH;
+  uint32_t maxAdcCode = 1<<ADC_RESOLUTION;
+  uint32_t numSamples = ARR_COUNTER;
+  uint32_t checksum = 0;
+
+  Serial.write(FRAME_MAGIC, 4);
+  Serial.write((uint8_t*)&headerLength, 2);
+  Serial.write((uint8_t*)&sampleRate, 8);
+  Serial.write((uint8_t*)&maxAdcCode, 4);
+  Serial.write((uint8_t*)&numChannels, 2);
+  Serial.write((uint8_t*)&numSamples, 4);
+
+  for(uint16_t n = 0; n < numChannels; n++){
+     Serial.write((uint8_t*)buffers[n], numSamples*2);
+     for(uint32_t i = 0; i < numSamples; i++){
+        checksum += buffers[n][i];
+     }
+  }
+
+  Serial.write((uint8_t*)&checksum, 4);
+  Serial.send_now();
+   
+}
+
+
 /*
  * Function:  clearBuffers 
  * -----------------------------
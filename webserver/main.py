@@ -6,8 +6,11 @@ requests are handled by this script:
 	* /						- returns web interface
 	* /sonar_image_1D.png	- returns 1D sonar image
 	* /sonar_image_2D.png	- returns 2D sonar image
+	* /sonar_image_2D_progressive	- streams 2D sonar images from coarse to fine
 	* /debug				- returns specified intermeidate debugging plot
 	* /micro_status			- returns the status of microcontroller
+	* /continuous_mode		- starts/stops continuous acquisition, and returns its status
+	* /sonar_image_2D_continuous.png	- returns latest 2D sonar image of continuous mode
 
 The web server can be started from the terminal by running 'python3 main.py'
 
@@ -17,7 +20,8 @@ network. This is configured in __main__.
 This script requires that the following libraries be installed within the Python 
 environment you are running this script in:
 
-	sonar_processing, teensy_interface, flask, matplotlib
+	sonar_processing, teensy_interface, fftw_plans, numba_kernels, acquisition, 
+	integration, flask, matplotlib
 	
  """
 
@@ -33,6 +37,10 @@ import sonar_processing as sp
 
 import teensy_interface
 from teensy_interface import TeensyError
+import fftw_plans
+import numba_kernels
+import acquisition
+import integration
 
 from flask import Flask, render_template, request
 from flask import jsonify
@@ -40,6 +48,7 @@ from flask import send_file
 from flask import Response
 
 import io
+import math
 import random
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from matplotlib.figure import Figure
@@ -49,16 +58,38 @@ app = Flask(__name__)
 
 # ================================= GLOBAL VARIABLES =================================== #
 
-# directory containing the intermediate debugging plots
-global DEBUG_DIR; DEBUG_DIR = "../signal_processing/debug/"
-
 # filepath of image to return in case of error
 global ERROR_IMAGE_FILEPATH; ERROR_IMAGE_FILEPATH = "static/images/micro_error.png"
 
+# effort used by FFTW when planning the FFTs at startup - plans are tuned once and then
+# reused for every request
+global FFTW_PLANNER_EFFORT; FFTW_PLANNER_EFFORT = "FFTW_MEASURE"
+
+# number of samples in each receive signal. The simulated signals use the default sample
+# rate in sonar_processing, while the Teensy captures 6200 samples per receiver.
+global FFT_SIGNAL_LENGTHS; FFT_SIGNAL_LENGTHS = [sp.N, 6200]
+
 
 
 
 # =============================== FUNCTION DEFINITIONS ================================= #
+
+def prepare_fft_plans():
+	""" Plans the FFTs used in signal processing before any requests are served.
+	
+	Previously saved FFTW wisdom is loaded first so that planning is fast, after which 
+	plans are created for a single receiver (1D mode) and all receivers (2D mode) for each
+	signal length in FFT_SIGNAL_LENGTHS. The updated wisdom is then saved for next time.
+	"""
+	
+	fftw_plans.set_planner_effort(FFTW_PLANNER_EFFORT)
+	fftw_plans.load_wisdom()
+	
+	num_recievers = len(sp.reciever_coords)
+	fftw_plans.warm_up([shape for n in FFT_SIGNAL_LENGTHS for shape in [(n,), (num_recievers, n)]])
+	
+	fftw_plans.save_wisdom()
+
     
 @app.route("/")
 def home():
@@ -81,30 +112,28 @@ def sonar_image_1D_process():
 
 
 	try:
-		#determine if in debug mode
+		#determine if in debug mode - each request uses its own processing context, so
+		#that concurrent requests do not change each other's settings
 		debug_mode = request.args.get('debug_mode')
-		if(debug_mode=="true"):
-			sp.set_debug_mode(True)
-		else:
-			sp.set_debug_mode(False)
+		ctx = sp.global_context().with_options(debug=(debug_mode=="true"))
 		
 		
 		#determine if in simulation mode (ie no micro)
 		sim_mode = request.args.get('sim_mode')
 		if(sim_mode=="true"):
 			# call 1D signal processing routine - a matplotlib figure will be returned
-			fig = sp.generate_1D_image_sim() 
+			fig = sp.generate_1D_image_sim(ctx)
 		else:
 			# call 1D signal processing routine - a matplotlib figure will be returned or 
 			# an error will be raised if there is a problem with the micro  
-			fig = sp.generate_1D_image() 
+			fig = sp.generate_1D_image(ctx)
 		
 		# convert matplotlib figure into png
 		output = io.BytesIO()
 		FigureCanvas(fig).print_png(output)
 		
 		# very important to close figure as not closed by automatically
-		plt.close()
+		plt.close(fig)
 	
 		return Response(output.getvalue(), mimetype='image/png')
 	
@@ -122,43 +151,199 @@ def sonar_image_2D_process():
 	Additional arguments can be passed in the URL request using the following format:
 		debug_mode=true/false	-	indicates if debug mode is active
 		sim_mode=true/false		-	indicates if simulation mode is active
+		range_min=<meters>		-	near edge of the region of interest
+		range_max=<meters>		-	far edge of the region of interest
+		azimuth_min=<degrees>	-	left edge of the region of interest
+		azimuth_max=<degrees>	-	right edge of the region of interest
+		density=<factor>		-	pixel density of the region of interest, relative to
+									the full image
+		integration=coherent/incoherent	-	integrates consecutive pings (requests)
+		window=<pings>			-	number of pings integrated (sliding window)
+		decay=<factor>			-	weight of previous pings (exponential moving average)
+	
+	Only the region of interest is imaged. Any bound that is not given defaults to the 
+	edge of the full field of view, and if no bounds are given the full field of view is
+	imaged. If integration is given, the image averages this ping with the previous pings 
+	requested with the same integration settings, using either window or decay (see 
+	integration). An invalid region or integration returns a 400 error.
 	
 	for example, the URL can look as follows:
 		/sonar_image_2D.png?sim_mode=false&debug_mode=false
+		/sonar_image_2D.png?sim_mode=true&range_min=2&range_max=4&azimuth_min=-10&azimuth_max=10&density=2
+		/sonar_image_2D.png?sim_mode=false&integration=incoherent&window=8
 		
 	"""
 	
 	try:
-		#determine if in debug mode
+		#determine if in debug mode - each request uses its own processing context, so
+		#that concurrent requests do not change each other's settings
 		debug_mode = request.args.get('debug_mode')
-		if(debug_mode=="true"):
-			sp.set_debug_mode(True)
-		else:
-			sp.set_debug_mode(False)
+		ctx = sp.global_context().with_options(debug=(debug_mode=="true"))
+		
+		#determine the region of interest - bounds that are not given default to the full
+		#field of view
+		region, density = request_region_of_interest()
 		
 		#determine if in simulation mode (ie no micro)
 		sim_mode = request.args.get('sim_mode')
+		
+		#determine if consecutive pings are integrated
+		integrator = request_integrator(sim_mode=="true")
+		
 		if(sim_mode=="true"):
 			# call 2D signal processing routine - a matplotlib figure will be returned
-			fig = sp.generate_2D_image_sim()
+			fig = sp.generate_2D_image_sim(ctx, region, density, integrator)
 		else:
 			# call 2D signal processing routine - a matplotlib figure will be returned or 
 			# an error will be raised if there is a problem with the micro  
-			fig = sp.generate_2D_image() 
+			fig = sp.generate_2D_image(ctx, region, density, integrator)
 		
-		# convert matplotlib figure into png
+		# convert matplotlib figure into png - the figure is not managed by pyplot (see 
+		# sp.plot_2D_image), so it does not need to be closed
 		output = io.BytesIO()
 		FigureCanvas(fig).print_png(output)
 		
-		# very important to close figure as not closed automatically
-		plt.close()
-		
 		return Response(output.getvalue(), mimetype='image/png')
 	
 	except TeensyError:
 		# an error will be raised if there is a problem with the micro - send placeholder
 		# error image
 		return send_file(ERROR_IMAGE_FILEPATH, mimetype='image/gif')
+	
+	except ValueError as e:
+		# the region of interest is not valid
+		return Response(str(e), status=400, mimetype='text/plain')
+
+
+@app.route('/sonar_image_2D_progressive')
+def sonar_image_2D_progressive_process():
+	""" Streams 2D sonar png images from coarse to fine
+	
+	The image is beamformed on a coarse grid first, which is sent as soon as it is ready, 
+	and is then refined around the echoes (see sp.generate_2D_image_progressive). Each 
+	image is sent as a frame of a multipart/x-mixed-replace response, so that the browser
+	replaces the previous image as each frame arrives, e.g. <img src="/sonar_image_2D_progressive">
+	
+	The same arguments as /sonar_image_2D.png can be passed in the URL request, for 
+	example, the URL can look as follows:
+		/sonar_image_2D_progressive?sim_mode=true&range_min=2&range_max=4
+		
+	"""
+	
+	try:
+		#determine if in debug mode - each request uses its own processing context, so
+		#that concurrent requests do not change each other's settings
+		debug_mode = request.args.get('debug_mode')
+		ctx = sp.global_context().with_options(debug=(debug_mode=="true"))
+		
+		#determine the region of interest - bounds that are not given default to the full
+		#field of view
+		region, density = request_region_of_interest()
+		
+		#determine if in simulation mode (ie no micro)
+		sim_mode = request.args.get('sim_mode')
+		figures = sp.generate_2D_image_progressive(ctx, sim_mode=="true", region, density)
+		
+		# the first (coarse) image is produced before the response is started, so that 
+		# errors from the micro or an invalid region can still be reported
+		first = next(figures)
+	
+	except TeensyError:
+		# an error will be raised if there is a problem with the micro - send placeholder
+		# error image
+		return send_file(ERROR_IMAGE_FILEPATH, mimetype='image/gif')
+	
+	except ValueError as e:
+		# the region of interest is not valid
+		return Response(str(e), status=400, mimetype='text/plain')
+	
+	def frames():
+		fig = first
+		while(fig is not None):
+			# convert matplotlib figure into png - the figure is not managed by pyplot 
+			# (see sp.plot_2D_image), so it does not need to be closed
+			output = io.BytesIO()
+			FigureCanvas(fig).print_png(output)
+			
+			yield b"--frame\r\nContent-Type: image/png\r\n\r\n" + output.getvalue() + b"\r\n"
+			
+			fig = next(figures, None)
+	
+	return Response(frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+def request_region_of_interest():
+	""" Returns the region of interest and density given in the URL request
+	
+	Any bound of the region that is not given defaults to the edge of the full field of 
+	view. If no bounds are given, the region is None (the full field of view).
+	
+	Returns
+	-------
+	tuple
+		(range_min, range_max, azimuth_min, azimuth_max) or None
+	float
+		pixel density of the region of interest
+	
+	Raises
+	------
+	ValueError
+		If a bound or the density is not a finite number
+	"""
+	
+	bounds = [request.args.get(arg) for arg in ["range_min", "range_max", "azimuth_min", "azimuth_max"]]
+	defaults = [0, sp.r_max, -sp.FIELD_OF_VIEW, sp.FIELD_OF_VIEW]
+	
+	region = None
+	if(any(bound is not None for bound in bounds)):
+		region = tuple(default if bound is None else float(bound) for bound, default in zip(bounds, defaults))
+	
+	density = float(request.args.get('density', 1))
+	
+	if(not all(math.isfinite(value) for value in (region or ()) + (density,))):
+		raise ValueError("Region of interest and density must be finite numbers")
+	
+	return region, density
+
+
+def request_integrator(sim_mode):
+	""" Returns the integrator for the integration settings given in the URL request
+	
+	The same integrator is returned for every request with the same settings (see 
+	integration.get_integrator), so that its running average carries over from one 
+	request to the next. Simulated and real pings are never integrated together.
+	
+	Parameters
+	----------
+	sim_mode : bool
+		indicates if simulation mode is active
+	
+	Returns
+	-------
+	integration.PingIntegrator
+		the integrator, or None if no integration is given
+	
+	Raises
+	------
+	ValueError
+		If the integration settings are not valid
+	"""
+	
+	mode = request.values.get('integration')
+	
+	if(mode is None):
+		return None
+	
+	window = request.values.get('window')
+	decay = request.values.get('decay')
+	
+	if(window is not None):
+		window = int(window)
+	
+	if(decay is not None):
+		decay = float(decay)
+	
+	return integration.get_integrator(mode, window, decay, "sim" if sim_mode else "teensy")
 
 
 @app.route('/debug')
@@ -181,6 +366,10 @@ def debug_image_process():
 	where x corresponds to the receiver that the intermediate plot belongs to. The first 
 	receiver is labeled 0.
 	
+	The intermediate plots are captured by the most recent request in debug mode, but are
+	only rendered when requested here (see sp.debug_plot_png). A 404 error is returned if 
+	the plot has not been captured.
+	
 	for example, the URL can look as follows:
 		/debug/plotname=3_1_chirp.png
 		
@@ -189,10 +378,14 @@ def debug_image_process():
 	# extract the name of the intermediate plot
 	plotname = request.args.get('plotname')
 	
-	filepath = DEBUG_DIR+plotname
+	# render the requested intermediate plot, or reuse it if already rendered
+	png = sp.debug_plot_png(plotname)
+	
+	if(png is None):
+		return Response("debug plot {} not found".format(plotname), status=404, mimetype='text/plain')
 	
 	# send the requested intermediate plot
-	return send_file(filepath, mimetype='image/gif')
+	return Response(png, mimetype='image/png')
 
 
 @app.route("/micro_status", methods=['POST'])
@@ -206,11 +399,94 @@ def micro_status_process():
 		return jsonify(reply)
 
 
+@app.route("/continuous_mode", methods=['GET', 'POST'])
+def continuous_mode_process():
+	""" Starts or stops continuous acquisition, and returns its status as a json object
+	
+	In continuous mode, pings are acquired and processed in the background (see 
+	acquisition), and the latest image is returned by /sonar_image_2D_continuous.png. A 
+	GET request only returns the status. A POST request accepts the following arguments:
+		action=start/stop		-	starts (or restarts) or stops continuous acquisition
+		sim_mode=true/false		-	indicates if simulation mode is active
+		debug_mode=true/false	-	indicates if debug mode is active
+		queue_depth=<pings>		-	maximum number of pings waiting to be processed
+		integration, window, decay	-	integrates consecutive pings, see 
+									/sonar_image_2D.png
+	
+	The status includes the queue depth, the number of pings dropped as the queue was 
+	full, and the frames per second achieved (see acquisition.acquisition_stats).
+	"""
+	
+	if(request.method == 'GET'):
+		return jsonify(acquisition.acquisition_stats())
+	
+	action = request.values.get('action')
+	
+	try:
+		if(action == "start"):
+			#each acquisition uses its own processing context
+			debug_mode = request.values.get('debug_mode')
+			ctx = sp.global_context().with_options(debug=(debug_mode=="true"))
+			
+			queue_depth = request.values.get('queue_depth')
+			if(queue_depth is not None):
+				queue_depth = int(queue_depth)
+			
+			sim_mode = request.values.get('sim_mode')=="true"
+			
+			reply = acquisition.start_acquisition(ctx, sim_mode, queue_depth, request_integrator(sim_mode))
+		
+		elif(action == "stop"):
+			reply = acquisition.stop_acquisition()
+		
+		else:
+			raise ValueError("action must be 'start' or 'stop'")
+	
+	except ValueError as e:
+		# the arguments are not valid
+		return Response(str(e), status=400, mimetype='text/plain')
+	
+	#return json object
+	return jsonify(reply)
+
+
+@app.route('/sonar_image_2D_continuous.png')
+def sonar_image_2D_continuous_process():
+	""" Returns the latest 2D sonar png image produced by continuous acquisition
+	
+	No signal processing is done for this request - the latest image is only rendered. 
+	The age of the image (seconds since its ping was acquired) is returned in the 
+	X-Frame-Age header. If continuous acquisition is not running, or has not yet 
+	produced an image, a 503 error is returned.
+	"""
+	
+	frame = acquisition.latest_frame()
+	
+	if(frame is None):
+		return Response("no image available - start continuous mode using /continuous_mode", status=503, mimetype='text/plain')
+	
+	z, ctx, age = frame
+	
+	fig = sp.plot_2D_image(z, ctx)
+	
+	# convert matplotlib figure into png - the figure is not managed by pyplot (see 
+	# sp.plot_2D_image), so it does not need to be closed
+	output = io.BytesIO()
+	FigureCanvas(fig).print_png(output)
+	
+	return Response(output.getvalue(), mimetype='image/png', headers={"X-Frame-Age": "{:.3f}".format(age)})
+
+
 
 # ====================================== MAIN ========================================== #
 
 if __name__ == "__main__":
 	
+    prepare_fft_plans()
+    
+    # compile the numba kernels (if numba is installed) before any requests are served
+    numba_kernels.warm_up()
+	
 	#to run on local machine - uncomment the following line
     app.run(debug=True)
     